@@ -0,0 +1,221 @@
+'''
+AGREEMENTS
+'''
+import os
+import threading
+from itertools import product
+
+from async_data import DATA_TIMEOUT_MS, data_loop, find, find_many
+from cache import TTLCache
+
+
+# Process-wide articulation agreement cache
+    # Keyed on (current_school, transfer_school, major), agreements only change about once a term
+    # so every rerun, Step click and Loop turn after the first is served from memory
+AGREEMENT_CACHE_TTL = float(os.getenv("AGREEMENT_CACHE_TTL", 24 * 60 * 60))
+AGREEMENT_CACHE_SIZE = int(os.getenv("AGREEMENT_CACHE_SIZE", 512))
+agreement_cache = TTLCache(maxsize=AGREEMENT_CACHE_SIZE, ttl=AGREEMENT_CACHE_TTL)
+
+# Agreement generation, bumped whenever this process sees agreements or their compiled tables change
+    # (ingest.py, articulation.compile_agreements, a replica sync, invalidate_articulation_agreements)
+    # part of the transfer plan key so a stored plan is rebuilt without fetching the agreement first
+_generation = 0
+_generation_lock = threading.Lock()
+
+# Projection shared by every articulation agreement query
+AGREEMENT_PROJECTION = {
+    "transfer_school": True,
+    "current_school": True,
+    "major": True,
+    "agreement": True
+}
+
+
+def format_agreements(results, current_school, pairs):
+    """
+    -Groups raw agreement documents back into per (transfer_school, major) entries.
+    -Pairs with no matching document get the "No agreement for ..." placeholder.
+
+    Args:
+        results (iterable[dict]): Agreement documents returned by the database.
+        current_school (str): A Students current school.
+        pairs (list[tuple[str, str]]): (transfer_school, major) combinations that were queried.
+
+    Returns:
+        dict{tuple : list[dict{str : str}]}: Agreement entries for every requested pair.
+    """
+    grouped = {pair: [] for pair in pairs}
+    for result in results:
+        pair = (result.get('transfer_school'), result.get('major'))
+        # $in queries over schools and majors can return combinations nobody asked for
+        if pair not in grouped:
+            continue
+        text = result.get('agreement', 'No description available')
+        grouped[pair].append({
+            text: f"{result['current_school']} to {result['transfer_school']} for {result['major']}"
+        })
+
+    for (transfer_school, major_item), entries in grouped.items():
+        # If no results were found
+        if not entries:
+            entries.append({
+                f"No agreement for {transfer_school}": f"{current_school} with major {major_item}"
+            })
+    return grouped
+
+
+def agreement_pairs(transfer_school, major):
+    # Every (transfer_school, major) combination, in order, without repeats
+    transfer_school_list = transfer_school if isinstance(transfer_school, list) else [transfer_school]
+    major_list = major if isinstance(major, list) else [major]
+    return list(dict.fromkeys(product(transfer_school_list, major_list)))
+
+
+def agreement_query(current_school, pairs):
+    # One $in query over every requested school and major, order preserving de-duplication for the $in lists
+    return {
+        "$and": [
+            {"transfer_school": {"$in": list(dict.fromkeys(pair[0] for pair in pairs))}},
+            {"current_school": current_school},
+            {"major": {"$in": list(dict.fromkeys(pair[1] for pair in pairs))}}
+        ]
+    }
+
+
+def agreement_error(current_school, pair, error):
+    # Handle query exceptions
+    transfer_school, major_item = pair
+    return {
+        "Error querying articulation agreements":
+        f"Query failed for {transfer_school} to {current_school} with major {major_item}: {error}"
+    }
+
+
+async def fetch_agreements(current_school, pairs, batched=True, timeout_ms=DATA_TIMEOUT_MS):
+    """
+    -Fetches articulation agreements for several (transfer_school, major) pairs.
+    -Batched mode sends a single $in query over every requested school and major so latency
+        -stays flat as students add transfer schools, instead of one round-trip per pair.
+    -Otherwise one query per pair, all in flight at once, so latency is the slowest pair, not the sum.
+    -Failed pairs are returned as error entries rather than raised.
+
+    Args:
+        current_school (str): A Students current school.
+        pairs (list[tuple[str, str]]): (transfer_school, major) combinations to fetch.
+        batched (bool): Use one $in query (True) or one query per pair (False).
+        timeout_ms (int): Per-query timeout.
+
+    Returns:
+        tuple(dict, set): Agreement entries per pair, and the pairs whose query failed.
+    """
+    if not pairs:
+        return {}, set()
+
+    if batched:
+        try:
+            results = await find("ARTICULATION_AGREEMENTS", agreement_query(current_school, pairs), function="get_articulation_agreement",
+                                 timeout_ms=timeout_ms, projection=AGREEMENT_PROJECTION)
+            return format_agreements(results, current_school, pairs), set()
+        except Exception as error:
+            return {pair: [agreement_error(current_school, pair, error)] for pair in pairs}, set(pairs)
+
+    queries = [("ARTICULATION_AGREEMENTS",
+                {"$and": [{"transfer_school": transfer_school}, {"current_school": current_school}, {"major": major_item}]},
+                {"projection": AGREEMENT_PROJECTION, "function": "get_articulation_agreement"})
+               for transfer_school, major_item in pairs]
+    grouped, failed = {}, set()
+    for pair, results in zip(pairs, await find_many(queries, timeout_ms=timeout_ms)):
+        if isinstance(results, Exception):
+            grouped[pair] = [agreement_error(current_school, pair, results)]
+            failed.add(pair)
+        else:
+            grouped.update(format_agreements(results, current_school, [pair]))
+    return grouped, failed
+
+
+async def get_articulation_agreement(current_school, transfer_school, major, use_cache=True, batched=True, timeout_ms=DATA_TIMEOUT_MS):
+    """
+    -The one agreement lookup: functions.get_articulation_agreement runs it on the shared loop,
+        -prefetch_articulation_agreement starts it without waiting.
+    -Each (current_school, transfer_school, major) result is held in `agreement_cache`,
+        -failed queries are never cached so the next call retries the database.
+
+    Args:
+        current_school (str): A Students current school.
+        transfer_school (str | list[str]): A Student's desired transfer school(s).
+        major (str | list[str]): A student's desired major(s).
+        use_cache (bool): Set False to skip the cache and always query the database.
+        batched (bool): Set False to fall back to one query per (transfer_school, major) pair.
+        timeout_ms (int): Per-query timeout.
+
+    Returns:
+        list[dict{str : str}]: Agreement entries in the order of the requested combinations.
+    """
+    pairs = agreement_pairs(transfer_school, major)
+
+    # Serve what we can from cache, remember the rest for a single database trip
+    found = {}
+    for pair in pairs:
+        cached = agreement_cache.get((current_school, *pair)) if use_cache else None
+        if cached is not None:
+            found[pair] = cached
+    missing = [pair for pair in pairs if pair not in found]
+
+    fetched, failed = await fetch_agreements(current_school, missing, batched=batched, timeout_ms=timeout_ms)
+    for pair, entries in fetched.items():
+        if pair not in failed:
+            agreement_cache.set((current_school, *pair), entries)
+    found.update(fetched)
+
+    # copies keep callers from mutating cached entries
+    return [dict(entry) for pair in pairs for entry in found[pair]]
+
+
+def prefetch_articulation_agreement(current_school, transfer_school, major):
+    """
+    -Starts the agreement lookup on the shared loop and returns at once, so the caller can start
+        -model work (e.g. conversation summarization) while the query is in flight.
+
+    Returns:
+        concurrent.futures.Future: Resolves to the get_articulation_agreement result.
+    """
+    return data_loop.submit(get_articulation_agreement(current_school, transfer_school, major))
+
+
+def agreement_generation():
+    """
+    Returns:
+        int: Current agreement generation, changes after every agreement invalidation.
+    """
+    return _generation
+
+
+def bump_agreement_generation():
+    """
+    Marks agreements as changed, e.g. after their articulation tables were recompiled.
+    """
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+
+def invalidate_articulation_agreements(current_school=None, transfer_school=None, major=None):
+    """
+    -Drops cached articulation agreements so the next lookup goes back to the database.
+    -Any argument left as None matches every value, so calling with no arguments clears the whole cache.
+    -Bumps the agreement generation, so stored transfer plans are rebuilt.
+
+    Args:
+        current_school (str): Only drop agreements from this school.
+        transfer_school (str): Only drop agreements to this school.
+        major (str): Only drop agreements for this major.
+
+    Returns:
+        int: Number of cached agreements removed.
+    """
+    def matches(key):
+        return all(want is None or want == have
+                   for want, have in zip((current_school, transfer_school, major), key))
+
+    bump_agreement_generation()
+    return agreement_cache.invalidate(predicate=matches)
@@ -0,0 +1,515 @@
+'''
+ARTICULATION
+'''
+import argparse
+import re
+import threading
+import time
+
+from pydantic import BaseModel
+
+from catalog import normalize_code
+from clients import get_collection
+from agreements import bump_agreement_generation
+from functions import CourseData, FinalEdPlan
+from tracing import traced_find
+
+
+# Receiving (UC) course codes such as "CSE 022", "PHYS 008L", "ENGR 80"
+RECEIVING_CODE_PATTERN = re.compile(r"\b([A-Z]{2,5})\s*-?\s*(\d{1,3}[A-Z]{0,2})\b")
+# A bare course number after "&", e.g. the "008L" in "PHYS 008 & 008L"
+BARE_NUMBER_PATTERN = re.compile(r"^\s*(\d{1,3}[A-Z]{0,2})\b")
+# Separators between courses in a combined entry ("&", "+", ",", "and"), "/" and "or" mean alternatives and are kept
+COMBINED_SEPARATOR = re.compile(r"\s*(?:&|\+|,|\band\b)\s*")
+TITLE_SEPARATOR = re.compile(r"\s*[&+]\s*")
+
+# Agreement rows read "receiving course <- sending course(s)", each side "CODE - Title (units)"
+AGREEMENT_ROW_PATTERN = re.compile(r"^(?P<receiving>.+?)\s*(?:<-|\u2190)\s*(?P<sending>.+)$")
+AGREEMENT_COURSE_PATTERN = re.compile(
+    r"^\s*(?P<code>[A-Z]{2,5}\s*-?\s*\d{1,3}[A-Z]{0,2})\s*(?:-\s*(?P<title>.*?))?\s*(?:\((?P<units>\d+(?:\.\d+)?)\))?\s*$")
+ALTERNATIVE_SEPARATOR = re.compile(r"\s+OR\s+")
+CONJUNCTION_SEPARATOR = re.compile(r"\s+AND\s+")
+
+# Bumped whenever parse_agreement changes, stored tables from an older parser are re-parsed on read
+ARTICULATION_TABLE_VERSION = 1
+
+
+class ArticulationRules(BaseModel):
+    """
+    Major preparation requirements parsed out of a transfer logic text.
+
+    required: groups of receiving courses, every course in a group is needed (e.g. ["PHYS 008", "PHYS 008L"])
+    recommended: receiving courses that are recommended but not required
+    """
+    required: list[list[str]]
+    recommended: list[str]
+
+    def required_codes(self):
+        return {normalize_code(code) for group in self.required for code in group}
+
+    def recommended_only_codes(self):
+        return {normalize_code(code) for code in self.recommended} - self.required_codes()
+
+
+def split_courses(text):
+    """
+    -Splits a combined course entry into its individual course codes.
+    -Bare numbers inherit the previous subject, so "PHYS 008 & 008L" gives ["PHYS 008", "PHYS 008L"].
+
+    Args:
+        text (str): Course entry, e.g. "MATH 021 & MATH 022" or "CSE 022".
+
+    Returns:
+        list[str]: Course codes found, in order.
+    """
+    codes, prefix = [], None
+    for part in COMBINED_SEPARATOR.split(text or ""):
+        found = RECEIVING_CODE_PATTERN.findall(part)
+        if found:
+            for subject, number in found:
+                codes.append(f"{subject} {number}")
+                prefix = subject
+        elif prefix is not None:
+            bare = BARE_NUMBER_PATTERN.match(part)
+            if bare:
+                codes.append(f"{prefix} {bare.group(1)}")
+    return codes
+
+
+def _section(text, start, end_markers):
+    begin = text.find(start)
+    if begin < 0:
+        return ""
+    begin += len(start)
+    ends = [text.find(marker, begin) for marker in end_markers]
+    ends = [index for index in ends if index >= 0]
+    return text[begin:min(ends)] if ends else text[begin:]
+
+
+def parse_transfer_logic(transfer_logic):
+    """
+    -Turns the free text major preparation requirements (e.g. functions.MAJOR_TRANSFER_LOGIC) into data.
+    -"REQUIRED major preparation courses:" up to the recommended section gives the required groups,
+        -courses joined with "&" form one group (a lecture and its lab).
+    -"Recommended Prior to Transfer:" up to the AP exemptions gives the recommended list.
+
+    Args:
+        transfer_logic (str): Transfer requirement text.
+
+    Returns:
+        ArticulationRules: Parsed requirements.
+    """
+    required_text = _section(transfer_logic, "REQUIRED major preparation courses:", ["Additional Major Preparation", "Recommended"])
+    recommended_text = _section(transfer_logic, "Recommended Prior to Transfer:", ["*Dual Counting", "AP Exam"])
+
+    required, seen = [], set()
+    # Split on course boundaries that are not joined by "&"
+    for chunk in re.split(r"(?<![&\s])\s+(?=[A-Z]{2,5}\s+\d)|,", required_text):
+        group = [code for code in split_courses(chunk) if normalize_code(code) not in seen]
+        if group:
+            seen.update(normalize_code(code) for code in group)
+            required.append(group)
+
+    recommended = list(dict.fromkeys(split_courses(recommended_text.replace("*", ""))))
+    return ArticulationRules(required=required, recommended=recommended)
+
+
+def _split_entry(course):
+    """
+    -Splits a CourseData row whose sending side lists several courses into one row per course.
+    -Receiving courses and titles are paired up when the counts match.
+    -Per course units are not known here, the first course keeps the combined units (and the combined title
+        -when titles do not pair up) so totals stay right, complete_plan fills the rest in from the agreement table.
+    """
+    sending = split_courses(course.sending_Institution_course)
+    if len(sending) < 2:
+        return [course]
+    receiving = split_courses(course.receiving_Institution_course)
+    # Titles only split on "&" / "+", "and" is part of titles like "Electricity and Magnetism"
+    titles = TITLE_SEPARATOR.split(course.sending_Institution_course_title)
+    if len(titles) != len(sending):
+        titles = [course.sending_Institution_course_title] + [""] * (len(sending) - 1)
+    return [
+        CourseData(
+            sending_Institution_course=code,
+            sending_Institution_course_title=titles[index],
+            units=course.units if index == 0 else 0.0,
+            receiving_Institution_course=receiving[index] if len(receiving) == len(sending) else course.receiving_Institution_course,
+        )
+        for index, code in enumerate(sending)
+    ]
+
+
+def finalize_plan(ed_plan, rules, completed_courses=()):
+    """
+    -Deterministic replacement for the transferAgentCheck + scheduleGlue LLM passes:
+        -combined entries are split into individual courses
+        -courses that only articulate to recommended (not required) courses are removed
+        -courses the student already completed are removed
+        -duplicate courses are removed, the first occurrence is kept
+
+    Args:
+        ed_plan (EdPlan): Major plan from transferAgent2.
+        rules (ArticulationRules): Parsed major preparation requirements.
+        completed_courses (list[str]): Sending course codes the student has completed.
+
+    Returns:
+        FinalEdPlan: Cleaned plan with every dropped row listed in `removed`.
+    """
+    recommended_only = rules.recommended_only_codes()
+    completed = {normalize_code(code) for code in completed_courses if code}
+    completed.update(normalize_code(course.sending_Institution_course) for course in ed_plan.completed_courses)
+
+    kept, removed, seen = [], [], set()
+    for entry in ed_plan.education_plan:
+        for course in _split_entry(entry):
+            code = normalize_code(course.sending_Institution_course)
+            receiving = {normalize_code(c) for c in split_courses(course.receiving_Institution_course)}
+            if receiving and receiving <= recommended_only:
+                removed.append(course)
+            elif code in completed or code in seen:
+                removed.append(course)
+            else:
+                seen.add(code)
+                kept.append(course)
+
+    return FinalEdPlan(education_plan=kept, total_units=sum(course.units for course in kept), removed=removed)
+
+
+def missing_requirements(final_plan, completed_courses, rules, completed_codes=(), table=None):
+    """
+    -A requirement counts as met when the plan, the model's completed rows or the courses the student
+        -entered as completed cover it.
+
+    Args:
+        final_plan (FinalEdPlan): Plan from finalize_plan.
+        completed_courses (list[CourseData]): Completed course rows (EdPlan.completed_courses).
+        rules (ArticulationRules): Parsed major preparation requirements.
+        completed_codes (list[str]): Sending course codes the student entered as completed.
+        table (ArticulationTable): Agreement table, maps completed_codes to the receiving courses they satisfy.
+
+    Returns:
+        list[list[str]]: Required groups with at least one course not covered by the plan or completed courses.
+    """
+    completed = {normalize_code(code) for code in completed_codes if code}
+    # Plan rows finalize_plan dropped because the student completed them still cover their receiving courses
+    rows = list(final_plan.education_plan) + list(completed_courses)
+    rows += [course for course in final_plan.removed if normalize_code(course.sending_Institution_course) in completed]
+    covered = set() if table is None else table.satisfied(completed)
+    for course in rows:
+        covered.update(normalize_code(code) for code in split_courses(course.receiving_Institution_course))
+    return [group for group in rules.required if not {normalize_code(code) for code in group} <= covered]
+
+
+class ArticulationRow(BaseModel):
+    """
+    One sending -> receiving course equivalence from an agreement.
+
+    sending_course: sending course code, several joined with " & " when all of them are needed
+    requirement: "required", "recommended" or "elective" for the receiving course (from ArticulationRules)
+    articulated: False when the agreement lists no sending course
+    """
+    sending_course: str
+    sending_title: str
+    units: float
+    receiving_course: str
+    receiving_title: str
+    requirement: str
+    articulated: bool
+
+    def course_data(self):
+        return CourseData(sending_Institution_course=self.sending_course, sending_Institution_course_title=self.sending_title,
+                          units=self.units, receiving_Institution_course=self.receiving_course)
+
+
+def _parse_course(text):
+    # (code, title, units) of one "CODE - Title (units)" course, None if the text is not course shaped
+    match = AGREEMENT_COURSE_PATTERN.match(text)
+    if match is None:
+        return None
+    code = re.sub(r"\s*-?\s*(\d)", r" \1", match.group("code"), count=1)
+    return code, (match.group("title") or "").strip(), float(match.group("units") or 0)
+
+
+def _requirement(receiving_code, rules):
+    if rules is None:
+        return "elective"
+    code = normalize_code(receiving_code)
+    if code in rules.required_codes():
+        return "required"
+    if code in {normalize_code(course) for course in rules.recommended}:
+        return "recommended"
+    return "elective"
+
+
+def parse_agreement(text, rules=None):
+    """
+    -Parses an agreement's free text into equivalence rows, once, at ingestion.
+    -"A OR B" on the sending side gives one row per alternative, "A AND B" one row needing both.
+    -Notes and other lines that are not "receiving <- sending" rows are skipped.
+
+    Args:
+        text (str): Agreement text from ARTICULATION_AGREEMENTS.
+        rules (ArticulationRules): Major requirements used to flag rows required / recommended.
+
+    Returns:
+        list[ArticulationRow]: Rows in agreement order.
+    """
+    rows = []
+    for line in str(text or "").splitlines():
+        match = AGREEMENT_ROW_PATTERN.match(line.strip())
+        receiving = _parse_course(match.group("receiving")) if match else None
+        if receiving is None:
+            continue
+        receiving_code, receiving_title, receiving_units = receiving
+        requirement = _requirement(receiving_code, rules)
+        alternatives = [[_parse_course(part) for part in CONJUNCTION_SEPARATOR.split(option)]
+                        for option in ALTERNATIVE_SEPARATOR.split(match.group("sending"))]
+        alternatives = [courses for courses in alternatives if courses and all(courses)]
+        if not alternatives:
+            rows.append(ArticulationRow(sending_course="", sending_title="", units=receiving_units,
+                                        receiving_course=receiving_code, receiving_title=receiving_title,
+                                        requirement=requirement, articulated=False))
+            continue
+        for courses in alternatives:
+            rows.append(ArticulationRow(
+                sending_course=" & ".join(code for code, _, _ in courses),
+                sending_title=" & ".join(title for _, title, _ in courses),
+                units=sum(units for _, _, units in courses),
+                receiving_course=receiving_code,
+                receiving_title=receiving_title,
+                requirement=requirement,
+                articulated=True,
+            ))
+    return rows
+
+
+class ArticulationTable:
+    """
+    - Parsed agreement rows indexed by sending and by receiving course code, so equivalence lookups
+        -are dictionary reads instead of asking gpt-4o to read the agreement text.
+    - A sending course that is part of an "AND" row is indexed under each of its codes.
+
+    Args:
+        rows (list[ArticulationRow]): Rows from parse_agreement, one or several agreements.
+    """
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.by_sending = {}
+        self.by_receiving = {}
+        for row in self.rows:
+            self.by_receiving.setdefault(normalize_code(row.receiving_course), []).append(row)
+            for code in split_courses(row.sending_course):
+                self.by_sending.setdefault(normalize_code(code), []).append(row)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def equivalents(self, sending_course):
+        """
+        Returns:
+            list[ArticulationRow]: Rows the sending course counts toward.
+        """
+        return self.by_sending.get(normalize_code(sending_course), [])
+
+    def options(self, receiving_course):
+        """
+        Returns:
+            list[ArticulationRow]: Articulated ways to satisfy the receiving course, in agreement order.
+        """
+        return [row for row in self.by_receiving.get(normalize_code(receiving_course), []) if row.articulated]
+
+    def satisfied(self, completed_codes):
+        """
+        Returns:
+            set[str]: Normalized receiving courses whose articulated sending courses are all in completed_codes.
+        """
+        completed = {normalize_code(code) for code in completed_codes}
+        return {normalize_code(row.receiving_course) for row in self.rows
+                if row.articulated and {normalize_code(code) for code in split_courses(row.sending_course)} <= completed}
+
+    def merged(self, other):
+        return ArticulationTable(self.rows + [row for row in other.rows if row not in self.rows])
+
+
+# Parsed tables by (current_school, transfer_school, major), shared process wide
+articulation_tables = {}
+_tables_lock = threading.Lock()
+
+# Fields read when loading or compiling tables
+TABLE_PROJECTION = {"current_school": True, "transfer_school": True, "major": True, "agreement": True,
+                    "articulation_table": True, "articulation_table_version": True}
+
+
+def _table_from_document(document, rules):
+    # Stored table when it was written by the current parser, otherwise parse the text now
+    stored = document.get("articulation_table")
+    if stored is not None and document.get("articulation_table_version") == ARTICULATION_TABLE_VERSION:
+        return ArticulationTable(ArticulationRow(**row) for row in stored)
+    return ArticulationTable(parse_agreement(document.get("agreement", ""), rules))
+
+
+def _default_rules():
+    from functions import MAJOR_TRANSFER_LOGIC
+    return parse_transfer_logic(MAJOR_TRANSFER_LOGIC)
+
+
+def compile_agreements(rules=None, query=None):
+    """
+    -Ingestion step: parses every matching agreement once and stores the rows on the document
+        -as `articulation_table` (with `articulation_table_version` and a fresh `updated_at` so incremental
+        -replica syncs pick it up), then loads them into articulation_tables.
+
+    Args:
+        rules (ArticulationRules): Requirement flags, defaults to the rules the pipeline uses (MAJOR_TRANSFER_LOGIC).
+        query (dict): Filter on ARTICULATION_AGREEMENTS, every document by default.
+
+    Returns:
+        int: Documents compiled.
+    """
+    rules = rules or _default_rules()
+    collection = get_collection("ARTICULATION_AGREEMENTS")
+    documents = traced_find("ARTICULATION_AGREEMENTS", query or {}, function="compile_agreements", projection=TABLE_PROJECTION)
+    for document in documents:
+        table = ArticulationTable(parse_agreement(document.get("agreement", ""), rules))
+        collection.update_one({"_id": document["_id"]}, {"$set": {
+            "articulation_table": [row.model_dump() for row in table.rows],
+            "articulation_table_version": ARTICULATION_TABLE_VERSION,
+            # Change marker incremental replica syncs select on, same stamp ingest.py writes
+            "updated_at": time.time(),
+        }})
+        with _tables_lock:
+            articulation_tables[(document["current_school"], document["transfer_school"], document["major"])] = table
+    # Plans built on the old tables are rebuilt
+    bump_agreement_generation()
+    return len(documents)
+
+
+def load_articulation_tables(query=None):
+    """
+    Loads stored tables into articulation_tables in one query, e.g. at startup.
+
+    Returns:
+        int: Tables loaded.
+    """
+    rules = None
+    documents = traced_find("ARTICULATION_AGREEMENTS", query or {}, function="load_articulation_tables", projection=TABLE_PROJECTION)
+    for document in documents:
+        if document.get("articulation_table_version") != ARTICULATION_TABLE_VERSION:
+            rules = rules or _default_rules()
+        with _tables_lock:
+            articulation_tables[(document["current_school"], document["transfer_school"], document["major"])] = _table_from_document(document, rules)
+    return len(documents)
+
+
+def get_articulation_table(current_school, transfer_school, major):
+    """
+    -Equivalence table for one or several transfer schools, from articulation_tables when loaded.
+    -A miss reads the document once (stored table, or the text parsed on the spot) and keeps the result,
+        -a pair with no agreement is kept as an empty table so it is not queried again.
+
+    Args:
+        current_school (str): A Students current school.
+        transfer_school (str | list[str]): Transfer school(s), tables of several schools are merged.
+        major (str): Major.
+
+    Returns:
+        ArticulationTable: Rows of every requested agreement.
+    """
+    schools = list(dict.fromkeys(transfer_school if isinstance(transfer_school, list) else [transfer_school]))
+    missing = [school for school in schools if (current_school, school, major) not in articulation_tables]
+    if missing:
+        # Every miss in one $in query, like get_articulation_agreement
+        query = {"$and": [{"current_school": current_school}, {"transfer_school": {"$in": missing}}, {"major": major}]}
+        documents = traced_find("ARTICULATION_AGREEMENTS", query, function="get_articulation_table", projection=TABLE_PROJECTION)
+        found = {school: ArticulationTable() for school in missing}
+        rules = _default_rules()
+        for document in documents:
+            if document.get("transfer_school") in found:
+                found[document["transfer_school"]] = found[document["transfer_school"]].merged(_table_from_document(document, rules))
+        with _tables_lock:
+            for school, parsed in found.items():
+                articulation_tables[(current_school, school, major)] = parsed
+
+    table = ArticulationTable()
+    for school in schools:
+        table = table.merged(articulation_tables.get((current_school, school, major), ArticulationTable()))
+    return table
+
+
+def invalidate_articulation_tables(current_school=None, transfer_school=None, major=None):
+    """
+    -Drops loaded tables so the next lookup reads the database again, same matching as
+        -agreements.invalidate_articulation_agreements (None matches every value).
+
+    Returns:
+        int: Number of tables removed.
+    """
+    with _tables_lock:
+        keys = [key for key in articulation_tables
+                if all(want is None or want == have for want, have in zip((current_school, transfer_school, major), key))]
+        for key in keys:
+            del articulation_tables[key]
+    return len(keys)
+
+
+def complete_plan(final_plan, completed_courses, rules, table, completed_codes=()):
+    """
+    -Checks a finalized plan against the parsed agreement table, without another model call:
+        -receiving courses of planned rows are taken from the table when it knows the sending course
+        -units and titles of single course rows come from the table (split combined entries carry none of their own)
+        -required groups the plan and completed courses leave uncovered get the table's first articulated option
+
+    Args:
+        final_plan (FinalEdPlan): Plan from finalize_plan.
+        completed_courses (list[CourseData]): Completed course rows (EdPlan.completed_courses).
+        rules (ArticulationRules): Parsed major preparation requirements.
+        table (ArticulationTable): Agreement table for the student's schools and major.
+        completed_codes (list[str]): Sending course codes the student has completed.
+
+    Returns:
+        FinalEdPlan: Corrected plan.
+    """
+    if not len(table):
+        return final_plan
+    completed = {normalize_code(code) for code in completed_codes if code}
+    completed.update(normalize_code(course.sending_Institution_course) for course in completed_courses)
+
+    planned = []
+    for course in final_plan.education_plan:
+        rows = table.equivalents(course.sending_Institution_course)
+        if rows and course.receiving_Institution_course not in [row.receiving_course for row in rows]:
+            course = course.model_copy(update={"receiving_Institution_course": rows[0].receiving_course})
+        # A row articulating this course alone knows its own units and title
+        single = [row for row in rows if row.articulated and len(split_courses(row.sending_course)) == 1]
+        if single and single[0].units:
+            course = course.model_copy(update={"units": single[0].units,
+                                               "sending_Institution_course_title": single[0].sending_title or course.sending_Institution_course_title})
+        planned.append(course)
+
+    # Receiving courses the student's completed sending courses already satisfy
+    satisfied = table.satisfied(completed)
+
+    plan = FinalEdPlan(education_plan=planned, total_units=final_plan.total_units, removed=final_plan.removed)
+    for group in missing_requirements(plan, completed_courses, rules, completed, table):
+        for code in group:
+            covered = {normalize_code(receiving) for course in planned for receiving in split_courses(course.receiving_Institution_course)}
+            options = table.options(code)
+            if options and normalize_code(code) not in covered | satisfied:
+                planned.append(options[0].course_data())
+    return FinalEdPlan(education_plan=planned, total_units=sum(course.units for course in planned), removed=final_plan.removed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parse articulation agreements into stored equivalence tables")
+    parser.add_argument("--offline", action="store_true", help="run against the mock database")
+    args = parser.parse_args(argv)
+    if args.offline:
+        import mock
+        mock.install(db_latency=0.0)
+    print(f"{compile_agreements()} agreements compiled")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+'''
+ASYNC DATA
+'''
+import asyncio
+import os
+import threading
+
+from clients import get_async_collection
+from tracing import payload_size, span
+
+
+# Per-query timeout: passed to the Data API and enforced around the whole cursor
+DATA_TIMEOUT_MS = int(os.getenv("DATA_TIMEOUT_MS", 10000))
+
+
+class DataLoop:
+    """
+    - One asyncio event loop on a daemon thread, shared by every Streamlit session and pipeline thread.
+    - astrapy's async collections keep a pooled HTTP connection that belongs to the loop it was first used on,
+        -running every query on this loop lets the whole process share one pool instead of one per thread or rerun.
+    - Synchronous callers hand coroutines over with run() (blocking) or submit() (a Future to collect later,
+        -e.g. after starting a model call so the DB round trip overlaps it).
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def loop(self):
+        # Started on first use, importing this module never creates a thread
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="data-loop", daemon=True).start()
+            return self._loop
+
+    def submit(self, coroutine):
+        """
+        Returns:
+            concurrent.futures.Future: Result of the coroutine run on the shared loop.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop())
+
+    def run(self, coroutine, timeout=None):
+        """
+        Runs a coroutine on the shared loop and blocks until it finishes.
+
+        Args:
+            coroutine: Awaitable to run, e.g. agreements.get_articulation_agreement(...).
+            timeout (float): Seconds to wait for the result.
+
+        Returns:
+            *: The coroutine's result.
+        """
+        if threading.current_thread().name == "data-loop":
+            raise RuntimeError("DataLoop.run called from the data loop itself, await the coroutine instead")
+        return self.submit(coroutine).result(timeout)
+
+
+# Shared loop for every async query in the process
+data_loop = DataLoop()
+
+
+async def fetch(collection_name, filter, timeout_ms=DATA_TIMEOUT_MS, **kwargs):
+    """
+    -One query on the shared async collection, every page of the cursor drained.
+    -Raises TimeoutError when the whole query takes longer than timeout_ms.
+
+    Returns:
+        list[dict]: Matching documents.
+    """
+    cursor = get_async_collection(collection_name).find(filter, timeout_ms=timeout_ms, **kwargs)
+    try:
+        return await asyncio.wait_for(cursor.to_list(), None if timeout_ms is None else timeout_ms / 1000)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"{collection_name} query exceeded {timeout_ms} ms") from None
+
+
+async def find(collection_name, filter, function=None, timeout_ms=DATA_TIMEOUT_MS, **kwargs):
+    """
+    -Async counterpart of tracing.traced_find: the local replica answers when it can, otherwise
+        -the query goes to the shared async collection, recorded as a "db" span.
+
+    Args:
+        collection_name (str): Collection to query.
+        filter (dict): Data API filter.
+        function (str): Calling function, recorded on the span.
+        timeout_ms (int): Per-query timeout in milliseconds, None waits indefinitely.
+        **kwargs: Passed to find (projection, limit, ...).
+
+    Returns:
+        list[dict]: Matching documents.
+    """
+    from replica import replica
+    if replica.serves(collection_name):
+        with span("find", kind="replica", collection=collection_name, function=function, mode="async") as record:
+            documents = replica.find(collection_name, filter, **kwargs)
+            record["documents"] = None if documents is None else len(documents)
+        if documents is not None:
+            return documents
+    with span("find", kind="db", collection=collection_name, function=function, mode="async") as record:
+        documents = await fetch(collection_name, filter, timeout_ms=timeout_ms, **kwargs)
+        record["documents"] = len(documents)
+        record["response_bytes"] = payload_size(documents)
+        return documents
+
+
+async def find_many(queries, timeout_ms=DATA_TIMEOUT_MS):
+    """
+    -Runs several finds concurrently with asyncio.gather, the total time is the slowest query rather than the sum.
+
+    Args:
+        queries (list[tuple(str, dict, dict)]): (collection_name, filter, find kwargs) per query.
+        timeout_ms (int): Per-query timeout.
+
+    Returns:
+        list[list[dict] | Exception]: Documents per query in order, or the exception that query raised.
+    """
+    return await asyncio.gather(*(find(name, filter, timeout_ms=timeout_ms, **kwargs) for name, filter, kwargs in queries),
+                                return_exceptions=True)
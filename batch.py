@@ -0,0 +1,355 @@
+'''
+BATCH
+'''
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import functions
+from clients import get_openai_client
+from llm import llm_cache
+from ratelimit import call_with_retry, estimate_tokens
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_MODEL = "gpt-4o"
+
+# Batch statuses after which nothing more will happen
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def _transfer_plan_messages(item):
+    return functions._transfer_messages(functions.TRANSFER_PLAN_INSTRUCTIONS, item["prompt"], item["profile"], item["agreement"])
+
+
+def _general_ed_plan_messages(item):
+    return functions._general_ed_messages(item["prompt"], item["course_list"], item["current_plan"])
+
+
+def _profile_field_messages(item):
+    return functions._profile_field_messages(item["profile"])
+
+
+# Agents that can run in batch mode: response schema and the same message builder the interactive call uses
+    # identical messages mean identical llm_cache keys, so batch results warm the interactive path too
+BATCH_AGENTS = {
+    "transferAgent2": (functions.EdPlan, _transfer_plan_messages),
+    "general_ed_planner2": (functions.GeneralEdGenerator, _general_ed_plan_messages),
+    "generate_field_via_gpt": (functions.profileGenerator, _profile_field_messages),
+}
+
+
+def _response_format_param(response_format):
+    # The json_schema payload client.beta.chat.completions.parse sends for a pydantic model,
+        # built from the SDK's public strict schema conversion (pydantic_function_tool)
+    from openai import pydantic_function_tool
+    function = pydantic_function_tool(response_format)["function"]
+    param = {"type": "json_schema",
+             "json_schema": {"schema": function["parameters"], "name": response_format.__name__, "strict": True}}
+    # parse's own conversion is private to the SDK, when it can still be imported it has to agree,
+        # otherwise batch requests would no longer match the interactive ones (and their cached responses)
+    try:
+        from openai.lib._parsing._completions import type_to_response_format_param
+    except ImportError:
+        return param
+    if type_to_response_format_param(response_format) != param:
+        raise RuntimeError(f"{response_format.__name__}: batch response_format no longer matches what "
+                           "beta.chat.completions.parse sends, update batch._response_format_param for this openai version")
+    return param
+
+
+def build_requests(agent, items, model=BATCH_MODEL):
+    """
+    -Turns planner inputs into Batch API request lines.
+
+    Args:
+        agent (str): Key of BATCH_AGENTS.
+        items (list[dict{str : *}]): One dict per request with a unique "id" and the agent's inputs:
+            transferAgent2: prompt, profile, agreement
+            general_ed_planner2: prompt, course_list, current_plan
+            generate_field_via_gpt: profile
+        model (str): OpenAI model name.
+
+    Returns:
+        list[dict{str : *}]: Request lines {"custom_id", "method", "url", "body"}.
+    """
+    response_format, build_messages = BATCH_AGENTS[agent]
+    schema = _response_format_param(response_format)
+    requests = []
+    for item in items:
+        requests.append({
+            "custom_id": f"{agent}:{item['id']}",
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {"model": model, "messages": build_messages(item), "response_format": schema},
+        })
+    return requests
+
+
+def write_batch_file(requests, path=None):
+    """
+    Returns:
+        str: Path of the JSONL batch input file (a temporary file when no path is given).
+    """
+    if path is None:
+        handle, path = tempfile.mkstemp(prefix="batch-", suffix=".jsonl")
+        os.close(handle)
+    with open(path, "w", encoding="utf-8") as batch_file:
+        for request in requests:
+            batch_file.write(json.dumps(request) + "\n")
+    return path
+
+
+class OpenAIBatchRunner:
+    """
+    - Runs a JSONL batch file through the OpenAI Batch API (files.create -> batches.create -> poll -> files.content).
+    - Batch requests are billed at a discount and do not count against the interactive rate limits,
+        -at the cost of completing within `completion_window` instead of seconds.
+
+    Args:
+        client (OpenAI): Client to use, defaults to clients.get_openai_client().
+        completion_window (str): Batch completion window.
+    """
+
+    def __init__(self, client=None, completion_window="24h"):
+        self.client = client
+        self.completion_window = completion_window
+
+    def _client(self):
+        return self.client or get_openai_client()
+
+    def submit(self, path):
+        """
+        Returns:
+            str: Batch id.
+        """
+        client = self._client()
+        with open(path, "rb") as batch_file:
+            uploaded = client.files.create(file=batch_file, purpose="batch")
+        batch = client.batches.create(input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT, completion_window=self.completion_window)
+        return batch.id
+
+    def status(self, batch_id):
+        batch = self._client().batches.retrieve(batch_id)
+        return batch.status, batch
+
+    def output_lines(self, batch):
+        """
+        Returns:
+            list[dict]: Output and error file lines of a finished batch.
+        """
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                text = self._client().files.content(file_id).text
+                lines.extend(json.loads(line) for line in text.splitlines() if line.strip())
+        return lines
+
+
+class LocalBatchRunner:
+    """
+    - Stand-in for OpenAIBatchRunner with the same interface, for tests and offline runs.
+    - Executes every line of the batch file through chat.completions.create on a thread pool
+        -(against the mock or the real API) and writes output lines in the Batch API format.
+    - Requests share the process rate limiter and retry policy with the interactive agents.
+
+    Args:
+        client (OpenAI): Client to use, defaults to clients.get_openai_client().
+        concurrency (int): Requests in flight at once.
+    """
+
+    def __init__(self, client=None, concurrency=8):
+        self.client = client
+        self.concurrency = concurrency
+        self._batches = {}
+
+    def _run_line(self, request):
+        client = self.client or get_openai_client()
+        try:
+            completion = call_with_retry(client.chat.completions.create, estimate_tokens(request["body"]["messages"]),
+                                         **request["body"])
+            usage = completion.usage
+            body = {
+                "id": completion.id,
+                "model": request["body"]["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": completion.choices[0].message.content}}],
+                "usage": {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens},
+            }
+            return {"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None}
+        except Exception as error:
+            return {"custom_id": request["custom_id"], "response": None,
+                    "error": {"code": type(error).__name__, "message": str(error)}}
+
+    def submit(self, path):
+        with open(path, encoding="utf-8") as batch_file:
+            requests = [json.loads(line) for line in batch_file if line.strip()]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            lines = list(pool.map(self._run_line, requests))
+        batch_id = f"local-batch-{len(self._batches) + 1}"
+        self._batches[batch_id] = lines
+        return batch_id
+
+    def status(self, batch_id):
+        return "completed", batch_id
+
+    def output_lines(self, batch):
+        return self._batches[batch]
+
+
+def wait_for_batch(runner, batch_id, poll_interval=30.0, timeout=None):
+    """
+    Polls until the batch reaches a terminal status.
+
+    Returns:
+        object: The runner's batch object.
+
+    Raises:
+        RuntimeError: The batch failed, expired or was cancelled, or the timeout passed.
+    """
+    started = time.monotonic()
+    while True:
+        status, batch = runner.status(batch_id)
+        if status in TERMINAL_STATUSES:
+            if status != "completed":
+                raise RuntimeError(f"Batch {batch_id} ended with status {status}")
+            return batch
+        if timeout is not None and time.monotonic() - started > timeout:
+            raise RuntimeError(f"Batch {batch_id} still {status} after {timeout}s")
+        time.sleep(poll_interval)
+
+
+def parse_results(requests, lines, store=True):
+    """
+    -Maps output lines back to pydantic objects by custom_id.
+    -Successful results are stored in llm_cache under the same key chat_parse would use,
+        -so a later interactive call for the same inputs is a cache hit.
+
+    Args:
+        requests (list[dict]): Request lines from build_requests.
+        lines (list[dict]): Batch output lines.
+        store (bool): Write successful results to llm_cache.
+
+    Returns:
+        tuple(dict, dict): {custom_id: EdPlan | GeneralEdGenerator} and {custom_id: error message}.
+    """
+    by_id = {request["custom_id"]: request for request in requests}
+    results, errors = {}, {}
+    for line in lines:
+        custom_id = line.get("custom_id")
+        request = by_id.get(custom_id)
+        if request is None:
+            continue
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            errors[custom_id] = (line.get("error") or {}).get("message") or f"status {response.get('status_code')}"
+            continue
+        response_format = BATCH_AGENTS[custom_id.split(":", 1)[0]][0]
+        content = response["body"]["choices"][0]["message"]["content"]
+        try:
+            parsed = response_format.model_validate_json(content)
+        except ValueError as error:
+            errors[custom_id] = f"invalid {response_format.__name__}: {error}"
+            continue
+        results[custom_id] = parsed
+        if store:
+            body = request["body"]
+            key = llm_cache.make_key(body["model"], body["messages"], response_format)
+            llm_cache.set(key, parsed.model_dump_json(), model=body["model"], kind=response_format.__name__)
+    # Requests with no output line at all
+    for custom_id in by_id:
+        if custom_id not in results and custom_id not in errors:
+            errors[custom_id] = "missing from batch output"
+    return results, errors
+
+
+def run_batch(agent, items, runner=None, poll_interval=30.0, timeout=None, store=True, model=BATCH_MODEL):
+    """
+    -Build -> write -> submit -> poll -> parse for one agent over many inputs.
+
+    Args:
+        agent (str): Key of BATCH_AGENTS.
+        items (list[dict{str : *}]): Agent inputs, see build_requests.
+        runner (OpenAIBatchRunner | LocalBatchRunner): Defaults to the OpenAI Batch API.
+        store (bool): Write successful results to llm_cache.
+        model (str): OpenAI model name.
+
+    Returns:
+        tuple(dict, dict): Results and errors keyed by item id.
+    """
+    runner = runner or OpenAIBatchRunner()
+    requests = build_requests(agent, items, model)
+    path = write_batch_file(requests)
+    try:
+        batch_id = runner.submit(path)
+    finally:
+        os.remove(path)
+    batch = wait_for_batch(runner, batch_id, poll_interval, timeout)
+    results, errors = parse_results(requests, runner.output_lines(batch), store=store)
+    strip = lambda keyed: {custom_id.split(":", 1)[1]: value for custom_id, value in keyed.items()}
+    return strip(results), strip(errors)
+
+
+def transfer_plan_items(profiles, prompt="Build my transfer plan."):
+    """
+    transferAgent2 inputs for a list of profiles, with each profile's agreements looked up (and cached) first.
+    """
+    items = []
+    for index, profile in enumerate(profiles):
+        agreement = functions.get_articulation_agreement(profile["current_school"], profile["transfer_school"], profile["major"])
+        items.append({"id": str(profile.get("id", index)), "prompt": prompt,
+                      "profile": dict(profile, education_plan=profile.get("education_plan", [])), "agreement": agreement})
+    return items
+
+
+def general_ed_plan_items(profiles, prompt=""):
+    """
+    general_ed_planner2 inputs for a list of profiles, current_plan is each profile's education_plan.
+    """
+    items = []
+    for index, profile in enumerate(profiles):
+        items.append({"id": str(profile.get("id", index)), "prompt": prompt,
+                      "course_list": functions.get_general_ed_course_list(profile["current_school"]),
+                      "current_plan": profile.get("education_plan", [])})
+    return items
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk plan generation through the OpenAI Batch API")
+    # generate_field_via_gpt batches are run by profile_pool.py --batch-api
+    parser.add_argument("agent", choices=("general_ed_planner2", "transferAgent2"))
+    parser.add_argument("--profiles", help="JSONL file of student profiles (default: --random profiles)")
+    parser.add_argument("--random", type=int, default=10, help="number of random profiles when --profiles is not given")
+    parser.add_argument("--output", default="batch_results.jsonl")
+    parser.add_argument("--local", action="store_true", help="run requests locally instead of the Batch API")
+    parser.add_argument("--offline", action="store_true", help="use the mock OpenAI/Astra backends (implies --local)")
+    parser.add_argument("--poll-interval", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    if args.offline:
+        import mock
+        mock.install(latency=0.05)
+    if args.profiles:
+        with open(args.profiles, encoding="utf-8") as source:
+            profiles = [json.loads(line) for line in source if line.strip()]
+    else:
+        profiles = [functions.initialize_random_profile() for _ in range(args.random)]
+
+    items = transfer_plan_items(profiles) if args.agent == "transferAgent2" else general_ed_plan_items(profiles)
+    runner = LocalBatchRunner() if args.local or args.offline else OpenAIBatchRunner()
+    started = time.perf_counter()
+    results, errors = run_batch(args.agent, items, runner, args.poll_interval, args.timeout)
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        for item_id, result in results.items():
+            output.write(json.dumps({"id": item_id, args.agent: result.model_dump()}) + "\n")
+        for item_id, error in errors.items():
+            output.write(json.dumps({"id": item_id, "error": error}) + "\n")
+    print(f"{len(results)} results, {len(errors)} errors in {time.perf_counter() - started:.1f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+'''
+BENCHMARK
+'''
+import argparse
+import contextlib
+import time
+
+
+def _percentile(samples, percent):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _time(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _legacy_render(st, rows):
+    # What test.py used to do: one row DataFrame + pd.concat + a new chart for every course
+    import pandas as pd
+    data = pd.DataFrame({'completed': [], 'planned': [], 'Courses': []})
+    for course, completed, planned in rows:
+        new_row = pd.DataFrame({'completed': [completed], 'planned': [planned], 'Courses': [course]})
+        data = pd.concat([data, new_row], ignore_index=True)
+        st.bar_chart(data, y=['completed', 'planned'], y_label="Units", x="Courses", color=['#0066b9', '#ffb500'])
+
+
+def _accumulator_render(st, rows, sections=3):
+    # PlanAccumulator: list appends, one DataFrame and one chart per section
+    from functions import PlanAccumulator
+    data = PlanAccumulator()
+    per_section = max(1, len(rows) // sections)
+    chart = st.empty()
+    for index, (course, completed, planned) in enumerate(rows, start=1):
+        data.add(course, completed=completed, planned=planned)
+        if index % per_section == 0 or index == len(rows):
+            data.render(chart)
+            chart = st.empty()
+
+
+def bench_render(sizes=(5, 10, 30, 60), repeat=3):
+    """
+    - Plan chart render time vs number of courses, legacy per row charts against PlanAccumulator.
+    - Runs Streamlit in bare mode, chart specs and dataframes are still built, nothing is sent to a browser.
+
+    Returns:
+        list[dict]: One row per size with median seconds for each approach.
+    """
+    import streamlit as st
+    results = []
+    for size in sizes:
+        rows = [(f"COURSE-{index}", 4 if index % 3 == 0 else 0, 0 if index % 3 == 0 else 4) for index in range(size)]
+        legacy = _time(lambda: _legacy_render(st, rows), repeat)
+        accumulated = _time(lambda: _accumulator_render(st, rows), repeat)
+        results.append({
+            "courses": size,
+            "legacy_s": _percentile(legacy, 50),
+            "accumulator_s": _percentile(accumulated, 50),
+        })
+    return results
+
+
+@contextlib.contextmanager
+def _offline(latency, db_latency, warm):
+    """
+    - Routes every client to the mock backends, mock.install also bypasses the LLM response cache
+        -so each run measures pipeline structure rather than cache hits.
+    - `warm` keeps the agreement cache, articulation tables and GENERAL_ED catalog between runs, otherwise they are cleared per run.
+    """
+    import clients
+    import mock
+    from articulation import invalidate_articulation_tables
+    from catalog import general_ed_catalog
+    from agreements import agreement_cache
+    from llm import llm_cache
+
+    bypass = llm_cache.bypass
+    openai, database = mock.install(latency=latency, db_latency=db_latency)
+
+    def reset():
+        if not warm:
+            agreement_cache.invalidate()
+            invalidate_articulation_tables()
+            general_ed_catalog.invalidate()
+
+    reset()
+    try:
+        yield openai, database, reset
+    finally:
+        llm_cache.bypass = bypass
+        agreement_cache.invalidate()
+        invalidate_articulation_tables()
+        general_ed_catalog.invalidate()
+        clients.reset_clients()
+
+
+def _call_rows(calls, runs):
+    # Per function call counts and prompt tokens, averaged per run
+    grouped = {}
+    for call in calls:
+        row = grouped.setdefault(call["function"], {"function": call["function"], "calls": 0, "prompt_tokens": 0,
+                                                    "cached_tokens": 0, "completion_tokens": 0, "p50_s": [], "p95_s": []})
+        row["calls"] += 1
+        row["prompt_tokens"] += call["prompt_tokens"]
+        row["cached_tokens"] += call["cached_tokens"]
+        row["completion_tokens"] += call["completion_tokens"]
+        row["p50_s"].append(call["seconds"])
+    for row in grouped.values():
+        samples = row["p50_s"]
+        row["p50_s"], row["p95_s"] = _percentile(samples, 50), _percentile(samples, 95)
+        for field in ("calls", "prompt_tokens", "cached_tokens", "completion_tokens"):
+            row[field] = row[field] / runs
+    return sorted(grouped.values(), key=lambda row: -row["prompt_tokens"])
+
+
+def _db_rows(database, runs):
+    return [{"collection": name, "calls": len(collection.calls) / runs}
+            for name, collection in sorted(database.collections.items())]
+
+
+def bench_pipeline(runs=10, latency=0.05, db_latency=0.02, warm=False, explain=False):
+    """
+    - End to end Transfer planning latency (pipeline.build_transfer_plan) against the offline mocks.
+    - Mock latencies stand in for gpt-4o and Astra round-trips, so the numbers show how many
+        -sequential trips the pipeline makes rather than real service time.
+
+    Returns:
+        tuple(dict, list[dict], list[dict]): p50/p95 run seconds, per function LLM calls and per collection DB calls.
+    """
+    from functions import initialize_student_profile
+    from pipeline import build_transfer_plan
+
+    samples = []
+    with _offline(latency, db_latency, warm) as (openai, database, reset):
+        for collection in database.collections.values():
+            collection.calls.clear()
+        for _ in range(runs):
+            reset()
+            profile = initialize_student_profile()
+            profile["education_plan"] = []
+            start = time.perf_counter()
+            build_transfer_plan("Build my transfer plan.", profile, explain=explain)
+            samples.append(time.perf_counter() - start)
+        summary = {"runs": runs, "p50_s": _percentile(samples, 50), "p95_s": _percentile(samples, 95)}
+        return summary, _call_rows(openai.calls, runs), _db_rows(database, runs)
+
+
+def bench_loop(turns=10, runs=3, latency=0.05, db_latency=0.02, warm=False, history="memory"):
+    """
+    - The Loop button conversation: counselor opening message, then alternating student and counselor turns,
+        -with the agreement looked up per turn as test.py does.
+    - Streamed responses are drained fully, per turn latency is time to the complete response.
+    - `history` picks what the agents see of earlier turns: "none" (only the last message),
+        -"full" (the whole transcript) or "memory" (memory.ConversationMemory window + summary).
+
+    Returns:
+        tuple(dict, list[dict], list[dict]): p50/p95 turn seconds and first/last turn prompt tokens,
+            per agent LLM calls and per collection DB calls.
+    """
+    from functions import advisorStep_stream, get_articulation_agreement, initialize_student_profile, student_stream
+    from memory import ConversationMemory, PERSPECTIVE_ROLES
+
+    samples, calls, first_tokens, last_tokens = [], [], [], []
+    with _offline(latency, db_latency, warm) as (openai, database, reset):
+        for collection in database.collections.values():
+            collection.calls.clear()
+        for _ in range(runs):
+            reset()
+            profile = initialize_student_profile()
+            profile["education_plan"] = []
+            memory = ConversationMemory()
+            messages = [{"role": "user", "content": "Hello, I would like help planning my transfer."}]
+            for turn in range(turns):
+                perspective = "counselor" if turn % 2 == 0 else "student"
+                start = time.perf_counter()
+                before = len(openai.calls)
+                if history == "memory":
+                    context = memory.history(messages[:-1], perspective)
+                elif history == "full":
+                    context = [{"role": PERSPECTIVE_ROLES[perspective][m["role"]], "content": m["content"]} for m in messages[:-1]]
+                else:
+                    context = None
+                agreement = get_articulation_agreement(profile["current_school"], profile["transfer_school"], profile["major"])
+                prompt = f"{messages[-1]['content']} (turn {turn})"
+                if perspective == "counselor":
+                    name, role, reply = "advisorStep_stream", "assistant", "".join(advisorStep_stream(prompt, profile, agreement, context))
+                else:
+                    name, role, reply = "student_stream", "user", "".join(student_stream(prompt, profile, context))
+                samples.append(time.perf_counter() - start)
+                messages.append({"role": role, "content": reply})
+                # Streams run after the agent returns, so attribute the turn's unnamed calls to the agent here
+                calls.extend(dict(call, function=name if call["function"] == "unknown" else call["function"])
+                             for call in openai.calls[before:])
+                (first_tokens if turn == 0 else last_tokens if turn == turns - 1 else []).append(openai.calls[-1]["prompt_tokens"])
+        # Turn time includes any summary fold made while building that turn's history
+        summary = {"history": history, "turns": turns * runs, "p50_s": _percentile(samples, 50), "p95_s": _percentile(samples, 95),
+                   "first_prompt_tokens": _percentile(first_tokens, 50), "last_prompt_tokens": _percentile(last_tokens, 50)}
+        return summary, _call_rows(calls, runs), _db_rows(database, runs)
+
+
+def _legacy_prompts(profile, agreement):
+    # System prompts as the agents built them before context.build_context (profile repr, raw agreement list, notes twice)
+    return {
+        "advisorStep": f"You are an academic advisor specializing in helping transfer students. Using a student profile: {profile} "
+                       f"and a summarized student education plan {agreement} as context help student with their academic plans and journey. "
+                       f"Focus on intergrating {profile['notes']} and their new educational plan. Determine equivalent courses based off relevant transfer agreements.",
+        "transferAgent": f"You are an education plan generator specializing in college transfer students. Using student profile as context: {profile}. "
+                         f"Using {profile['education_plan']} and transfer agreements: {agreement} for questions regarding equivalent courses. "
+                         f"Help student with question regarding their education plan. Help students with questions regarding equivalent courses. "
+                         f"Help students with discussions regarding additonal courses not currently in their education plan. Incorporate {profile['notes']} "
+                         f"Determine equivalent courses based off relevant transfer agreements.",
+        "transferAgentFIRST": f"You are an education plan generator specializing in college transfer students. Using student profile as context: {profile}. "
+                              f"Compare completed courses: {profile['completed_courses']} and transfer agreements: {agreement} "
+                              f"Determine and inform the student of remaining courses needed to transfer and their relevant equivalent courses. "
+                              f"Present additonal transferable courses available for a complete and concise educational plan. "
+                              f"Determine equivalent courses based off relevant transfer agreements.",
+    }
+
+
+def bench_context(latency=0.0):
+    """
+    - Prompt tokens per agent before and after context.build_context, for the demo profile
+        -with a generated education plan and both of its transfer agreements.
+
+    Returns:
+        list[dict]: One row per agent with legacy and compact prompt tokens and the input cost saved per 1000 calls.
+    """
+    import functions
+    from pipeline import build_transfer_plan
+    from tracing import estimate_cost
+
+    agents = {
+        "advisorStep": lambda profile, agreement: functions.advisorStep("What should I take next term?", profile, agreement),
+        "transferAgent": lambda profile, agreement: functions.transferAgent("What should I take next term?", profile, agreement),
+        "transferAgentFIRST": lambda profile, agreement: functions.transferAgentFIRST("What should I take next term?", profile, agreement),
+    }
+    rows = []
+    with _offline(latency, 0.0, warm=True) as (openai, database, reset):
+        profile = functions.initialize_student_profile()
+        profile["education_plan"] = build_transfer_plan("Build my transfer plan.", profile)["education_plan"]
+        agreement = functions.get_articulation_agreement(profile["current_school"], profile["transfer_school"], profile["major"])
+        legacy = _legacy_prompts(profile, agreement)
+        for name, call in agents.items():
+            # Legacy prompt sent straight to the mock so both sides are counted the same way
+            openai.chat.completions.create(model="gpt-4o", messages=[
+                {"role": "system", "content": legacy[name]}, {"role": "user", "content": "What should I take next term?"}])
+            call(profile, agreement)
+            before, after = openai.calls[-2]["prompt_tokens"], openai.calls[-1]["prompt_tokens"]
+            rows.append({
+                "agent": name,
+                "legacy_tokens": before,
+                "compact_tokens": after,
+                "saved_pct": 100.0 * (before - after) / before,
+                "saved_usd_per_1k": 1000 * (estimate_cost("gpt-4o", before, 0) - estimate_cost("gpt-4o", after, 0)),
+            })
+    return rows
+
+
+def _legacy_transfer_prompt(prompt, profile, agreement):
+    # transferAgent2's system prompt before the stable prefix layout: per student data interleaved with the transfer logic
+    from functions import MAJOR_TRANSFER_LOGIC
+    return [
+        {"role": "system", "content": f"You are an education plan generator specializing in college transfer students following transfer logic {MAJOR_TRANSFER_LOGIC}. "
+                                      f"using completed courses: {profile['completed_courses']} and articulation agreements: {agreement} "
+                                      f"build an education plan of remaing required courses for transfer, and providing  uc equivalent courses."
+                                      f"if a {profile['completed_courses']} satisfies a required transfer we dont need to fill the area."
+                                      f"if {profile['education_plan']} is already built use {prompt} to refine."},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def bench_prefix(students=20):
+    """
+    - Provider prompt cache reuse for transferAgent2 across students with the same agreement,
+        -legacy interleaved prompt against the stable prefix layout (functions._transfer_messages).
+    - Uses the mock's prefix cache emulation (1024 token minimum, 128 token steps).
+
+    Returns:
+        list[dict]: One row per layout with prompt and cached tokens per call and the estimated input cost.
+    """
+    import functions
+    from tracing import estimate_cost
+
+    courses = ["MATH-04A", "CPSC-06", "ENGL-01A", "PHYS-04A", "CPSC-07", "MATH-04B", "HIST-17"]
+    rows = []
+    with _offline(0.0, 0.0, warm=True) as (openai, database, reset):
+        base = functions.initialize_student_profile()
+        agreement = functions.get_articulation_agreement(base["current_school"], base["transfer_school"], base["major"])
+        for layout in ("legacy", "stable_prefix"):
+            openai.reset()
+            for index in range(students):
+                profile = dict(base, completed_courses=courses[:index % len(courses)], education_plan=[])
+                prompt = f"Build my transfer plan, I can take {12 + index % 6} units a term."
+                if layout == "legacy":
+                    messages = _legacy_transfer_prompt(prompt, profile, agreement)
+                else:
+                    messages = functions._transfer_messages(functions.TRANSFER_PLAN_INSTRUCTIONS, prompt, profile, agreement)
+                openai.chat.completions.create(model="gpt-4o", messages=messages)
+            prompt_tokens = sum(call["prompt_tokens"] for call in openai.calls)
+            cached_tokens = sum(call["cached_tokens"] for call in openai.calls)
+            rows.append({
+                "layout": layout,
+                "prompt_tokens": prompt_tokens / students,
+                "cached_tokens": cached_tokens / students,
+                "cached_pct": 100.0 * cached_tokens / prompt_tokens,
+                "input_usd_per_1k": 1000 * estimate_cost("gpt-4o", prompt_tokens, 0, cached_tokens) / students,
+            })
+    return rows
+
+
+def bench_retrieval(repeat=200):
+    """
+    - advisorStep / transferAgent context tokens with top-k agreement retrieval against every row that fits the budget,
+        -over a few typical questions, plus index build and query time.
+
+    Returns:
+        list[dict]: One row per agent and question.
+    """
+    import context
+    import functions
+    from retrieval import AgreementIndex, agreement_index
+
+    questions = ["Which physics lab do I need?", "Can I take calculus II and data structures together?",
+                 "What should I take next term?"]
+    rows = []
+    with _offline(0.0, 0.0, warm=True) as (openai, database, reset):
+        profile = functions.initialize_student_profile()
+        profile["completed_courses"] = ["CPSC-06", "MATH-04A"]
+        profile["education_plan"] = []
+        agreement = functions.get_articulation_agreement(profile["current_school"], profile["transfer_school"], profile["major"])
+        build_seconds = _percentile(_time(lambda: AgreementIndex(agreement), repeat), 50)
+        index = agreement_index(agreement)
+        for agent in ("advisorStep", "transferAgent"):
+            for question in questions:
+                full = context.count_tokens(context.build_context(agent, profile, agreement))
+                retrieved = context.count_tokens(context.build_context(agent, profile, agreement, query=question))
+                query_seconds = _percentile(_time(lambda: index.index.search(question, context.AGENT_TOP_K[agent]), repeat), 50)
+                rows.append({
+                    "agent": agent,
+                    "question": question[:30],
+                    "full_tokens": full,
+                    "retrieved_tokens": retrieved,
+                    "saved_pct": 100.0 * (full - retrieved) / full,
+                    "index_ms": 1000 * build_seconds,
+                    "query_ms": 1000 * query_seconds,
+                })
+    return rows
+
+
+def _print_table(rows):
+    if not rows:
+        return
+    columns = list(rows[0])
+    width = max([14] + [len(str(row[c])) for row in rows for c in columns if not isinstance(row[c], float)])
+    print("  ".join(f"{column:>{width}}" for column in columns))
+    for row in rows:
+        print("  ".join(f"{row[c]:>{width}.4f}" if isinstance(row[c], float) else f"{row[c]:>{width}}" for c in columns))
+
+
+def _print_report(summary, calls, db_calls):
+    _print_table([summary])
+    print()
+    _print_table(calls)
+    print()
+    _print_table(db_calls)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Project Pathways Mapper benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    render = sub.add_parser("render", help="plan chart render time vs number of courses")
+    render.add_argument("--sizes", type=int, nargs="+", default=[5, 10, 30, 60])
+    render.add_argument("--repeat", type=int, default=3)
+
+    for name, help_text in (("pipeline", "end to end Transfer plan latency on the offline mocks"),
+                            ("loop", "Loop conversation turn latency on the offline mocks")):
+        command = sub.add_parser(name, help=help_text)
+        command.add_argument("--runs", type=int, default=10 if name == "pipeline" else 3)
+        command.add_argument("--latency", type=float, default=0.05, help="mock LLM seconds per call")
+        command.add_argument("--db-latency", type=float, default=0.02, help="mock database seconds per call")
+        command.add_argument("--warm", action="store_true", help="keep agreement and catalog caches between runs")
+    context = sub.add_parser("context", help="agent prompt tokens before and after context compaction")
+    context.add_argument("--latency", type=float, default=0.0, help="mock LLM seconds per call")
+    prefix = sub.add_parser("prefix", help="provider prompt cache reuse of the major planner prompt layouts")
+    prefix.add_argument("--students", type=int, default=20)
+    retrieval = sub.add_parser("retrieval", help="agent context tokens with top-k agreement retrieval")
+    retrieval.add_argument("--repeat", type=int, default=200)
+    sub.choices["pipeline"].add_argument("--explain", action="store_true", help="include the general ed explanation call")
+    sub.choices["loop"].add_argument("--turns", type=int, default=10)
+    sub.choices["loop"].add_argument("--history", choices=["none", "full", "memory"], default="memory")
+
+    args = parser.parse_args(argv)
+    if args.command == "render":
+        _print_table(bench_render(args.sizes, args.repeat))
+    elif args.command == "pipeline":
+        _print_report(*bench_pipeline(args.runs, args.latency, args.db_latency, args.warm, args.explain))
+    elif args.command == "prefix":
+        _print_table(bench_prefix(args.students))
+    elif args.command == "retrieval":
+        _print_table(bench_retrieval(args.repeat))
+    elif args.command == "context":
+        _print_table(bench_context(args.latency))
+    elif args.command == "loop":
+        _print_report(*bench_loop(args.turns, args.runs, args.latency, args.db_latency, args.warm, args.history))
+
+
+if __name__ == "__main__":
+    main()
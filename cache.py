@@ -0,0 +1,247 @@
+'''
+CACHE
+'''
+import threading
+import time
+from collections import OrderedDict
+
+
+# Sentinel so cached falsy values (empty lists, None) are still treated as hits
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    - Thread safe in-memory cache with time-to-live expiry and least recently used eviction.
+    - Lives at module level so it is shared by every Streamlit session and survives reruns
+        -(Streamlit re-executes the page script, not imported modules).
+    - Keeps hit/miss/eviction counters so we can verify the cache is actually saving round-trips.
+
+    Args:
+        maxsize (int): Maximum number of entries kept before the least recently used one is evicted.
+        ttl (float): Seconds an entry stays valid after it is stored. None disables expiry.
+        timer (callable): Clock used for expiry, swappable for testing.
+    """
+
+    def __init__(self, maxsize=256, ttl=3600, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for key, or default if it is missing or expired.
+        A hit marks the entry as most recently used.
+        """
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= self._timer():
+                # Expired entries are dropped on read
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Stores value under key, evicting least recently used entries past maxsize.
+        """
+        with self._lock:
+            expires_at = None if self.ttl is None else self._timer() + self.ttl
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=None, predicate=None):
+        """
+        - Drops entries from the cache.
+        - With no arguments every entry is dropped.
+
+        Args:
+            key (hashable): Single key to drop.
+            predicate (callable): Drops every key for which predicate(key) is True.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        with self._lock:
+            if key is None and predicate is None:
+                removed = len(self._data)
+                self._data.clear()
+                return removed
+            if key is not None:
+                return 1 if self._data.pop(key, _MISSING) is not _MISSING else 0
+            stale = [k for k in self._data if predicate(k)]
+            for k in stale:
+                del self._data[k]
+            return len(stale)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Current size and hit/miss/eviction/expiration counters.
+        """
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            return entry is not _MISSING and (entry[0] is None or entry[0] > self._timer())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class LLMResponseCache:
+    """
+    - Content addressed on-disk cache for OpenAI chat responses backed by SQLite (standard library only).
+    - Keys are a sha256 of (model, messages, response_format schema, extra request params) so any change
+        -to a prompt, a profile field or a pydantic model produces a fresh request.
+    - Values are stored as text: the message content for plain completions, the model's JSON for
+        -structured outputs so it can be rehydrated into the same pydantic class (EdPlan, FinalEdPlan, ...).
+    - Size bounded: least recently used rows are evicted once max_entries or max_bytes is exceeded.
+    - The database file is only opened on first use so importing this module never touches disk.
+
+    Args:
+        path (str): SQLite file location.
+        max_entries (int): Maximum number of cached responses.
+        max_bytes (int): Maximum total size of cached response text.
+        bypass (bool): When True every lookup misses and nothing is stored.
+    """
+
+    def __init__(self, path, max_entries=5000, max_bytes=50 * 1024 * 1024, bypass=False):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self._conn = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        # Lazily open a single shared connection, guarded by self._lock
+        if self._conn is None:
+            import sqlite3
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, kind TEXT, value TEXT, "
+                "size INTEGER, created REAL, last_used REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def make_key(model, messages, response_format=None, **params):
+        """
+        Returns:
+            str: sha256 hex digest identifying a request.
+        """
+        import hashlib
+        import json
+        schema = None
+        if response_format is not None:
+            schema = {"name": response_format.__name__, "schema": response_format.model_json_schema()}
+        payload = json.dumps({"model": model, "messages": messages, "response_format": schema, "params": params},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Returns:
+            str | None: Stored response text, or None on a miss or when bypassed.
+        """
+        if self.bypass:
+            return None
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value, model="", kind="text"):
+        """
+        Stores a response and evicts least recently used rows past the size bounds.
+        """
+        if self.bypass or value is None:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, kind, value, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, kind, value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn):
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        while count > self.max_entries or total > self.max_bytes:
+            oldest = conn.execute("SELECT key, size FROM responses ORDER BY last_used LIMIT 1").fetchone()
+            if oldest is None:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (oldest[0],))
+            count -= 1
+            total -= oldest[1]
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Entry count, stored bytes and hit/miss counters.
+        """
+        with self._lock:
+            count, total = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            return {
+                "entries": count,
+                "bytes": total,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypass": self.bypass,
+            }
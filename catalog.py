@@ -0,0 +1,168 @@
+'''
+CATALOG
+'''
+import os
+import re
+import threading
+import time
+
+from tracing import traced_find
+
+
+# UC area tags as they appear in GENERAL_ED documents (UC-E, UC-M, UC-H, UC-B, UC-S)
+UC_AREA_PATTERN = re.compile(r"UC-[A-Z]")
+
+# Community college course codes such as "MATH -04A", "CPSC-06" or "ENGL 1A"
+COURSE_CODE_PATTERN = re.compile(r"\b([A-Z]{2,5})\s*-?\s*(\d{1,3})([A-Z]{0,2})\b")
+UNITS_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+
+
+def _load_general_ed():
+    # UC Transfer Admission Eligibility Courses (Cursor Object)
+    return traced_find("GENERAL_ED", {"course": "four"}, function="general_ed_catalog",
+                       projection={"uc_areas": True, "school": True, "semester_units": True, "course_code": True, "course_title": True})
+
+
+def normalize_code(code):
+    """
+    Canonical form of a course code so "MATH -04A", "MATH-4A" and "math 4a" compare equal.
+
+    Returns:
+        str: e.g. "MATH4A", or the upper cased input with whitespace and dashes removed if it is not code shaped.
+    """
+    text = str(code).upper()
+    match = COURSE_CODE_PATTERN.search(text)
+    if match is None:
+        return re.sub(r"[\s\-]", "", text)
+    prefix, number, suffix = match.groups()
+    return f"{prefix}{int(number)}{suffix}"
+
+
+def _as_text(value):
+    if isinstance(value, (list, tuple)):
+        return (" ").join(str(item) for item in value)
+    return "" if value is None else str(value)
+
+
+def _course_fields(document, uc_areas, semester_units):
+    # Per course documents carry course_code/course_title, older free text rows fall back to
+        # the first course code in uc_areas and the first number in semester_units
+    code = document.get("course_code")
+    if not code:
+        match = COURSE_CODE_PATTERN.search(uc_areas)
+        code = match.group(0) if match else None
+    units = UNITS_PATTERN.search(semester_units)
+    return {
+        "course_code": code,
+        "course_title": _as_text(document.get("course_title")),
+        "units": float(units.group(0)) if units else 0.0,
+    }
+
+
+class GeneralEdCatalog:
+    """
+    - In-memory copy of the UC admission eligibility course list (GENERAL_ED collection).
+    - Loaded once per process and refreshed after `ttl` seconds or on demand, instead of scanning
+        -the whole cursor on every Streamlit rerun.
+    - Indexed by school and by (school, UC area) so a student's rows are a dictionary lookup,
+        -and only their own school's courses go into the planner prompt.
+
+    Args:
+        loader (callable): Returns an iterable of GENERAL_ED documents.
+        ttl (float): Seconds before the catalog is reloaded on next access. None never expires.
+    """
+
+    def __init__(self, loader=_load_general_ed, ttl=24 * 60 * 60):
+        self.loader = loader
+        self.ttl = ttl
+        self._by_school = {}
+        self._by_area = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Reloads every document and rebuilds the indexes.
+
+        Returns:
+            int: Number of rows loaded.
+        """
+        by_school, by_area = {}, {}
+        count = 0
+        for document in self.loader():
+            school = document.get("school")
+            uc_areas = _as_text(document.get("uc_areas"))
+            semester_units = _as_text(document.get("semester_units"))
+            row = {
+                "school": school,
+                "uc_areas": uc_areas,
+                "semester_units": semester_units,
+                "areas": tuple(sorted(set(UC_AREA_PATTERN.findall(uc_areas)))),
+            }
+            row.update(_course_fields(document, uc_areas, semester_units))
+            by_school.setdefault(school, []).append(row)
+            for area in row["areas"]:
+                by_area.setdefault((school, area), []).append(row)
+            count += 1
+
+        # Swap the indexes in one step so readers never see a half built catalog
+        with self._lock:
+            self._by_school, self._by_area = by_school, by_area
+            self._loaded_at = time.monotonic()
+        return count
+
+    def invalidate(self):
+        """
+        Marks the catalog stale so the next access reloads it (e.g. after switching database backends).
+        """
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_loaded(self):
+        with self._lock:
+            fresh = self._loaded_at is not None and (self.ttl is None or time.monotonic() - self._loaded_at < self.ttl)
+        if not fresh:
+            self.refresh()
+
+    def rows(self, school):
+        """
+        Returns:
+            list[dict]: Catalog rows for a school (school, uc_areas, semester_units, areas).
+        """
+        self._ensure_loaded()
+        return self._by_school.get(school, [])
+
+    def rows_for_area(self, school, area):
+        """
+        Args:
+            school (str): Community college name.
+            area (str): UC area tag, e.g. "UC-E".
+
+        Returns:
+            list[dict]: Catalog rows for the school tagged with that area.
+        """
+        self._ensure_loaded()
+        return self._by_area.get((school, area), [])
+
+    def courses(self, school):
+        """
+        Returns:
+            list[dict]: Rows for a school that identify a single course (course_code, course_title, units, areas),
+                the input for the local seven-course pattern solver.
+        """
+        return [row for row in self.rows(school) if row["course_code"] and row["areas"]]
+
+    def schools(self):
+        self._ensure_loaded()
+        return list(self._by_school)
+
+    def course_list(self, school):
+        """
+        Returns:
+            str: Course list text for one school, formatted for the general education planner prompt.
+        """
+        return "\n".join((" ").join([row["uc_areas"], row["semester_units"], _as_text(row["school"])]) for row in self.rows(school))
+
+
+# Process-wide catalog shared by every session
+general_ed_catalog = GeneralEdCatalog(ttl=float(os.getenv("GE_CATALOG_TTL", 24 * 60 * 60)))
@@ -0,0 +1,136 @@
+'''
+CLIENTS
+'''
+import os
+import threading
+from dotenv import load_dotenv
+
+
+# Load environment variables from the .env file
+load_dotenv()
+
+# Lazily created clients, shared process wide
+    # imported modules are not re-executed on Streamlit reruns, so these live as long as the server
+    # and every session reuses the same connections (what st.cache_resource would give us)
+_lock = threading.RLock()
+_instances = {}
+
+# Pluggable backends (e.g. offline fakes), take priority over the real clients
+_backends = {}
+
+
+def set_backend(openai=None, database=None, async_database=None):
+    """
+    - Swaps in alternate backends for the OpenAI and Astra clients (mocks, local replicas, recorded fixtures).
+    - Any cached client or collection is dropped so the next accessor call picks up the new backend.
+
+    Args:
+        openai (object): Object exposing the OpenAI client surface used by llm.py.
+        database (object): Object exposing get_collection(name) like an astrapy Database.
+        async_database (object): Object exposing get_collection(name) like an astrapy AsyncDatabase.
+    """
+    with _lock:
+        for name, backend in (("openai", openai), ("database", database), ("async_database", async_database)):
+            if backend is not None:
+                _backends[name] = backend
+        _instances.clear()
+
+
+def reset_clients():
+    """
+    Drops every backend override and cached client, the next call reconnects from environment variables.
+    """
+    with _lock:
+        _backends.clear()
+        _instances.clear()
+
+
+def _backend(name):
+    # PPM_OFFLINE=1 runs the app and pipeline on the in-memory fakes from mock.py (no API keys needed)
+    with _lock:
+        if not _backends and os.getenv("PPM_OFFLINE", "").lower() in ("1", "true", "yes"):
+            import mock
+            mock.install(db_latency=0.0)
+        return _backends.get(name)
+
+
+def _get(name, factory):
+    # Double checked so concurrent pipeline threads only construct a client once
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = factory()
+                _instances[name] = instance
+    return instance
+
+
+def get_openai_client():
+    """
+    Returns:
+        OpenAI: Shared OpenAI client, created on first use.
+    """
+    def factory():
+        backend = _backend("openai")
+        if backend is not None:
+            return backend
+        from openai import OpenAI
+        # Retries, backoff and timeouts are handled by ratelimit.call_with_retry around every request,
+            # SDK retries on top of those would multiply the attempts and bypass the shared limiter
+        return OpenAI(max_retries=0)
+    return _get("openai", factory)
+
+
+def get_database():
+    """
+    Returns:
+        Database: Shared Astra database handle, created on first use from TOKEN and DB_API_ENDPOINT.
+    """
+    def factory():
+        backend = _backend("database")
+        if backend is not None:
+            return backend
+        from astrapy import DataAPIClient
+        # Access astrapy client using token
+        clientb = DataAPIClient(os.getenv("TOKEN"))
+        return clientb.get_database(os.getenv("DB_API_ENDPOINT"))
+    return _get("database", factory)
+
+
+def get_collection(name):
+    """
+    Args:
+        name (str): Collection name, e.g. "ARTICULATION_AGREEMENTS" or "GENERAL_ED".
+
+    Returns:
+        Collection: Shared collection handle, created on first use.
+    """
+    return _get(f"collection:{name}", lambda: get_database().get_collection(name))
+
+
+def get_async_database():
+    """
+    Returns:
+        AsyncDatabase: Shared async Astra database handle, created on first use.
+            Its HTTP connection pool belongs to one event loop, only use it on async_data's shared loop.
+    """
+    def factory():
+        backend = _backend("async_database")
+        if backend is not None:
+            return backend
+        from astrapy import DataAPIClient
+        clientb = DataAPIClient(os.getenv("TOKEN"))
+        return clientb.get_async_database(os.getenv("DB_API_ENDPOINT"))
+    return _get("async_database", factory)
+
+
+def get_async_collection(name):
+    """
+    Args:
+        name (str): Collection name, e.g. "ARTICULATION_AGREEMENTS" or "GENERAL_ED".
+
+    Returns:
+        AsyncCollection: Shared async collection handle, created on first use.
+    """
+    return _get(f"async_collection:{name}", lambda: get_async_database().get_collection(name))
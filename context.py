@@ -0,0 +1,241 @@
+'''
+CONTEXT
+'''
+import os
+
+from catalog import COURSE_CODE_PATTERN, normalize_code
+
+try:
+    import tiktoken
+except ImportError:  # optional, the character heuristic is close enough for budgeting
+    tiktoken = None
+
+
+# Profile fields each agent actually reads, in prompt order
+    # the student's own name/GPA do not change course equivalencies, so the plan generators skip them
+AGENT_FIELDS = {
+    "advisorStep": ("name", "current_school", "major", "transfer_school", "gpa", "completed_courses", "goals", "notes", "education_plan"),
+    "transferAgent": ("current_school", "major", "transfer_school", "completed_courses", "notes", "education_plan"),
+    "transferAgentFIRST": ("current_school", "major", "transfer_school", "completed_courses", "notes"),
+}
+
+FIELD_LABELS = {
+    "name": "Name",
+    "current_school": "Current school",
+    "major": "Major",
+    "transfer_school": "Transfer schools",
+    "gpa": "GPA",
+    "completed_courses": "Completed courses",
+    "goals": "Goals",
+    "notes": "Notes",
+    "education_plan": "Current education plan",
+}
+
+# Prompt token budget for the context block of each agent (profile + agreements)
+AGENT_BUDGETS = {
+    "advisorStep": int(os.getenv("ADVISOR_CONTEXT_TOKENS", 2500)),
+    "transferAgent": int(os.getenv("TRANSFER_CONTEXT_TOKENS", 3000)),
+    "transferAgentFIRST": int(os.getenv("TRANSFER_FIRST_CONTEXT_TOKENS", 3000)),
+}
+
+# Agreement rows retrieved per question (retrieval.retrieve), 0 sends every row that fits the budget
+    # only the question answering agents retrieve, the plan generators need every required row
+AGENT_TOP_K = {
+    "advisorStep": int(os.getenv("ADVISOR_TOP_K", 12)),
+    "transferAgent": int(os.getenv("TRANSFER_TOP_K", 20)),
+}
+
+# Agreement rows that carry no articulation information
+UNARTICULATED_MARKERS = ("no course articulated", "not articulated", "no comparable course")
+
+_encodings = {}
+
+
+def count_tokens(text, model="gpt-4o"):
+    """
+    -Prompt tokens for a piece of text, with the model's tokenizer when tiktoken is installed.
+    -Falls back to ~4 characters per token, which tracks OpenAI's count closely for English prose.
+
+    Returns:
+        int: Token count.
+    """
+    text = text or ""
+    if tiktoken is not None:
+        encoding = _encodings.get(model)
+        if encoding is None:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("o200k_base")
+            _encodings[model] = encoding
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def as_items(value):
+    # Field value as a list of non blank, de-duplicated strings
+    values = value if isinstance(value, (list, tuple)) else [value]
+    return list(dict.fromkeys(str(item).strip() for item in values if item is not None and str(item).strip()))
+
+
+def profile_lines(student_profile, fields):
+    """
+    Serializes only the requested profile fields, skipping empty ones ([""], None) and repeated list items.
+
+    Returns:
+        list[str]: One "Label: value" line per scalar field, list fields as a header plus "- item" lines.
+    """
+    lines = []
+    for field in fields:
+        items = as_items(student_profile.get(field))
+        if not items:
+            continue
+        label = FIELD_LABELS.get(field, field)
+        if field in ("notes", "education_plan"):
+            lines.append(f"{label}:")
+            lines.extend(f"- {item}" for item in items)
+        else:
+            lines.append(f"{label}: {'; '.join(items)}")
+    return lines
+
+
+def _course_codes(texts):
+    return {normalize_code(match.group(0)) for text in texts for match in COURSE_CODE_PATTERN.finditer(str(text).upper())}
+
+
+def agreement_sections(articulation_agreement):
+    """
+    Splits agreement entries from get_articulation_agreement (or a text summary) into (title, rows) sections.
+    Placeholder entries ("No agreement for ...", query errors) become a section with no rows.
+
+    Returns:
+        list[tuple(str, list[str])]: Section title and its non blank agreement rows.
+    """
+    if isinstance(articulation_agreement, str):
+        # test.py's Step button hands the counselor a transferAgent summary instead of the raw agreements
+        return [("Transfer plan summary", [row.strip() for row in articulation_agreement.splitlines() if row.strip()])]
+    entries = articulation_agreement if isinstance(articulation_agreement, list) else [articulation_agreement or {}]
+    sections = []
+    for entry in entries:
+        for text, label in entry.items():
+            rows = [row.strip() for row in str(text).splitlines() if row.strip()]
+            if len(rows) <= 1 and (text.startswith("No agreement") or text.startswith("Error")):
+                sections.append((f"{text}: {label}", []))
+            else:
+                sections.append((str(label), rows))
+    return sections
+
+
+def trim_agreements(articulation_agreement, student_profile, budget, model="gpt-4o"):
+    """
+    -Keeps the agreement rows that matter for this student within a token budget.
+    -Duplicate rows and rows with nothing articulated are dropped, an agreement repeated
+        -under another transfer school is referenced instead of sent twice.
+    -Rows mentioning a course the student completed or planned are kept first,
+        -then the remaining articulated rows in agreement order until the budget runs out.
+
+    Args:
+        articulation_agreement (list[dict{str : str}]): Agreements from get_articulation_agreement.
+        student_profile (dict{str : *}): Student profile, completed_courses and education_plan mark relevant rows.
+        budget (int): Maximum tokens for the agreement text.
+        model (str): Model whose tokenizer is used.
+
+    Returns:
+        tuple(str, int): Agreement text and the number of rows left out.
+    """
+    known = _course_codes(as_items(student_profile.get("completed_courses")) + as_items(student_profile.get("education_plan")))
+    sections = agreement_sections(articulation_agreement)
+
+    # The same agreement text under several transfer schools is sent once
+    first_title, duplicates = {}, {}
+    for index, (title, rows) in enumerate(sections):
+        if rows:
+            duplicates[index] = first_title.setdefault("\n".join(rows), title)
+            if duplicates[index] == title:
+                del duplicates[index]
+
+    candidates = []
+    for index, (title, rows) in enumerate(sections):
+        if index in duplicates:
+            continue
+        seen = set()
+        for position, row in enumerate(rows):
+            key = row.lower()
+            if key in seen or any(marker in key for marker in UNARTICULATED_MARKERS):
+                continue
+            seen.add(key)
+            relevant = bool(_course_codes([row]) & known)
+            candidates.append((not relevant, index, position, row))
+
+    used = sum(count_tokens(title, model) + 1 for title, _ in sections)
+    kept = set()
+    for rank in sorted(candidates):
+        cost = count_tokens(rank[3], model) + 1
+        if used + cost > budget:
+            continue
+        used += cost
+        kept.add(rank[1:3])
+
+    lines = []
+    for index, (title, rows) in enumerate(sections):
+        if index in duplicates:
+            lines.append(f"{title}: same rows as {duplicates[index]}")
+            continue
+        lines.append(f"{title}:" if rows else title)
+        lines.extend(row for position, row in enumerate(rows) if (index, position) in kept)
+    return "\n".join(lines), len(candidates) - len(kept)
+
+
+def agreement_text(articulation_agreement):
+    """
+    Full agreement text, de-duplicated and without unarticulated rows, independent of any student.
+    Deterministic for the same agreement so it can sit in a cacheable prompt prefix.
+
+    Returns:
+        str: One titled block per agreement.
+    """
+    return trim_agreements(articulation_agreement, {}, budget=float("inf"))[0]
+
+
+def build_context(agent, student_profile, articulation_agreement=None, budget=None, model="gpt-4o", query=None):
+    """
+    -Compact context block for an agent's system prompt, replacing the interpolated profile dict repr
+        -and raw agreement list (which also repeated the notes and education plan).
+    -The profile is serialized first, the agreement rows fill whatever budget remains.
+    -If the profile takes more than half the budget, the oldest education plan lines are dropped.
+    -With a query, agents in AGENT_TOP_K first narrow the agreement to the rows most relevant to it
+        -and the student's courses (BM25, see retrieval.py).
+
+    Args:
+        agent (str): Key of AGENT_FIELDS / AGENT_BUDGETS, e.g. "advisorStep".
+        student_profile (dict{str : *}): Student profile.
+        articulation_agreement (list[dict{str : str}] | str): Agreements from get_articulation_agreement or a summary text, None for none.
+        budget (int): Token budget override.
+        model (str): Model whose tokenizer is used.
+        query (str): Message being answered, used to retrieve agreement rows.
+
+    Returns:
+        str: "Student profile:" and "Transfer agreements:" sections.
+    """
+    budget = AGENT_BUDGETS.get(agent, 3000) if budget is None else budget
+    plan = as_items(student_profile.get("education_plan"))
+    while True:
+        lines = profile_lines(dict(student_profile, education_plan=plan), AGENT_FIELDS[agent])
+        profile_text = "Student profile:\n" + "\n".join(lines)
+        if not plan or count_tokens(profile_text, model) <= budget // 2:
+            break
+        plan = plan[1:]
+
+    if articulation_agreement is None:
+        return profile_text
+    retrieved = 0
+    if query is not None and AGENT_TOP_K.get(agent):
+        from retrieval import retrieve
+        articulation_agreement, retrieved = retrieve(articulation_agreement, student_profile, query, AGENT_TOP_K[agent])
+    remaining = max(0, budget - count_tokens(profile_text, model))
+    agreement_text, omitted = trim_agreements(articulation_agreement, student_profile, remaining, model)
+    omitted += retrieved
+    context = f"{profile_text}\n\nTransfer agreements:\n{agreement_text}"
+    if omitted:
+        context += f"\n({omitted} less relevant agreement rows omitted)"
+    return context
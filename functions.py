@@ -1,46 +1,19 @@
-from openai import OpenAI
-import random
-import streamlit as st
 from data import *
 from pydantic import BaseModel
-from astrapy import DataAPIClient
-from astrapy import Database, Collection
-from itertools import product
-from dotenv import load_dotenv
+from catalog import general_ed_catalog
+from context import agreement_text, build_context, profile_lines
+from async_data import data_loop
+import agreements
+from llm import chat_create, chat_parse, chat_stream
+from profile_pool import profile_pool
+import hashlib
+import json
 import os
 
 
-client = OpenAI()
-
-# Load environment variables from the .env file
-load_dotenv()
-
-# Access the variables
-TOKEN = os.getenv("TOKEN")
-DB_API_ENDPOINT = os.getenv("DB_API_ENDPOINT")
-
-# Database keyspace name
-KEYSPACE_NAME = "test"
-
-# Access astrapy client using token
-clientb = DataAPIClient(TOKEN)
-
-# Explicit keyspace
-database = clientb.get_database(DB_API_ENDPOINT)
-
-# Getting collection from database
-collection = database.get_collection("ARTICULATION_AGREEMENTS")
-
-#Function for simulated student response
-'''
-Args:
-    prompt (str): message that is being responded to
-    profile (dict{str : *}): student profile to to give context to a system prompt dictating how a simulate student should act
-
-Returns: 
-    (str): response to prompt
-'''
-def student(prompt, student_profile):
+def _student_messages(prompt, student_profile, history=None):
+    # Shared prompt for the blocking and streaming student agents
+        # history (from memory.ConversationMemory) goes between the system prompt and the message being answered
     profile_description = (
         f"My name is {student_profile['name']}. "
         f"I am currently attending {student_profile['current_school']} with a GPA of {student_profile['gpa']}. "
@@ -49,16 +22,44 @@ def student(prompt, student_profile):
         f"Notes effecting my transfer proccess: {(', ').join(student_profile['notes'])}. My goals are {(', ').join(student_profile['goals'])}"
         f"My current planned courses {student_profile['education_plan']}"        
     )
-    completion = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
+    return [
             {"role": "system", "content": f"You are a student with the following profile: {profile_description}. Use this to inquire about your academic journey. Focus on your transfer journey. \
              Your are highly interested in building an educational plan. Focus on using your interests to decided on what courses to consider taking next. Focus on using the new insights to generate new branches of conversation. \
              Highest priorty. Test the counselor for knowledge of course equivalency."},
+            *(history or []),
             {"role": "user", "content": prompt}
         ]
+
+#Function for simulated student response
+'''
+Args:
+    prompt (str): message that is being responded to
+    profile (dict{str : *}): student profile to to give context to a system prompt dictating how a simulate student should act
+    history (list[dict{str : str}]): earlier conversation from ConversationMemory.history(..., "student"), None for none
+
+Returns: 
+    (str): response to prompt
+'''
+def student(prompt, student_profile, history=None):
+    response = chat_create(
+        model="gpt-4o",
+        name="student",
+        messages=_student_messages(prompt, student_profile, history)
+    )
+    return response
+
+def student_stream(prompt, student_profile, history=None):
+    '''
+    Streaming version of student, same prompt and cache.
+
+    Returns: 
+        (iterator[str]): response text deltas as they arrive
+    '''
+    return chat_stream(
+        model="gpt-4o",
+        name="student_stream",
+        messages=_student_messages(prompt, student_profile, history)
     )
-    return completion.choices[0].message.content
 
 def transferAgentFIRST(prompt, student_profile, articulation_agreement):
     '''
@@ -72,20 +73,21 @@ def transferAgentFIRST(prompt, student_profile, articulation_agreement):
         (str): response to prompt
     '''
     
-    completion = client.chat.completions.create(
+    response = chat_create(
         model="gpt-4o",
+        name="transferAgentFIRST",
         messages=[
             {"role": "system", "content": f"You are an education plan generator specializing in college transfer students. \
-            Using student profile as context: {student_profile}. \
-            Compare completed courses: {student_profile['completed_courses']} and transfer agreements: {articulation_agreement} \
+            Using the student profile below as context, compare their completed courses with the transfer agreement rows below. \
             Determine and inform the student of remaining courses needed to transfer and their relevant equivalent courses.\
             Present additonal transferable courses available for a complete and concise educational plan.\
-            Determine equivalent courses based off relevant transfer agreements."
+            Determine equivalent courses based off relevant transfer agreements.\n\n\
+{build_context('transferAgentFIRST', student_profile, articulation_agreement)}"
             },
             {"role": "user", "content": prompt}
         ]
     )
-    return completion.choices[0].message.content
+    return response
 
 def transferAgent(prompt, student_profile, articulation_agreement):
     '''
@@ -99,20 +101,21 @@ def transferAgent(prompt, student_profile, articulation_agreement):
         (str): response to prompt
     '''
     
-    completion = client.chat.completions.create(
+    response = chat_create(
         model="gpt-4o",
+        name="transferAgent",
         messages=[
             {"role": "system", "content": f"You are an education plan generator specializing in college transfer students. \
-            Using student profile as context: {student_profile}. \
-            Using {student_profile['education_plan']} and transfer agreements: {articulation_agreement} for questions regarding equivalent courses. \
+            Using the student profile below as context, use their current education plan and the transfer agreement rows below for questions regarding equivalent courses. \
              Help student with question regarding their education plan. Help students with questions regarding equivalent courses.\
-            Help students with discussions regarding additonal courses not currently in their education plan. Incorporate {student_profile['notes']}\
-            Determine equivalent courses based off relevant transfer agreements."
+            Help students with discussions regarding additonal courses not currently in their education plan. Incorporate the student's notes.\
+            Determine equivalent courses based off relevant transfer agreements.\n\n\
+{build_context('transferAgent', student_profile, articulation_agreement, query=prompt)}"
             },
             {"role": "user", "content": prompt}
         ]
     )
-    return completion.choices[0].message.content
+    return response
 
 def general_ed_planner(prompt, student_profile, course_list):
     '''
@@ -132,8 +135,9 @@ def general_ed_planner(prompt, student_profile, course_list):
     
     
     
-    completion = client.chat.completions.create(
+    response = chat_create(
         model="gpt-4o",
+        name="general_ed_planner",
         messages=[
             {"role": "system", "content": f"You are an education plan generator specializing in college transfer students. following transfer logic {transfer_logic} to assit in guidance \
             Compare completed courses: {student_profile['completed_courses']} and Admission Eligibility Course List: {course_list} \
@@ -146,31 +150,81 @@ def general_ed_planner(prompt, student_profile, course_list):
             {"role": "user", "content": prompt}
         ]
     )
-    return completion.choices[0].message.content
+    return response
 
-def advisorStep(prompt, student_profile, articulation_agreement):
+def _advisor_messages(prompt, student_profile, articulation_agreement, history=None):
+    # Shared prompt for the blocking and streaming counselor agents
+        # build_context sends only the fields the counselor reads and the agreement rows most relevant to the prompt
+        # history (from memory.ConversationMemory) goes between the system prompt and the message being answered
+    return [
+            {"role": "system", "content": f"You are an academic advisor specializing in helping transfer students. \
+            Using the student profile and transfer agreement information below as context\
+            help student with their academic plans and journey.\
+            Focus on intergrating the student's notes and their new educational plan. Determine equivalent courses based off relevant transfer agreements.\n\n\
+{build_context('advisorStep', student_profile, articulation_agreement, query=prompt)}"
+            },
+            *(history or []),
+            {"role": "user", "content": prompt}
+        ]
+
+def advisorStep(prompt, student_profile, articulation_agreement, history=None):
     '''
     Args:
         prompt (str): message that is being responded to
         profile (dict{str : *}): student profile to to give context to a system prompt dictating how a simulate student should act
         agreement (dict{str : str}): articulation agreement passed to give accurate transfer suggestions
             this will be pulled from a database, as the couselor is giving advice only they need this passed not the student
+        history (list[dict{str : str}]): earlier conversation from ConversationMemory.history(..., "counselor"), None for none
 
     Returns: 
         (str): response to prompt
     '''
-    completion = client.chat.completions.create(
+    response = chat_create(
         model="gpt-4o",
+        name="advisorStep",
+        messages=_advisor_messages(prompt, student_profile, articulation_agreement, history)
+    )
+    return response
+
+def advisorStep_stream(prompt, student_profile, articulation_agreement, history=None):
+    '''
+    Streaming version of advisorStep, same prompt and cache.
+
+    Returns: 
+        (iterator[str]): response text deltas as they arrive
+    '''
+    return chat_stream(
+        model="gpt-4o",
+        name="advisorStep_stream",
+        messages=_advisor_messages(prompt, student_profile, articulation_agreement, history)
+    )
+
+def summarize_conversation(summary, messages, max_tokens=300):
+    '''
+    -Folds messages leaving ConversationMemory's verbatim window into its rolling summary.
+    -Only the previous summary and the new messages are sent, so the call stays the same size however long the conversation runs.
+
+    Args:
+        summary (str): Current summary, "" for none.
+        messages (list[dict{str : str}]): Session messages ("user" is the student, "assistant" the counselor).
+        max_tokens (int): Length limit for the new summary.
+
+    Returns: 
+        (str): updated summary
+    '''
+    transcript = "\n".join(f"{'Student' if m['role'] == 'user' else 'Counselor'}: {m['content']}" for m in messages)
+    response = chat_create(
+        model="gpt-4o",
+        name="summarize_conversation",
+        max_tokens=max_tokens,
         messages=[
-            {"role": "system", "content": f"You are an academic advisor specializing in helping transfer students. \
-            Using a student profile: {student_profile} and a summarized student education plan {articulation_agreement} as context\
-            help student with their academic plans and journey.\
-            Focus on intergrating {student_profile['notes']} and their new educational plan. Determine equivalent courses based off relevant transfer agreements."
-            },
-            {"role": "user", "content": prompt}
+            {"role": "system", "content": f"You maintain a running summary of a conversation between a transfer student and an academic counselor. \
+            Update the summary with the new messages. Keep courses discussed, equivalencies, decisions, open questions and the student's concerns. \
+            Reply with the summary only, at most {max_tokens} tokens."},
+            {"role": "user", "content": f"Current summary: {summary or 'None yet.'}\n\nNew messages:\n{transcript}"}
         ]
     )
-    return completion.choices[0].message.content
+    return response
 
 def initialize_student_profile():
     """
@@ -200,7 +254,20 @@ class profileGenerator(BaseModel):
     notes: list[str]
 
 
-def generate_field_via_gpt(student_profile):
+def _profile_field_messages(student_profile):
+    context_description = (
+        f"My name is {student_profile['name']}. "
+        f"I am attending {student_profile['current_school']} with a GPA of {student_profile['gpa']}. "
+        f"My major is {student_profile['major']}, and I plan to transfer to {', '.join(student_profile['transfer_school'])}."
+    )
+    return [
+            {"role": "system", "content": "You are an expert at profile field generation. You will \
+                                        be given college student profile, generate notes as the student \
+                                        that are effecting your transfer proccess, such as challenges and motivations into the given structure. Limit 3 strings"},
+            {"role": "user", "content": context_description}
+        ]
+
+def generate_field_via_gpt(student_profile, use_cache=True):
     
     """
     - OpenAI model generates randomized open ended text fields with relevant responses 
@@ -210,81 +277,54 @@ def generate_field_via_gpt(student_profile):
     
     Args:
         student_profile (dict): Student profile context for generating "In Character" fields
+        use_cache (bool): Set False for a fresh sample, profile_pool.py does so every pool entry differs
         
     Returns:
         dict: A dictionary containing the randomized student profile adhering to pydantic schema to ensure strucuted output.
     """
     
-    context_description = (
-        f"My name is {student_profile['name']}. "
-        f"I am attending {student_profile['current_school']} with a GPA of {student_profile['gpa']}. "
-        f"My major is {student_profile['major']}, and I plan to transfer to {', '.join(student_profile['transfer_school'])}."
-    )
-
-    completion = client.beta.chat.completions.parse(
+    # The context description is the user message (it used to be built and then "..." sent instead)
+    response = chat_parse(
         
         model="gpt-4o-2024-08-06",
-        messages=[
-            {"role": "system", "content": "You are an expert at profile field generation. You will \
-                                        be given college student profile, generate notes as the student \
-                                        that are effecting your transfer proccess, such as challenges and motivations into the given structure. Limit 3 strings"},
-            {"role": "user", "content": "..."}
-        ],
+        name="generate_field_via_gpt",
+        messages=_profile_field_messages(student_profile),
+        use_cache=use_cache,
     response_format=profileGenerator,
 )
 
-    return completion.choices[0].message.parsed
+    return response
   
-def initialize_random_profile():
+def initialize_random_profile(block=False):
     """
     -Unitializes a random student profile with fields populated using ChatGPT.
     -This is used to test random scenarios and simulate Student profiles and testing.
     -Easier randomized data field entries such as pick a selection from a list randomly 
         -are handled here to prevent unnecessary LLM processing in needing to do such.
-    -Utilizes the generate_field_via_gpt function for randomized text entries.
+    -Notes come from the pre-generated profile pool (generate_field_via_gpt output, see profile_pool.py),
+        -so the first page load does not wait on the model.
+    -The randomized fields are the ones the pool entry's notes were generated for, so they never contradict the notes.
     
     Args:
-        None
+        block (bool): If the pool is empty, generate notes now instead of using a static fallback set
         
     Returns:
         dict: A dictionary containing the randomized student profile.
     """
-    # Basic randomized fields
-    random_name = random.choice(["Aisha Jamal", "John Doe", "Emily Nguyen", "Carlos Perez"])
-    random_school = random.choice(schools)
-    random_gpa = round(random.uniform(0.0, 4.0), 2)
-    random_major = random.choice(majors)
-    random_transfer_schools = random.sample(schools, 2)
-    random_goal= "Transfer"
-
-    
-    # Context for field generation
-        # Consdier removing as we dont use this as context
-    profile_context = {
-        "name": random_name,
-        "current_school": random_school,
-        "gpa": random_gpa,
-        "major": random_major,
-        "transfer_school": random_transfer_schools,
-        "goal": random_goal
-    }
-
-    # Generate text fields using ChatGPT
-    fields = generate_field_via_gpt(profile_context)
-
-
-    # Assign the indvidual generated text fields
-    notes = fields.notes
+    # Draw pre-generated text fields with the basic randomized fields they were written for (profile_pool.random_context)
+        # a background refill keeps the pool topped up
+    entry = profile_pool.take(block=block)
+    context = entry["context"]
 
     # Return the randomized profile
     return {
-        "name": random_name,
-        "current_school": random_school,
-        "gpa": random_gpa,
-        "major": random_major,
-        "transfer_school": random_transfer_schools,
-        "notes": notes,
-        "goals": random_goal,
+        "name": context["name"],
+        "current_school": context["current_school"],
+        "gpa": context["gpa"],
+        "major": context["major"],
+        "transfer_school": list(context["transfer_school"]),
+        "notes": entry["notes"],
+        "goals": context["goal"],
         "completed_courses": ["CPSC-42", "CPSC-14", "MATH -04A"]
     }
 
@@ -292,37 +332,93 @@ def initialize_random_profile():
 def display_message(role, content, avatar):
     """
     Organizes a streamlit chat container, utlizing columns to display a message with corresponding avatars and content.
+    Content can also be a stream of text deltas (e.g. from advisorStep_stream), which is rendered as it grows.
 
     Args:
         role (str): Role of the speaker ('Student' or 'Counselor').
-        content (str): Content of the message to be displayed.
+        content (str | iterator[str]): Content of the message to be displayed.
         avatar (str): Path to the avatar image.
         
-    Return: Void display organization only
+    Return:
+        str: Full message text, so streamed messages can be appended to st.session_state.messages
     """
+    # Imported here so headless tools (benchmarks, batch runs) can import functions without streamlit
+    import streamlit as st
+
     if role == "user":
         col1, col2 = st.columns([0.9, 0.1])
-        # Avatar on the right
-        with col2:
-            st.image(avatar, width=40)
-        # Message content on the left
-        with col1:
-            st.markdown(f"**Student:** \n\n{content.strip()}")
+        avatar_col, text_col, label = col2, col1, "Student"
     # For 'Counselor'
     else: 
         col1, col2 = st.columns([0.1, 0.9])
-        # Avatar on the left
-        with col1:
-            st.image(avatar, width=40)
-        # Message content on the right
-        with col2:
-            st.markdown(f"**Counselor:** \n\n{content.strip()}")
+        avatar_col, text_col, label = col1, col2, "Counselor"
+    # Avatar on the right for students, left for counselors
+    with avatar_col:
+        st.image(avatar, width=40)
+    # Message content on the opposite side
+    with text_col:
+        if isinstance(content, str):
+            st.markdown(f"**{label}:** \n\n{content.strip()}")
+        else:
+            st.markdown(f"**{label}:**")
+            content = st.write_stream(content)
     # Line divider
     st.divider()
+    return content.strip()
+    
+    
+class PlanAccumulator:
+    """
+    - Collects completed/planned units per course column wise for the education plan bar chart.
+    - Rows are plain list appends and the DataFrame is built once per render, instead of a
+        -pd.concat per course (quadratic in plan length) and a new st.bar_chart per row.
+    """
+    
+    # Chart colors for completed and planned units
+    COLORS = ['#0066b9', '#ffb500']
+    
+    def __init__(self):
+        self.courses = []
+        self.completed = []
+        self.planned = []
     
+    def add(self, course, completed=0, planned=0):
+        self.courses.append(course)
+        self.completed.append(completed)
+        self.planned.append(planned)
     
+    def add_completed(self, course, units):
+        self.add(course, completed=units)
+    
+    def add_planned(self, course, units):
+        self.add(course, planned=units)
+    
+    def __len__(self):
+        return len(self.courses)
+    
+    def to_frame(self):
+        """
+        Returns:
+            pd.DataFrame: completed, planned and Courses columns.
+        """
+        import pandas as pd
+        return pd.DataFrame({'completed': self.completed, 'planned': self.planned, 'Courses': self.courses})
+    
+    def render(self, placeholder):
+        """
+        Draws the chart into a placeholder (st.empty() or a container), replacing what was there.
+        
+        Args:
+            placeholder: Streamlit element exposing bar_chart.
+        """
+        return placeholder.bar_chart(self.to_frame(),
+                                     y=['completed', 'planned'], y_label="Units",
+                                     x="Courses",
+                                     color=self.COLORS)
+
+
 # Function to get articulation agreements from a database
-def get_articulation_agreement(current_school, transfer_school, major):
+def get_articulation_agreement(current_school, transfer_school, major, use_cache=True, batched=True):
     """
     -Retrieves specific articulation agreements based on Student entered data fields in Streamlit.
     -Front End data entry ensure we pass the correct context to the LLM and bypasses unstrucuted conversational parsing .
@@ -332,64 +428,37 @@ def get_articulation_agreement(current_school, transfer_school, major):
         -Perhaps this is an area where our methods show improvements on traditional methods 
             -so I think we want a limit on multiple agreements rather than stopping multiple agreements.
         -Limits of this method include the complex scneraio of a student attenting two current schools.
+    -Blocking front end for agreements.get_articulation_agreement, run on async_data's shared loop
+        -(agreements.agreement_cache, batched $in query for cache misses, failed queries never cached).
     
         Args:
         current_school (str): A Students current school.
         transfer_school (list[str]): A Student's desired transfer school(s).
         major (str): A student's desired major(s).
+        use_cache (bool): Set False to skip the cache and always query the database.
+        batched (bool): Set False to fall back to one query per (transfer_school, major) pair.
         
         Return (dict{str : str}): A dictionary is returned with an articulation agreement key and a database query value
             If no agreement is found, such key is appened instead of an articulation agreement 
     """
-    
-    test =[]
-    
-    # Ensure `incoming` and `major` are lists for proccessing
-    transfer_school_list = transfer_school if isinstance(transfer_school, list) else [transfer_school]
-    major_list = major if isinstance(major, list) else [major]
+    return data_loop.run(agreements.get_articulation_agreement(current_school, transfer_school, major, use_cache, batched))
 
-    # Query for each combination
-    for transfer_school, major_item in product(transfer_school_list, major_list):
-        query = {
-            "$and": [
-                {"transfer_school": transfer_school},
-                {"current_school": current_school},
-                {"major": major_item}
-            ]
-        }
-        try:
-            # Execute query
-            results = collection.find(query, projection={
-                "transfer_school": True,
-                "current_school": True,
-                "major": True,
-                "agreement": True
-            })
 
-            # Flag for indicating if an agreement was found 
-            found = False
-            # Iterate through results
-            for result in results:
-                found = True
-                text = result.get('agreement', 'No description available')
-                test.append({
-                    text: f"{result['current_school']} to {result['transfer_school']} for {result['major']}"
-                })
-            
-            # If no results were found
-            if not found:
-                test.append({
-                    f"No agreement for {transfer_school}": f"{current_school} with major {major_item}"
-                })
+def get_general_ed_course_list(current_school):
+    """
+    -Returns the UC Transfer Admission Eligibility course list for a student's current school.
+    -Served from the in-memory GENERAL_ED catalog (loaded once, refreshed periodically) rather than a full collection scan.
+    -Independent of the articulation agreement so the planning pipeline fetches both at the same time.
+    
+    Args:
+        current_school (str): A Students current school.
+    
+    Returns:
+        str: Course list text for the general education planner.
+    """
+    return general_ed_catalog.course_list(current_school)
 
-        except Exception as e:
-            # Handle query exceptions
-            test.append({
-                "Error querying articulation agreements": 
-                f"Query failed for {transfer_school} to {current_school} with major {major_item}: {e}"
-            })
 
-    return test
 
 
 
@@ -422,6 +491,20 @@ class GeneralEdGenerator(BaseModel):
     completed_courses: list[Course]
     total_units: float
 # General Ed Planner     
+def _general_ed_messages(prompt, course_list, current_plan):
+    # Shared by general_ed_planner2 and batch.py so interactive and bulk requests send the same prompt
+    transfer_logic="Complete the following seven-course pattern requirement, earning a grade of C or better in each course: Two transferable college courses (3 semester or 4-5 quarter units each) \
+    in English composition (Area UC-E), and One transferable college course (3 semester or 4-5 quarter units) in mathematical concepts and quantitative reasoning (Area UC-M), and; Four transferable \
+    college courses (3 semester or 4-5 quarter units each) chosen from at least two of the following subject areas: the arts and humanities (Area UC-H), the social and behavioral sciences (Area UC-B),\
+    and the physical and biological sciences (Area UC-S). Courses may be double counted once per course if the major course satisfies a general education area. This goes for completed courses and also future planned courses."
+    
+    return [
+            {"role": "system", "content": f"You are an education plan generator specializing in college transfer students. following transfer logic {transfer_logic}  assit in building a general education plan. \
+            Use currentPlan{current_plan} courses to search Admission Eligibility Course List: {course_list} fill any aplicable spots. Apply correct uc areas Fill any remaning with approptiate courses from Admission Eligibility Course List: {course_list}. Priotize using completed courses for requirments if applicable."
+            },
+            {"role": "user", "content": prompt}
+        ]
+
 def general_ed_planner2(prompt, student_profile, course_list,current_plan):
     '''
     Args:
@@ -433,23 +516,37 @@ def general_ed_planner2(prompt, student_profile, course_list,current_plan):
     Returns: 
         (str): response to prompt
     '''
-    transfer_logic="Complete the following seven-course pattern requirement, earning a grade of C or better in each course: Two transferable college courses (3 semester or 4-5 quarter units each) \
-    in English composition (Area UC-E), and One transferable college course (3 semester or 4-5 quarter units) in mathematical concepts and quantitative reasoning (Area UC-M), and; Four transferable \
-    college courses (3 semester or 4-5 quarter units each) chosen from at least two of the following subject areas: the arts and humanities (Area UC-H), the social and behavioral sciences (Area UC-B),\
-    and the physical and biological sciences (Area UC-S). Courses may be double counted once per course if the major course satisfies a general education area. This goes for completed courses and also future planned courses."
-    
-    
-    completion = client.beta.chat.completions.parse(
+    response = chat_parse(
         model="gpt-4o",
+        name="general_ed_planner2",
+        messages=_general_ed_messages(prompt, course_list, current_plan),
+        response_format=GeneralEdGenerator
+    )
+    return response
+
+def explain_general_ed_plan(student_profile, gen_ed_plan):
+    '''
+    Optional plain language explanation of a general education plan built by the local seven-course pattern solver.
+    The plan itself is computed without the LLM, this only writes the accompanying text.
+
+    Args:
+        student_profile (dict{str : *}): student profile for context
+        gen_ed_plan (GeneralEdGenerator): plan to explain
+
+    Returns: 
+        (str): explanation of how the plan satisfies the seven-course pattern
+    '''
+    response = chat_create(
+        model="gpt-4o",
+        name="explain_general_ed_plan",
         messages=[
-            {"role": "system", "content": f"You are an education plan generator specializing in college transfer students. following transfer logic {transfer_logic}  assit in building a general education plan. \
-            Use currentPlan{current_plan} courses to search Admission Eligibility Course List: {course_list} fill any aplicable spots. Apply correct uc areas Fill any remaning with approptiate courses from Admission Eligibility Course List: {course_list}. Priotize using completed courses for requirments if applicable."
+            {"role": "system", "content": "You are an academic advisor for college transfer students. Briefly explain how the given general education plan \
+            satisfies the UC seven-course pattern (two UC-E, one UC-M, four from at least two of UC-H, UC-B and UC-S), noting double counted courses."
             },
-            {"role": "user", "content": prompt}
-        ],
-        response_format=GeneralEdGenerator
+            {"role": "user", "content": f"Completed courses: {student_profile['completed_courses']}. Plan: {gen_ed_plan.model_dump_json()}"}
+        ]
     )
-    return completion.choices[0].message.parsed
+    return response
 
 # Pydantic Structured Output
 class MajorEdGenerator(BaseModel):
@@ -466,6 +563,46 @@ class MajorEdGenerator(BaseModel):
     total_units: float
     
 
+# UC Merced Computer Science and Engineering, B.S. transfer requirements (major preparation)
+    # shared by the major planner prompt and the local articulation rule engine
+MAJOR_TRANSFER_LOGIC=("Thank you for your interest in UC Merced! For admission to the Computer Science and Engineering, B.S. major, students must earn an overall transferrable GPA of 2.4 or better, and complete classes articulated with the following UC Merced courses by the end of spring term prior to fall enrollment or by the end of fall term prior to spring enrollment. For Admission purposes all major preparation courses require a 'C' or better. REQUIRED major preparation courses: CSE 022, a grade of B or better must be earned. CSE 030, MATH 021, MATH 022, MATH 023, MATH 024 PHYS 008 & PHYS 008L PHYS 009 & PHYS 009L, WRI 001 and WRI 010 Additional Major Preparation Recommended Prior to Transfer: CSE 015, CSE 022*, CSE 024*, CSE 030*, CSE 031, ENGR 065, ENGR 091, MATH 032, or ENGR 80 *Dual Counting between CSE 022 and CSE 024 is permissible granted that the same course articulation exist for all sending courses. AP Exam Score & Course Exemptions An AP Computer Science: Comp Science A score of 5 exempts CSE 022 An AP Mathematics: Calculus AB score of 4 or 5 exempts MATH 021 An AP Mathematics: Calculus BC score of 3 exempts MATH021 An AP Mathematics: Calculus BC score of 4 or 5 exempts MATH 021 and MATH 022 An AP Mathematics: Calculus BC Subscore AB score 3 or higher exempts MATH 021 An AP Physics: Physics C: Mechanics: score of 5 exempts PHYS 008 and PHYS 008L UC Merced Advance Placement (AP) and International Baccalaureate (IB) credit policies are detailed in the link below: Advance Placement (AP) and International Baccalaureate (IB) Examinations")
+
+# Static instructions for the major planning agents
+    # kept free of any per student data so the system prompt is a byte identical prefix across requests
+TRANSFER_PLAN_INSTRUCTIONS = ("You are an education plan generator specializing in college transfer students following the transfer logic below. "
+    "Using the student's completed courses and the articulation agreements below, build an education plan of remaining required courses for transfer, "
+    "and provide UC equivalent courses. If a completed course satisfies a required transfer course we dont need to fill the area. "
+    "If the student already has an education plan, use their request to refine it.")
+
+TRANSFER_CHECK_INSTRUCTIONS = ("You are to critque the student schedule given in the student message, ensure it follows the transfer logic below. "
+    "Using the transfer agreements below make sure we have met transfer requiremnets. "
+    "Courses can not be combined as one. Seperate any combined course entries into indvidual course entries. Remove recommend courses we only want required. "
+    "If all required courses are not found use the transfer agreements and the student's completed courses to fill. Base any additons around sending_Institution. "
+    "If no changes are made then suggest the original schedule. In addition to any changes suggest any non changes from the orignal plan as well.")
+
+
+def _transfer_messages(instructions, prompt, student_profile, articulation_agreement, schedule=None):
+    """
+    -Prompt layout for the major planning agents that lets provider side prompt caching work:
+        -system message: instructions + MAJOR_TRANSFER_LOGIC + agreement text, identical for every request
+            -with the same agreement, so repeated plan generations reuse the cached prefix
+        -user message: per request data (completed courses, current plan, schedule, prompt) last
+    -Caching applies once the shared prefix passes the provider minimum (1024 tokens for OpenAI).
+
+    Returns:
+        list[dict{str : str}]: Chat messages.
+    """
+    prefix = f"{instructions}\n\nTransfer logic:\n{MAJOR_TRANSFER_LOGIC}\n\nArticulation agreements:\n{agreement_text(articulation_agreement)}"
+    volatile = profile_lines(student_profile, ("completed_courses", "education_plan"))
+    if schedule is not None:
+        volatile.append(f"Schedule to critique:\n{schedule}")
+    volatile.append(f"Request: {prompt}")
+    return [
+        {"role": "system", "content": prefix},
+        {"role": "user", "content": "\n".join(volatile)},
+    ]
+
+
 # Pydantic Structured Output
 class CourseData(BaseModel):
     sending_Institution_course: str
@@ -494,23 +631,13 @@ def transferAgent2(prompt, student_profile, articulation_agreement):
         (str): response to prompt
     '''
     
-    transfer_logic=(f"Thank you for your interest in UC Merced! For admission to the Computer Science and Engineering, B.S. major, students must earn an overall transferrable GPA of 2.4 or better, and complete classes articulated with the following UC Merced courses by the end of spring term prior to fall enrollment or by the end of fall term prior to spring enrollment. For Admission purposes all major preparation courses require a 'C' or better. REQUIRED major preparation courses: CSE 022, a grade of B or better must be earned. CSE 030, MATH 021, MATH 022, MATH 023, MATH 024 PHYS 008 & PHYS 008L PHYS 009 & PHYS 009L, WRI 001 and WRI 010 Additional Major Preparation Recommended Prior to Transfer: CSE 015, CSE 022*, CSE 024*, CSE 030*, CSE 031, ENGR 065, ENGR 091, MATH 032, or ENGR 80 *Dual Counting between CSE 022 and CSE 024 is permissible granted that the same course articulation exist for all sending courses. AP Exam Score & Course Exemptions An AP Computer Science: Comp Science A score of 5 exempts CSE 022 An AP Mathematics: Calculus AB score of 4 or 5 exempts MATH 021 An AP Mathematics: Calculus BC score of 3 exempts MATH021 An AP Mathematics: Calculus BC score of 4 or 5 exempts MATH 021 and MATH 022 An AP Mathematics: Calculus BC Subscore AB score 3 or higher exempts MATH 021 An AP Physics: Physics C: Mechanics: score of 5 exempts PHYS 008 and PHYS 008L UC Merced Advance Placement (AP) and International Baccalaureate (IB) credit policies are detailed in the link below: Advance Placement (AP) and International Baccalaureate (IB) Examinations")
-
-    completion = client.beta.chat.completions.parse(
+    response = chat_parse(
         model="gpt-4o",
-        messages=[
-            {"role": "system", "content": f"You are an education plan generator specializing in college transfer students following transfer logic {transfer_logic}. \
-            using completed courses: {student_profile['completed_courses']} and articulation agreements: {articulation_agreement} \
-            build an education plan of remaing required courses for transfer, and providing  uc equivalent courses.\
-            if a {student_profile['completed_courses']} satisfies a required transfer we dont need to fill the area.\
-            if {student_profile['education_plan']} is already built use {prompt} to refine.\
-          "
-            },
-            {"role": "user", "content": prompt}
-        ],
+        name="transferAgent2",
+        messages=_transfer_messages(TRANSFER_PLAN_INSTRUCTIONS, prompt, student_profile, articulation_agreement),
         response_format=EdPlan
     )
-    return completion.choices[0].message.parsed
+    return response
 # Major check
 def transferAgentCheck(prompt, student_profile, articulation_agreement,schedule):
     '''
@@ -524,22 +651,12 @@ def transferAgentCheck(prompt, student_profile, articulation_agreement,schedule)
         (str): response to prompt
     '''
     
-    transfer_logic=(f"Thank you for your interest in UC Merced! For admission to the Computer Science and Engineering, B.S. major, students must earn an overall transferrable GPA of 2.4 or better, and complete classes articulated with the following UC Merced courses by the end of spring term prior to fall enrollment or by the end of fall term prior to spring enrollment. For Admission purposes all major preparation courses require a 'C' or better. REQUIRED major preparation courses: CSE 022, a grade of B or better must be earned. CSE 030 MATH 021 MATH 022 MATH 023 MATH 024 PHYS 008 & 008L PHYS 009 & 009L, WRI 001 and WRI 010 Additional Major Preparation Recommended Prior to Transfer: CSE 015, CSE 022*, CSE 024*, CSE 030*, CSE 031 ENGR 065 ENGR 091 MATH 032 or ENGR 080 *Dual Counting between CSE 022 and CSE 024 is permissible granted that the same course articulation exist for all sending courses. AP Exam Score & Course Exemptions An AP Computer Science: Comp Science A score of 5 exempts CSE 022 An AP Mathematics: Calculus AB score of 4 or 5 exempts Math 021 An AP Mathematics: Calculus BC score of 3 exempts MATH 021 An AP Mathematics: Calculus BC score of 4 or 5 exempts Math 021 and Math 022 An AP Mathematics: Calculus BC Subscore AB score 3 or higher exempts Math 021 An AP Physics: Physics C: Mechanics: score of 5 exempts PHYS 008 and PHYS 008L UC Merced Advance Placement (AP) and International Baccalaureate (IB) credit policies are detailed in the link below: Advance Placement (AP) and International Baccalaureate (IB) Examinations")
-
-    completion = client.beta.chat.completions.parse(
+    response = chat_create(
         model="gpt-4o",
-        messages=[
-            {"role": "system", "content": f"You are to critque a student schedule {schedule}, ensure it follows {transfer_logic}. \
-            using transfer agreements: {articulation_agreement} make sure we have met transfer requiremnets. \
-            Courses can not be combined as one. Seperate any combined course entries into indvidual course entries. Remove recommend courses we only want required. If all required courses are not found use transfer agreements {student_profile['completed_courses']} to fill. Base any additons around sending_Institution. In no changes are made then suggest {schedule}. \
-            in addition to any changes suggest any non changes from the orignal plan as well.\
-          "
-            },
-            {"role": "user", "content": prompt}
-        ],
-        
+        name="transferAgentCheck",
+        messages=_transfer_messages(TRANSFER_CHECK_INSTRUCTIONS, prompt, student_profile, articulation_agreement, schedule),
     )
-    return completion.choices[0].message.content
+    return response
 
 
 # Pydantic Structured Output    
@@ -561,8 +678,9 @@ def scheduleGlue(prompt, student_profile, plan):
         (str): response to prompt
     '''
 
-    completion = client.beta.chat.completions.parse(
+    response = chat_parse(
         model="gpt-4o",
+        name="scheduleGlue",
         messages=[
             {"role": "system", "content": f"Remove duplicate entries from the education plan{plan} ensuring courses only appear once in our educational plan.\
           "
@@ -571,5 +689,51 @@ def scheduleGlue(prompt, student_profile, plan):
         ],
         response_format=FinalEdPlan
     )
-    return completion.choices[0].message.parsed
+    return response
+
+
+def describe_course(course, label="Course"):
+    """
+    Formats a CourseData row the same way for display and for the education plan passed as LLM context.
+    
+    Args:
+        course (CourseData): Course row from an EdPlan.
+        label (str): Leading label, e.g. "Course" or "Completed Course".
+        
+    Returns:
+        str: Single line course description.
+    """
+    return (f"{label}: {course.sending_Institution_course} {course.sending_Institution_course_title} "
+            f"Units: {course.units}; articulated by {course.receiving_Institution_course}")
+
 
+def hash_inputs(*parts):
+    """
+    -Stable hash of arbitrary JSON-like inputs (dicts, lists, strings, pydantic models via str).
+    -Used as a session state key so expensive LLM pipelines only rerun when their inputs change.
+    
+    Returns:
+        str: sha256 hex digest.
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Profile fields that feed the transfer planning pipeline
+    # education_plan and goals are left out as they are rewritten on every rerun
+PLAN_PROFILE_FIELDS = ("name", "current_school", "gpa", "major", "transfer_school", "notes", "completed_courses")
+
+
+def transfer_plan_key(prompt, student_profile):
+    """
+    -Hash of the inputs of pipeline.build_transfer_plan, computed without fetching the agreement
+        -so the pipeline's agreement lookup can run alongside its other fetches.
+    -The agreement is identified by (current_school, transfer_school, major) in the profile fields,
+        -its version by agreements.agreement_generation, which changes when this process ingests, compiles,
+        -syncs or invalidates agreements. Agreements edited by another process count once a replica sync brings them in.
+
+    Returns:
+        str: Hash of the prompt, the planning profile fields and the agreement generation.
+    """
+    profile_fields = {field: student_profile.get(field) for field in PLAN_PROFILE_FIELDS}
+    return hash_inputs(prompt, profile_fields, agreements.agreement_generation())
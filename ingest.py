@@ -0,0 +1,324 @@
+'''
+INGEST
+'''
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator
+
+from catalog import normalize_code
+from clients import get_collection
+from ratelimit import backoff_delay
+from replica import invalidate_caches, replica
+
+
+class AgreementRecord(BaseModel):
+    """
+    One ARTICULATION_AGREEMENTS document, the fields get_articulation_agreement reads.
+    """
+    model_config = ConfigDict(str_strip_whitespace=True, str_min_length=1)
+
+    current_school: str
+    transfer_school: str
+    major: str
+    agreement: str
+
+
+class GeneralEdRecord(BaseModel):
+    """
+    One GENERAL_ED course row, the fields the catalog reads (catalog._load_general_ed).
+    """
+    model_config = ConfigDict(str_strip_whitespace=True, str_min_length=1)
+
+    school: str
+    course_code: str
+    course_title: str
+    uc_areas: str
+    semester_units: str
+    # The catalog only loads rows tagged "four" (UC transfer admission eligibility courses)
+    course: str = "four"
+
+    @field_validator("semester_units", mode="before")
+    @classmethod
+    def _units_text(cls, value):
+        # CSV exports and hand written JSON disagree on numbers vs strings, the catalog parses the text
+        return value if isinstance(value, str) else str(value)
+
+
+def _agreement_key(record):
+    return (record.current_school, record.transfer_school, record.major)
+
+
+def _general_ed_key(record):
+    return (record.school, normalize_code(record.course_code))
+
+
+@lru_cache(maxsize=1)
+def _agreement_rules():
+    from articulation import _default_rules
+    return _default_rules()
+
+
+def _agreement_extras(record):
+    # Parsed once here so readers never have to interpret the text (articulation.py)
+    from articulation import ARTICULATION_TABLE_VERSION, parse_agreement
+    rows = parse_agreement(record.agreement, _agreement_rules())
+    return {"articulation_table": [row.model_dump() for row in rows], "articulation_table_version": ARTICULATION_TABLE_VERSION}
+
+
+# Source kinds: target collection, record schema, natural key (dedupe and _id), extra fields computed at ingestion
+INGEST_KINDS = {
+    "agreements": ("ARTICULATION_AGREEMENTS", AgreementRecord, _agreement_key, _agreement_extras),
+    "general_ed": ("GENERAL_ED", GeneralEdRecord, _general_ed_key, None),
+}
+
+
+def read_records(path):
+    """
+    Streams a source file one record at a time, JSON lines or CSV with a header row.
+
+    Yields:
+        tuple(int, dict | None, str | None): Line number, raw record, parse error.
+    """
+    with open(path, encoding="utf-8", newline="") as source:
+        if path.lower().endswith(".csv"):
+            # Header is line 1, so the first record is line 2
+            for line_number, row in enumerate(csv.DictReader(source), start=2):
+                yield line_number, row, None
+            return
+        for line_number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line), None
+            except ValueError as error:
+                yield line_number, None, f"invalid JSON: {error}"
+
+
+def document_id(key):
+    # Same natural key -> same _id, so a re-run never creates a second copy of a document
+    return hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+
+
+def _is_duplicate(error):
+    # Data API "DOCUMENT_ALREADY_EXISTS", as text or as error descriptors
+    codes = [getattr(descriptor, "error_code", None) for descriptor in getattr(error, "error_descriptors", None) or []]
+    return "DOCUMENT_ALREADY_EXISTS" in codes or "DOCUMENT_ALREADY_EXISTS" in str(error)
+
+
+class Ingestor:
+    """
+    - Loads a source file into ARTICULATION_AGREEMENTS or GENERAL_ED.
+    - Records are streamed, validated with pydantic (failures go to a rejects file), deduplicated on their
+        -natural key, given a deterministic _id and an `updated_at` stamp, and written in batches of
+        -`batch_size` with unordered insert_many, at most `concurrency` batches in flight.
+    - A checkpoint file records the last source line below which every batch is written,
+        -so an interrupted load resumes there. Documents that already exist (same _id) are skipped,
+        -or overwritten with update=True.
+
+    Args:
+        kind (str): Key of INGEST_KINDS.
+        source (str): JSONL or CSV file.
+        batch_size (int): Documents per insert_many call (the Data API takes up to 100 per request).
+        concurrency (int): Batches written at once.
+        checkpoint (str): Checkpoint path, defaults to "<source>.checkpoint.json".
+        rejects (str): Rejected records path, defaults to "<source>.rejects.jsonl".
+        update (bool): Overwrite existing documents instead of skipping them.
+        retries (int): Attempts per batch on errors other than duplicates.
+    """
+
+    def __init__(self, kind, source, batch_size=100, concurrency=8, checkpoint=None, rejects=None, update=False, retries=4):
+        self.kind = kind
+        self.collection_name, self.schema, self.key, self.extras = INGEST_KINDS[kind]
+        self.source = source
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.checkpoint = checkpoint or f"{source}.checkpoint.json"
+        self.rejects = rejects or f"{source}.rejects.jsonl"
+        self.update = update
+        self.retries = retries
+        self.stats = {"line": 0, "read": 0, "inserted": 0, "updated": 0, "existing": 0, "duplicates": 0, "rejected": 0}
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint):
+            return
+        with open(self.checkpoint, encoding="utf-8") as checkpoint_file:
+            state = json.load(checkpoint_file)
+        # Only the position carries over, the counters describe this run
+        if state.get("source") == os.path.abspath(self.source) and state.get("kind") == self.kind:
+            self.stats["line"] = state["stats"]["line"]
+
+    def _save_checkpoint(self, done=False):
+        temporary = f"{self.checkpoint}.tmp"
+        with open(temporary, "w", encoding="utf-8") as checkpoint_file:
+            json.dump({"source": os.path.abspath(self.source), "kind": self.kind, "done": done, "stats": self.stats}, checkpoint_file)
+        os.replace(temporary, self.checkpoint)
+
+    def _write(self, collection, batch):
+        """
+        Returns:
+            tuple(int, int, int): Documents inserted, updated and left as they were.
+        """
+        for attempt in range(self.retries):
+            try:
+                result = collection.insert_many(batch, ordered=False, chunk_size=len(batch), concurrency=1)
+                return len(result.inserted_ids), 0, 0
+            except Exception as error:
+                inserted = getattr(error, "inserted_ids", None)
+                failures = getattr(error, "exceptions", None) or []
+                if inserted is not None and failures and all(_is_duplicate(failure) for failure in failures):
+                    break
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(backoff_delay(attempt))
+        # Only duplicates failed: the rest of the batch is in
+        written = set(inserted)
+        existing = [document for document in batch if document["_id"] not in written]
+        if not self.update:
+            return len(written), 0, len(existing)
+        for document in existing:
+            fields = {field: value for field, value in document.items() if field != "_id"}
+            collection.update_one({"_id": document["_id"]}, {"$set": fields})
+        return len(written), len(existing), 0
+
+    def run(self, resume=False, drop=False, progress=None):
+        """
+        Args:
+            resume (bool): Continue after the checkpointed line.
+            drop (bool): Delete every document in the collection first (full reload, ignored when resuming).
+            progress (callable): Called with the stats dict and docs/sec every few seconds.
+
+        Returns:
+            dict{str : *}: Counters, seconds and docs_per_sec.
+        """
+        collection = get_collection(self.collection_name)
+        if resume:
+            self._load_checkpoint()
+        elif drop:
+            collection.delete_many({})
+        start_after = self.stats["line"]
+
+        seen, batch, pending, finished = set(), [], {}, {}
+        next_batch, submitted = 0, 0
+        started = last_report = time.perf_counter()
+        rejects = open(self.rejects, "a" if resume else "w", encoding="utf-8")
+
+        def collect(done):
+            # Count finished batches and move the checkpoint past every contiguous written batch
+            nonlocal next_batch
+            for future in done:
+                index, last_line = pending.pop(future)
+                inserted, updated, existing = future.result()
+                self.stats["inserted"] += inserted
+                self.stats["updated"] += updated
+                self.stats["existing"] += existing
+                finished[index] = last_line
+            advanced = False
+            while next_batch in finished:
+                self.stats["line"] = finished.pop(next_batch)
+                next_batch += 1
+                advanced = True
+            if advanced:
+                self._save_checkpoint()
+
+        def submit(pool, last_line):
+            nonlocal batch, submitted
+            if len(pending) >= self.concurrency:
+                collect(wait(pending, return_when=FIRST_COMPLETED)[0])
+            pending[pool.submit(self._write, collection, batch)] = (submitted, last_line)
+            submitted += 1
+            batch = []
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                line_number = start_after
+                for line_number, raw, error in read_records(self.source):
+                    record = None
+                    if error is None:
+                        try:
+                            record = self.schema.model_validate(raw)
+                        except ValidationError as invalid:
+                            error = "; ".join(f"{'.'.join(map(str, item['loc']))}: {item['msg']}" for item in invalid.errors())
+                    if line_number <= start_after:
+                        # Already written by the interrupted run, only remembered for de-duplication
+                        if record is not None:
+                            seen.add(self.key(record))
+                        continue
+                    self.stats["read"] += 1
+                    if record is None:
+                        self.stats["rejected"] += 1
+                        rejects.write(json.dumps({"line": line_number, "error": error, "record": raw}, default=str) + "\n")
+                        continue
+                    key = self.key(record)
+                    if key in seen:
+                        self.stats["duplicates"] += 1
+                        continue
+                    seen.add(key)
+                    document = record.model_dump()
+                    if self.extras is not None:
+                        document.update(self.extras(record))
+                    document["_id"] = document_id(key)
+                    document["updated_at"] = time.time()
+                    batch.append(document)
+                    if len(batch) >= self.batch_size:
+                        submit(pool, line_number)
+                    if progress and time.perf_counter() - last_report >= 5.0:
+                        last_report = time.perf_counter()
+                        written = self.stats["inserted"] + self.stats["updated"] + self.stats["existing"]
+                        progress(self.stats, written / (last_report - started))
+                if batch:
+                    submit(pool, line_number)
+                # The tail after the last batch (blank or rejected lines) is done too
+                pending[pool.submit(lambda: (0, 0, 0))] = (submitted, line_number)
+                submitted += 1
+                while pending:
+                    collect(wait(pending, return_when=FIRST_COMPLETED)[0])
+        finally:
+            rejects.close()
+
+        self._save_checkpoint(done=True)
+        if replica.serves(self.collection_name):
+            # Picks up the new updated_at stamps, a dropped collection needs a full copy
+            replica.sync(self.collection_name, full=drop and not resume)
+        invalidate_caches(self.collection_name)
+        seconds = time.perf_counter() - started
+        written = self.stats["inserted"] + self.stats["updated"] + self.stats["existing"]
+        return dict(self.stats, seconds=seconds, docs_per_sec=written / seconds if seconds else 0.0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk load articulation agreements or GE course rows into Astra")
+    parser.add_argument("kind", choices=sorted(INGEST_KINDS))
+    parser.add_argument("source", help="JSON lines or CSV file")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--rejects", default=None)
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted load from its checkpoint")
+    parser.add_argument("--drop", action="store_true", help="delete the collection's documents first (full reload)")
+    parser.add_argument("--update", action="store_true", help="overwrite documents that already exist")
+    parser.add_argument("--offline", action="store_true", help="load into the mock database")
+    parser.add_argument("--db-latency", type=float, default=0.05, help="mock database seconds per call with --offline")
+    args = parser.parse_args(argv)
+
+    if args.offline:
+        import mock
+        mock.install(db_latency=args.db_latency, seed=False)
+
+    ingestor = Ingestor(args.kind, args.source, args.batch_size, args.concurrency, args.checkpoint, args.rejects, args.update)
+
+    def progress(stats, rate):
+        print(f"line {stats['line']}: {stats['inserted']} inserted, {stats['rejected']} rejected, {rate:.0f} docs/s", flush=True)
+
+    result = ingestor.run(resume=args.resume, drop=args.drop, progress=progress)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
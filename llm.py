@@ -0,0 +1,159 @@
+'''
+LLM
+'''
+from cache import LLMResponseCache
+from clients import get_openai_client
+from ratelimit import call_with_retry, estimate_tokens, limiter
+from tracing import payload_size, record_usage, span
+import itertools
+import os
+import time
+
+
+# Shared on-disk response cache for every agent function
+    # LLM_CACHE_BYPASS=1 turns it off without code changes (e.g. when we want fresh samples)
+llm_cache = LLMResponseCache(
+    path=os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite3"),
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", 5000)),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", 50 * 1024 * 1024)),
+    bypass=os.getenv("LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes"),
+)
+
+
+def chat_create(model, messages, use_cache=True, name=None, **params):
+    """
+    -Plain chat completion through the shared response cache.
+    -API calls go through the shared rate limiter with retries and backoff (ratelimit.call_with_retry).
+    -Recorded as an "llm" span (tokens, wall time, cache hit, payload sizes, attempts).
+    
+    Args:
+        model (str): OpenAI model name.
+        messages (list[dict{str : str}]): Chat messages.
+        use_cache (bool): Set False to always call the API (the fresh response is still stored).
+        name (str): Calling agent function, recorded on the span.
+        **params: Extra request parameters, included in the cache key.
+        
+    Returns:
+        str: Message content of the first choice.
+    """
+    with span("chat.completions.create", kind="llm", function=name, model=model,
+              request_bytes=payload_size(messages)) as record:
+        key = llm_cache.make_key(model, messages, **params)
+        cached = llm_cache.get(key) if use_cache else None
+        record["cache_hit"] = cached is not None
+        if cached is not None:
+            record["response_bytes"] = len(cached.encode("utf-8"))
+            return cached
+        
+        tokens = estimate_tokens(messages, params.get("max_tokens"), model)
+        completion = call_with_retry(get_openai_client().chat.completions.create, tokens, record,
+                                     model=model, messages=messages, **params)
+        content = completion.choices[0].message.content
+        record_usage(record, completion.usage)
+        limiter.settle(tokens, getattr(completion.usage, "total_tokens", None))
+        record["response_bytes"] = len((content or "").encode("utf-8"))
+        llm_cache.set(key, content, model=model, kind="text")
+        return content
+
+
+def chat_parse(model, messages, response_format, use_cache=True, name=None, **params):
+    """
+    -Structured output completion through the shared response cache.
+    -Cached responses are rehydrated into `response_format` so callers get the same pydantic object either way.
+    -API calls go through the shared rate limiter with retries and backoff (ratelimit.call_with_retry).
+    -Recorded as an "llm" span (tokens, wall time, cache hit, payload sizes, attempts).
+    
+    Args:
+        model (str): OpenAI model name.
+        messages (list[dict{str : str}]): Chat messages.
+        response_format (type[BaseModel]): Pydantic schema for the structured output.
+        use_cache (bool): Set False to always call the API (the fresh response is still stored).
+        name (str): Calling agent function, recorded on the span.
+        **params: Extra request parameters, included in the cache key.
+        
+    Returns:
+        BaseModel: Parsed response, None if the model refused.
+    """
+    with span("beta.chat.completions.parse", kind="llm", function=name, model=model,
+              response_format=response_format.__name__, request_bytes=payload_size(messages)) as record:
+        key = llm_cache.make_key(model, messages, response_format, **params)
+        cached = llm_cache.get(key) if use_cache else None
+        record["cache_hit"] = cached is not None
+        if cached is not None:
+            record["response_bytes"] = len(cached.encode("utf-8"))
+            return response_format.model_validate_json(cached)
+        
+        tokens = estimate_tokens(messages, params.get("max_tokens"), model)
+        completion = call_with_retry(get_openai_client().beta.chat.completions.parse, tokens, record,
+                                     model=model, messages=messages, response_format=response_format, **params)
+        parsed = completion.choices[0].message.parsed
+        record_usage(record, completion.usage)
+        limiter.settle(tokens, getattr(completion.usage, "total_tokens", None))
+        # Refusals come back with parsed=None and are not worth keeping
+        if parsed is not None:
+            value = parsed.model_dump_json()
+            record["response_bytes"] = len(value.encode("utf-8"))
+            llm_cache.set(key, value, model=model, kind=response_format.__name__)
+        else:
+            record["refusal"] = True
+        return parsed
+
+
+def _open_stream(**params):
+    # Starts a streamed completion and waits for its first chunk, so errors that only surface
+        # once the stream is read (429s, timeouts) happen inside the retry loop
+    stream = iter(get_openai_client().chat.completions.create(**params))
+    return next(stream, None), stream
+
+
+def chat_stream(model, messages, use_cache=True, name=None, **params):
+    """
+    -Streaming chat completion through the shared response cache.
+    -Yields text deltas as they arrive so the UI can show the first tokens immediately.
+    -A cached response is yielded as a single chunk, a fresh one is stored once the stream completes.
+    -Recorded as an "llm" span covering the whole stream, with time to first token,
+        -usage comes from the final chunk (stream_options include_usage).
+    -Opening the stream (up to the first chunk) is rate limited and retried like chat_create,
+        -an error after text has been yielded is raised to the caller.
+    
+    Args:
+        model (str): OpenAI model name.
+        messages (list[dict{str : str}]): Chat messages.
+        use_cache (bool): Set False to always call the API (the fresh response is still stored).
+        name (str): Calling agent function, recorded on the span.
+        **params: Extra request parameters, included in the cache key.
+        
+    Yields:
+        str: Response text deltas.
+    """
+    with span("chat.completions.create", kind="llm", function=name, model=model, stream=True,
+              request_bytes=payload_size(messages)) as record:
+        # Same key as chat_create so streamed and blocking calls share entries
+        key = llm_cache.make_key(model, messages, **params)
+        cached = llm_cache.get(key) if use_cache else None
+        record["cache_hit"] = cached is not None
+        if cached is not None:
+            record["response_bytes"] = len(cached.encode("utf-8"))
+            yield cached
+            return
+        
+        parts = []
+        started = time.perf_counter()
+        tokens = estimate_tokens(messages, params.get("max_tokens"), model)
+        first, stream = call_with_retry(_open_stream, tokens, record, model=model, messages=messages,
+                                        stream=True, stream_options={"include_usage": True}, **params)
+        for chunk in itertools.chain([first] if first is not None else [], stream):
+            if getattr(chunk, "usage", None) is not None:
+                record_usage(record, chunk.usage)
+                limiter.settle(tokens, getattr(chunk.usage, "total_tokens", None))
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not parts:
+                    record["first_token_seconds"] = time.perf_counter() - started
+                parts.append(delta)
+                yield delta
+        text = "".join(parts)
+        record["response_bytes"] = len(text.encode("utf-8"))
+        llm_cache.set(key, text, model=model, kind="text")
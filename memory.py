@@ -0,0 +1,128 @@
+'''
+MEMORY
+'''
+import os
+import threading
+
+from context import count_tokens
+
+
+# Conversation memory defaults
+    # the last MEMORY_WINDOW messages are sent verbatim, older ones are folded into a rolling summary
+    # MEMORY_FOLD_EVERY batches the folding so the summary call runs every few turns, not every turn
+MEMORY_WINDOW = int(os.getenv("MEMORY_WINDOW", 6))
+MEMORY_WINDOW_TOKENS = int(os.getenv("MEMORY_WINDOW_TOKENS", 1500))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", 300))
+MEMORY_FOLD_EVERY = int(os.getenv("MEMORY_FOLD_EVERY", 4))
+
+# Chat roles as each agent sees them, session messages use "user" for the student and "assistant" for the counselor
+PERSPECTIVE_ROLES = {
+    "counselor": {"user": "user", "assistant": "assistant"},
+    "student": {"user": "assistant", "assistant": "user"},
+}
+
+
+def _truncate(text, max_tokens):
+    # Hard cap in case the summarizer ignores its length instruction, cut on a word boundary
+    while text and count_tokens(text) > max_tokens:
+        text = text[:int(len(text) * 0.9)].rsplit(" ", 1)[0]
+    return text
+
+
+class ConversationMemory:
+    """
+    - Bounded conversation history for the student and counselor agents.
+    - The most recent messages are kept verbatim (at most `window` messages and `window_tokens` tokens),
+        -everything older is folded into a rolling summary of at most `summary_tokens` tokens.
+    - Folding is incremental, the summarizer only sees the previous summary plus the messages leaving
+        -the window, so prompt size and per turn latency stay flat as max_turns grows.
+    - Synced from st.session_state.messages, so test.py keeps one source of truth for the transcript.
+
+    Args:
+        window (int): Messages kept verbatim.
+        window_tokens (int): Token cap for the verbatim messages.
+        summary_tokens (int): Token cap for the rolling summary.
+        fold_every (int): Messages that must leave the window before the summary is updated.
+        summarize (callable): (summary, messages, max_tokens) -> str, defaults to functions.summarize_conversation.
+    """
+
+    def __init__(self, window=MEMORY_WINDOW, window_tokens=MEMORY_WINDOW_TOKENS, summary_tokens=MEMORY_SUMMARY_TOKENS,
+                 fold_every=MEMORY_FOLD_EVERY, summarize=None):
+        self.window = window
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        self.fold_every = max(1, fold_every)
+        self.summarize = summarize
+        self.summary = ""
+        self.messages = []
+        # Messages [0, folded) are represented by the summary
+        self.folded = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.summary = ""
+            self.messages = []
+            self.folded = 0
+
+    def sync(self, messages):
+        """
+        Appends messages not seen yet, starting over if the transcript was cleared or rewritten.
+
+        Args:
+            messages (list[dict{str : str}]): Transcript, e.g. st.session_state.messages.
+        """
+        known = len(self.messages)
+        if len(messages) < known or [m["content"] for m in messages[:known]] != [m["content"] for m in self.messages]:
+            self.reset()
+            known = 0
+        self.messages.extend(dict(role=m["role"], content=m["content"]) for m in messages[known:])
+        self._fold()
+
+    def _window_start(self):
+        # First message kept verbatim, limited by count and by tokens
+        start = max(self.folded, len(self.messages) - self.window)
+        while start < len(self.messages) - 1 and sum(count_tokens(m["content"]) for m in self.messages[start:]) > self.window_tokens:
+            start += 1
+        return start
+
+    def _fold(self):
+        with self._lock:
+            start = self._window_start()
+            if start - self.folded < self.fold_every:
+                return
+            overflow = self.messages[self.folded:start]
+            summarize = self.summarize
+            if summarize is None:
+                from functions import summarize_conversation as summarize
+            self.summary = _truncate(summarize(self.summary, overflow, self.summary_tokens), self.summary_tokens)
+            self.folded = start
+
+    def history(self, messages, perspective):
+        """
+        Args:
+            messages (list[dict{str : str}]): Transcript up to, not including, the message being answered.
+            perspective (str): "counselor" or "student", which side the chat roles are written from.
+
+        Returns:
+            list[dict{str : str}]: Chat messages to place between an agent's system prompt and its prompt,
+                the summary (if any) as a system message followed by the verbatim window.
+        """
+        self.sync(messages)
+        roles = PERSPECTIVE_ROLES[perspective]
+        history = []
+        # Messages between the summary and the window that have not been folded yet are still sent,
+            # the window only shrinks the verbatim part once they are summarized
+        start = self.folded
+        if self.summary:
+            history.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        history.extend({"role": roles[m["role"]], "content": m["content"]} for m in self.messages[start:])
+        return history
+
+    def stats(self):
+        return {
+            "messages": len(self.messages),
+            "summarized": self.folded,
+            "verbatim": len(self.messages) - self.folded,
+            "summary_tokens": count_tokens(self.summary),
+        }
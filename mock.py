@@ -0,0 +1,607 @@
+'''
+MOCK
+'''
+import asyncio
+import copy
+import hashlib
+import itertools
+import random
+import sys
+import threading
+import time
+import typing
+from types import SimpleNamespace
+
+
+def approximate_tokens(text):
+    # Rough OpenAI token estimate (~4 characters per token), good enough for relative comparisons
+    return max(1, len(str(text)) // 4)
+
+
+def _messages_text(messages):
+    return " ".join(str(message.get("content", "")) for message in messages)
+
+
+# Provider prompt caching as OpenAI does it: prefixes of at least 1024 tokens, matched in 128 token steps
+    # expressed in characters with the same ~4 characters per token estimate
+PROMPT_CACHE_MIN_CHARS = 1024 * 4
+PROMPT_CACHE_STEP_CHARS = 128 * 4
+
+
+def _caller_name():
+    # Name of the agent function in functions.py that triggered the call, for per function stats
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_globals.get("__name__") == "functions" and not frame.f_code.co_name.startswith("_"):
+            return frame.f_code.co_name
+        frame = frame.f_back
+    return "unknown"
+
+
+def _default_instance(model):
+    """
+    Builds a schema valid instance of any pydantic model with placeholder values.
+    """
+    values = {}
+    for name, field in model.model_fields.items():
+        values[name] = _default_value(field.annotation)
+    return model(**values)
+
+
+def _default_value(annotation):
+    origin = typing.get_origin(annotation)
+    if origin in (list, tuple, set):
+        return []
+    if origin is typing.Union:
+        return _default_value(typing.get_args(annotation)[0])
+    if annotation is str:
+        return "mock"
+    if annotation in (float, int):
+        return annotation(0)
+    if annotation is bool:
+        return False
+    if hasattr(annotation, "model_fields"):
+        return _default_instance(annotation)
+    return None
+
+
+def canned_responses():
+    """
+    Returns:
+        dict{str : callable}: Factories for realistic structured outputs keyed by response_format class name.
+    """
+    from functions import CourseData, EdPlan, FinalEdPlan, GeneralEdGenerator, profileGenerator
+
+    def course(sending, title, units, receiving):
+        return CourseData(sending_Institution_course=sending, sending_Institution_course_title=title,
+                          units=units, receiving_Institution_course=receiving)
+
+    plan = [
+        course("CPSC-06", "Introduction to Programming", 4, "CSE 022"),
+        course("CPSC-07", "Data Structures", 4, "CSE 030"),
+        course("MATH-04B", "Calculus II", 5, "MATH 022"),
+        course("MATH-04C", "Calculus III", 5, "MATH 023"),
+        course("MATH-05", "Linear Algebra", 3, "MATH 024"),
+        course("PHYS-04A & PHYS-04AL", "Mechanics & Mechanics Lab", 5, "PHYS 008 & PHYS 008L"),
+        course("PHYS-04B & PHYS-04BL", "Electricity and Magnetism & Lab", 5, "PHYS 009 & PHYS 009L"),
+        course("ENGL-01A", "Reading and Composition", 4, "WRI 001"),
+        course("CPSC-08", "Discrete Structures", 3, "CSE 015"),
+        course("MATH-04B", "Calculus II", 5, "MATH 022"),
+    ]
+    completed = [course("MATH-04A", "Calculus I", 5, "MATH 021")]
+
+    return {
+        "EdPlan": lambda: EdPlan(education_plan=plan, total_units=sum(c.units for c in plan), completed_courses=completed),
+        "FinalEdPlan": lambda: FinalEdPlan(education_plan=plan[:8], total_units=sum(c.units for c in plan[:8]), removed=plan[8:]),
+        "GeneralEdGenerator": lambda: GeneralEdGenerator(
+            gen_ed_plan=[
+                GeneralEdGenerator.Course(uc_area="UC-E", course="ENGL-01A", course_title="Reading and Composition", units=4),
+                GeneralEdGenerator.Course(uc_area="UC-E", course="ENGL-01B", course_title="Critical Thinking", units=4),
+                GeneralEdGenerator.Course(uc_area="UC-H", course="HIST-17", course_title="US History", units=3),
+                GeneralEdGenerator.Course(uc_area="UC-B", course="PSY-01", course_title="General Psychology", units=3),
+                GeneralEdGenerator.Course(uc_area="UC-S", course="PHYS-04A", course_title="Mechanics", units=4),
+                GeneralEdGenerator.Course(uc_area="UC-H", course="ART-01", course_title="Art History", units=3),
+            ],
+            completed_courses=[GeneralEdGenerator.Course(uc_area="UC-M", course="MATH-04A", course_title="Calculus I", units=5)],
+            total_units=21),
+        "profileGenerator": lambda: profileGenerator(notes=[
+            "Works 20 hours a week to help support family",
+            "First generation college student, motivated to finish in two years",
+            "Needs evening sections because of a commute"]),
+    }
+
+
+class RateLimitError(Exception):
+    # Same class name and status code as openai.RateLimitError, which is all ratelimit.py looks at
+    status_code = 429
+
+
+class APITimeoutError(Exception):
+    pass
+
+
+class _Completions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, model, messages, stream=False, **params):
+        return self._owner._create(model, messages, stream, params)
+
+    def parse(self, model, messages, response_format=None, **params):
+        return self._owner._parse(model, messages, response_format, params)
+
+
+class MockOpenAI:
+    """
+    - Offline stand-in for the OpenAI client surface used in this repo:
+        -chat.completions.create (plain and stream=True) and beta.chat.completions.parse.
+    - Sleeps for a configurable latency so pipelines can be benchmarked without gpt-4o,
+        -and returns schema valid canned objects for EdPlan, GeneralEdGenerator, FinalEdPlan and profileGenerator.
+    - Records every call (function, model, prompt/completion/cached tokens, seconds) in `calls`.
+    - Emulates provider prefix caching, a prompt that repeats a previously seen prefix of at least
+        -1024 tokens reports that prefix as usage.prompt_tokens_details.cached_tokens.
+
+    Args:
+        latency (float): Seconds before a response (or the first streamed token).
+        token_latency (float): Extra seconds per completion token.
+        jitter (float): Uniform random extra latency, 0..jitter seconds.
+        responses (dict{str : callable}): Overrides for canned structured outputs by class name.
+        reply (str): Text returned by plain completions.
+        seed (int): Random seed for jitter.
+        prompt_cache (bool): Emulate provider prefix caching.
+        error_rate (float): Share of calls that fail with a 429 RateLimitError, for exercising retries.
+    """
+
+    def __init__(self, latency=0.05, token_latency=0.0, jitter=0.0, responses=None, reply=None, seed=0, prompt_cache=True,
+                 error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.failures = 0
+        self.token_latency = token_latency
+        self.jitter = jitter
+        self.responses = dict(responses or {})
+        self.reply = reply or ("Based on your transfer agreement you should take CPSC-06 for CSE 022 and "
+                               "MATH-04B for MATH 022 next term, then PHYS-04A with its lab for PHYS 008.")
+        self.calls = []
+        self.prompt_cache = prompt_cache
+        self._prefixes = set()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=_Completions(self)))
+
+    def _sleep(self, completion_tokens, timeout=None):
+        with self._lock:
+            extra = self._random.uniform(0, self.jitter) if self.jitter else 0.0
+        seconds = self.latency + extra + self.token_latency * completion_tokens
+        # Per request timeout, like the client's timeout= parameter
+        if timeout is not None and seconds > timeout:
+            time.sleep(timeout)
+            raise APITimeoutError(f"Request timed out after {timeout}s")
+        time.sleep(seconds)
+
+    def _maybe_fail(self):
+        with self._lock:
+            failed = self.error_rate and self._random.random() < self.error_rate
+            if failed:
+                self.failures += 1
+        if failed:
+            raise RateLimitError("Rate limit reached (mock)")
+
+    def _cached_chars(self, text):
+        # Longest previously seen prefix, then remember every cacheable prefix of this prompt
+        if not self.prompt_cache:
+            return 0
+        lengths = range(PROMPT_CACHE_MIN_CHARS, len(text) + 1, PROMPT_CACHE_STEP_CHARS)
+        hashes = [(length, hashlib.sha1(text[:length].encode("utf-8")).hexdigest()) for length in lengths]
+        with self._lock:
+            cached = max((length for length, digest in hashes if digest in self._prefixes), default=0)
+            self._prefixes.update(digest for _, digest in hashes)
+        return cached
+
+    def _usage(self, messages, completion):
+        text = _messages_text(messages)
+        prompt_tokens = approximate_tokens(text)
+        completion_tokens = approximate_tokens(completion)
+        cached_tokens = min(prompt_tokens, self._cached_chars(text) // 4)
+        return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                               total_tokens=prompt_tokens + completion_tokens,
+                               prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens))
+
+    def _record(self, method, model, usage, started):
+        with self._lock:
+            self.calls.append({
+                "function": _caller_name(),
+                "method": method,
+                "model": model,
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "cached_tokens": usage.prompt_tokens_details.cached_tokens,
+                "seconds": time.perf_counter() - started,
+            })
+
+    def _structured_reply(self, response_format):
+        # Raw json_schema response_format (as sent in Batch API request bodies), answer with the canned object as JSON
+        if not isinstance(response_format, dict) or response_format.get("type") != "json_schema":
+            return None
+        name = response_format["json_schema"]["name"]
+        factory = self.responses.get(name) or canned_responses().get(name)
+        return factory().model_dump_json() if factory else None
+
+    def _create(self, model, messages, stream, params):
+        self._maybe_fail()
+        started = time.perf_counter()
+        reply = self._structured_reply(params.get("response_format")) or self.reply
+        usage = self._usage(messages, reply)
+        if stream:
+            return self._stream(model, usage, started)
+        self._sleep(usage.completion_tokens, params.get("timeout"))
+        self._record("create", model, usage, started)
+        message = SimpleNamespace(role="assistant", content=reply, parsed=None, refusal=None)
+        return SimpleNamespace(id=f"mock-{next(self._ids)}", model=model, usage=usage,
+                               choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")])
+
+    def _stream(self, model, usage, started):
+        time.sleep(self.latency)
+        words = self.reply.split(" ")
+        for index, word in enumerate(words):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            delta = SimpleNamespace(content=word if index == 0 else " " + word)
+            yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)], usage=None)
+        self._record("stream", model, usage, started)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+    def _parse(self, model, messages, response_format, params):
+        self._maybe_fail()
+        started = time.perf_counter()
+        name = response_format.__name__
+        factory = self.responses.get(name) or canned_responses().get(name)
+        parsed = factory() if factory else _default_instance(response_format)
+        usage = self._usage(messages, parsed.model_dump_json())
+        self._sleep(usage.completion_tokens, params.get("timeout"))
+        self._record("parse", model, usage, started)
+        message = SimpleNamespace(role="assistant", content=parsed.model_dump_json(), parsed=parsed, refusal=None)
+        return SimpleNamespace(id=f"mock-{next(self._ids)}", model=model, usage=usage,
+                               choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")])
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self._prefixes.clear()
+            self.failures = 0
+
+
+def _get_path(document, path):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _matches(document, query):
+    """
+    Evaluates the subset of the Data API filter language used in this repo:
+    equality, $and, $or, $in, $nin, $ne, $gt, $gte, $lt, $lte, $exists.
+    """
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(_matches(document, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(document, part) for part in condition):
+                return False
+        else:
+            value = _get_path(document, key)
+            if isinstance(condition, dict) and any(op.startswith("$") for op in condition):
+                for op, operand in condition.items():
+                    if op == "$in" and value not in operand:
+                        return False
+                    if op == "$nin" and value in operand:
+                        return False
+                    if op == "$ne" and value == operand:
+                        return False
+                    if op == "$exists" and (value is not None) != bool(operand):
+                        return False
+                    if op in ("$gt", "$gte", "$lt", "$lte"):
+                        if value is None:
+                            return False
+                        if op == "$gt" and not value > operand:
+                            return False
+                        if op == "$gte" and not value >= operand:
+                            return False
+                        if op == "$lt" and not value < operand:
+                            return False
+                        if op == "$lte" and not value <= operand:
+                            return False
+            elif isinstance(value, list) and not isinstance(condition, list):
+                # Data API equality on an array field matches any element
+                if condition not in value:
+                    return False
+            elif value != condition:
+                return False
+    return True
+
+
+def _project(document, projection):
+    if not projection:
+        return copy.deepcopy(document)
+    included = {field for field, keep in projection.items() if keep}
+    result = {"_id": document.get("_id")}
+    for field in included:
+        if field in document:
+            result[field] = copy.deepcopy(document[field])
+    return result
+
+
+class CollectionInsertManyException(Exception):
+    # Same shape as astrapy.exceptions.CollectionInsertManyException, raised after an unordered insert_many
+    def __init__(self, inserted_ids, exceptions):
+        super().__init__(f"{len(exceptions)} of {len(inserted_ids) + len(exceptions)} documents failed: {exceptions[0]}")
+        self.inserted_ids = inserted_ids
+        self.exceptions = exceptions
+
+
+class MockCollection:
+    """
+    - In-memory stand-in for an astrapy Collection: find, find_one, insert_one, insert_many,
+        -update_one, delete_many, count_documents and distinct.
+    - Each call sleeps for `latency` seconds to model a network round-trip, and is counted in `calls`.
+    """
+
+    def __init__(self, name, documents=(), latency=0.0):
+        self.name = name
+        self.latency = latency
+        self.calls = []
+        self._documents = []
+        self._known_ids = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        for document in documents:
+            self._insert(document)
+
+    def _round_trip(self, method, query=None):
+        with self._lock:
+            self.calls.append({"method": method, "filter": query})
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _insert(self, document):
+        document = copy.deepcopy(document)
+        document.setdefault("_id", f"{self.name}-{next(self._ids)}")
+        with self._lock:
+            if document["_id"] in self._known_ids:
+                # Data API error code for an _id that is already taken
+                raise ValueError(f"DOCUMENT_ALREADY_EXISTS: duplicate _id {document['_id']} in {self.name}")
+            self._known_ids.add(document["_id"])
+            self._documents.append(document)
+        return document["_id"]
+
+    def find(self, filter=None, *, projection=None, limit=None, sort=None, timeout_ms=None, **kwargs):
+        self._round_trip("find", filter)
+        return iter(self._find(filter, projection, limit, sort))
+
+    def _find(self, filter, projection=None, limit=None, sort=None):
+        with self._lock:
+            found = [_project(d, projection) for d in self._documents if _matches(d, filter)]
+        if sort:
+            for field, direction in reversed(list(sort.items())):
+                found.sort(key=lambda d: (_get_path(d, field) is None, _get_path(d, field)), reverse=direction < 0)
+        return found[:limit] if limit else found
+
+    def find_one(self, filter=None, *, projection=None, **kwargs):
+        return next(self.find(filter, projection=projection, limit=1), None)
+
+    def insert_one(self, document, **kwargs):
+        self._round_trip("insert_one")
+        return SimpleNamespace(inserted_id=self._insert(document))
+
+    def insert_many(self, documents, *, ordered=False, chunk_size=None, concurrency=None, **kwargs):
+        self._round_trip("insert_many")
+        inserted, errors = [], []
+        for document in documents:
+            try:
+                inserted.append(self._insert(document))
+            except ValueError as error:
+                errors.append(error)
+                if ordered:
+                    break
+        if errors:
+            raise CollectionInsertManyException(inserted, errors)
+        return SimpleNamespace(inserted_ids=inserted)
+
+    def update_one(self, filter, update, *, upsert=False, **kwargs):
+        self._round_trip("update_one", filter)
+        with self._lock:
+            target = next((d for d in self._documents if _matches(d, filter)), None)
+            if target is not None:
+                for field, value in update.get("$set", {}).items():
+                    target[field] = copy.deepcopy(value)
+        if target is None and upsert:
+            self._insert(dict(update.get("$set", {})))
+        return SimpleNamespace(matched_count=int(target is not None), modified_count=int(target is not None))
+
+    def delete_many(self, filter, **kwargs):
+        self._round_trip("delete_many", filter)
+        with self._lock:
+            kept = [d for d in self._documents if not _matches(d, filter)]
+            deleted = len(self._documents) - len(kept)
+            self._documents = kept
+            self._known_ids = {d["_id"] for d in kept}
+        return SimpleNamespace(deleted_count=deleted)
+
+    def count_documents(self, filter, *, upper_bound=None, **kwargs):
+        self._round_trip("count_documents", filter)
+        with self._lock:
+            return sum(1 for d in self._documents if _matches(d, filter))
+
+    def distinct(self, key, *, filter=None, **kwargs):
+        self._round_trip("distinct", filter)
+        with self._lock:
+            return list(dict.fromkeys(_get_path(d, key) for d in self._documents if _matches(d, filter)))
+
+
+class MockDatabase:
+    """
+    In-memory stand-in for an astrapy Database, collections are created on first access.
+
+    Args:
+        latency (float): Seconds per collection call.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.collections = {}
+
+    def get_collection(self, name, **kwargs):
+        if name not in self.collections:
+            self.collections[name] = MockCollection(name, latency=self.latency)
+        return self.collections[name]
+
+    create_collection = get_collection
+
+
+class AsyncMockCursor:
+    # AsyncCollectionFindCursor surface used by async_data.py
+    def __init__(self, collection, filter, kwargs):
+        self.collection = collection
+        self.filter = filter
+        self.kwargs = kwargs
+
+    async def to_list(self):
+        collection = self.collection
+        with collection._lock:
+            collection.calls.append({"method": "find", "filter": self.filter, "mode": "async"})
+        if collection.latency:
+            # Awaited, not slept, so concurrent queries overlap on the event loop like real HTTP requests
+            await asyncio.sleep(collection.latency)
+        return collection._find(self.filter, self.kwargs.get("projection"), self.kwargs.get("limit"), self.kwargs.get("sort"))
+
+
+class AsyncMockCollection:
+    """
+    Async view of a MockCollection (same documents and call log), the AsyncCollection surface async_data.py uses.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, filter=None, **kwargs):
+        return AsyncMockCursor(self.collection, filter, kwargs)
+
+    async def find_one(self, filter=None, **kwargs):
+        documents = await AsyncMockCursor(self.collection, filter, dict(kwargs, limit=1)).to_list()
+        return documents[0] if documents else None
+
+
+class AsyncMockDatabase:
+    """
+    Async view of a MockDatabase, standing in for an astrapy AsyncDatabase.
+    """
+
+    def __init__(self, database):
+        self.database = database
+
+    def get_collection(self, name, **kwargs):
+        return AsyncMockCollection(self.database.get_collection(name))
+
+
+# Merced College -> UC Merced Computer Science and Engineering sample agreement
+DEMO_AGREEMENT = "\n".join([
+    "CSE 022 - Introduction to Programming (4.00) <- CPSC 06 - Introduction to Programming (4.00)",
+    "CSE 030 - Data Structures (4.00) <- CPSC 07 - Data Structures (4.00)",
+    "CSE 015 - Discrete Mathematics (4.00) <- CPSC 08 - Discrete Structures (3.00)",
+    "MATH 021 - Calculus I (4.00) <- MATH 04A - Calculus I (5.00)",
+    "MATH 022 - Calculus II (4.00) <- MATH 04B - Calculus II (5.00)",
+    "MATH 023 - Vector Calculus (4.00) <- MATH 04C - Calculus III (5.00)",
+    "MATH 024 - Linear Algebra and Differential Equations (4.00) <- MATH 05 - Linear Algebra (3.00)",
+    "PHYS 008 - Introductory Physics I (4.00) <- PHYS 04A - Mechanics (4.00)",
+    "PHYS 008L - Introductory Physics I Lab (1.00) <- PHYS 04AL - Mechanics Lab (1.00)",
+    "PHYS 009 - Introductory Physics II (4.00) <- PHYS 04B - Electricity and Magnetism (4.00)",
+    "PHYS 009L - Introductory Physics II Lab (1.00) <- PHYS 04BL - Electricity and Magnetism Lab (1.00)",
+    "WRI 001 - Academic Writing (4.00) <- ENGL 01A - Reading and Composition (4.00)",
+    "WRI 010 - College Reading and Composition (4.00) <- ENGL 01B - Critical Thinking (4.00)",
+    "ENGR 065 - Circuit Theory (4.00) <- No Course Articulated",
+    "CSE 024 - Advanced Programming (4.00) <- CPSC 10 - Advanced Programming in C++ (4.00)",
+    "CSE 031 - Computer Organization and Assembly Language (4.00) <- CPSC 12 - Assembly Language Programming (3.00)",
+    "ENGR 091 - Professional Development: Ethics, Communication and Leadership (1.00) <- No Course Articulated",
+    "MATH 032 - Probability and Statistics (4.00) <- MATH 10 - Elementary Statistics (4.00) OR MATH 11 - Statistics for STEM (4.00)",
+    "ENGR 080 - Engineering Design (2.00) <- ENGR 01 - Introduction to Engineering (2.00)",
+    "PHYS 018 - Introductory Physics I for Biological Sciences (4.00) <- PHYS 02A - General Physics (4.00)",
+    "CHEM 002 - General Chemistry I (4.00) <- CHEM 01A - General Chemistry (5.00)",
+    "BIO 001 - Contemporary Biology (4.00) <- BIO 10 - Principles of Biology (4.00)",
+    "ECON 001 - Introduction to Economics (4.00) <- ECON 01 - Principles of Macroeconomics (3.00) AND ECON 02 - Principles of Microeconomics (3.00)",
+    "PSY 001 - Introduction to Psychology (4.00) <- PSY 01 - General Psychology (3.00)",
+    "Note: Courses must be completed with a grade of C or better. CSE 022 requires a grade of B or better.",
+    "Note: Both PHYS 04A and PHYS 04AL must be completed to receive credit for PHYS 008 and PHYS 008L.",
+    "Note: Both PHYS 04B and PHYS 04BL must be completed to receive credit for PHYS 009 and PHYS 009L.",
+    "Note: Courses taken in Summer 2020 through Spring 2021 with Pass/No Pass grading are accepted for admission.",
+    "Note: This agreement is valid for the 2024-2025 academic year, consult ASSIST.org for other years.",
+])
+
+DEMO_GENERAL_ED = [
+    ("ENGL-01A", "Reading and Composition", "UC-E", "4"),
+    ("ENGL-01B", "Critical Thinking and Writing", "UC-E UC-H", "4"),
+    ("MATH-04A", "Calculus I", "UC-M", "5"),
+    ("MATH-10", "Elementary Statistics", "UC-M", "4"),
+    ("HIST-17", "History of the United States", "UC-H UC-B", "3"),
+    ("PHIL-01", "Introduction to Philosophy", "UC-H", "3"),
+    ("ART-01", "Art History", "UC-H", "3"),
+    ("PSY-01", "General Psychology", "UC-B", "3"),
+    ("SOC-01", "Introduction to Sociology", "UC-B", "3"),
+    ("PHYS-04A", "Mechanics", "UC-S", "4"),
+    ("BIO-10", "Principles of Biology", "UC-S", "4"),
+]
+
+
+def seed_demo_data(database, schools=("Merced College",),
+                   transfer_schools=("University of California, Merced", "California State University, Stanislaus"),
+                   majors=("Computer Science, B.S.", "Computer Science and Engineering, B.S.")):
+    """
+    Fills a MockDatabase with an articulation agreement per (school, transfer school, major)
+    and a GENERAL_ED catalog per school, matching functions.initialize_student_profile (Computer Science, B.S.)
+    and the major test.py hardcodes (Computer Science and Engineering, B.S.) so both run offline.
+    """
+    agreements = database.get_collection("ARTICULATION_AGREEMENTS")
+    general_ed = database.get_collection("GENERAL_ED")
+    for school in schools:
+        for transfer_school in transfer_schools:
+            for major in majors:
+                agreements.insert_one({
+                    "current_school": school,
+                    "transfer_school": transfer_school,
+                    "major": major,
+                    "agreement": DEMO_AGREEMENT,
+                })
+        for code, title, areas, units in DEMO_GENERAL_ED:
+            general_ed.insert_one({"school": school, "course": "four", "course_code": code, "course_title": title,
+                                   "uc_areas": areas, "semester_units": units})
+    return database
+
+
+def install(latency=0.05, db_latency=0.02, token_latency=0.0, jitter=0.0, seed=True, error_rate=0.0):
+    """
+    - Routes clients.py to fresh mock backends.
+    - The on-disk LLM response cache is bypassed so canned responses never land next to real ones,
+        -and the profile pool is emptied and kept in memory for the same reason.
+    - The local replica is turned off so reads go to the mock database, not a snapshot of the real one.
+
+    Returns:
+        tuple(MockOpenAI, MockDatabase): The installed mocks, for inspecting calls.
+    """
+    import clients
+    from llm import llm_cache
+    from profile_pool import profile_pool
+    from replica import replica
+    openai = MockOpenAI(latency=latency, token_latency=token_latency, jitter=jitter, error_rate=error_rate)
+    database = MockDatabase(latency=db_latency)
+    if seed:
+        seed_demo_data(database)
+    llm_cache.bypass = True
+    profile_pool.reset(path=None)
+    replica.reset(path=None)
+    clients.set_backend(openai=openai, database=database, async_database=AsyncMockDatabase(database))
+    return openai, database
@@ -0,0 +1,193 @@
+'''
+PIPELINE
+'''
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import functions
+from articulation import parse_transfer_logic, finalize_plan, missing_requirements, complete_plan, get_articulation_table
+from catalog import general_ed_catalog
+from solver import solve_seven_course_pattern
+
+
+class Stage:
+    """
+    - A single step of a planning pipeline.
+    - `fn` receives the results of its dependencies as keyword arguments named after those stages.
+
+    Args:
+        name (str): Stage name, also the key of its result.
+        fn (callable): Work to run.
+        deps (tuple[str]): Names of stages that must finish first.
+    """
+
+    def __init__(self, name, fn, deps=()):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+
+
+def run_stages(stages, max_workers=4):
+    """
+    - Runs a dependency graph of stages on a thread pool, starting each stage as soon as its dependencies finish.
+    - Independent stages (database reads, LLM calls that do not need each other) overlap,
+        -so end to end latency is the critical path instead of the sum of every stage.
+    - The agent functions are blocking OpenAI/Astra calls, threads give us the overlap
+        -without rewriting every agent as a coroutine.
+
+    Args:
+        stages (list[Stage]): Stages to run, in any order.
+        max_workers (int): Thread pool size.
+
+    Returns:
+        tuple(dict, dict): Stage results by name, and per stage timings
+            {name: {"start": s, "end": s, "seconds": s}} measured from pipeline start.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        unknown = [dep for dep in stage.deps if dep not in by_name]
+        if unknown:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages {unknown}")
+
+    results, timings = {}, {}
+    pending = dict(by_name)
+    running = {}
+    origin = time.perf_counter()
+
+    def timed(stage, kwargs):
+        start = time.perf_counter() - origin
+        value = stage.fn(**kwargs)
+        end = time.perf_counter() - origin
+        return value, {"start": start, "end": end, "seconds": end - start}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            # Submit every stage whose dependencies are done
+            ready = [stage for stage in pending.values() if all(dep in results for dep in stage.deps)]
+            for stage in ready:
+                del pending[stage.name]
+                kwargs = {dep: results[dep] for dep in stage.deps}
+                running[pool.submit(timed, stage, kwargs)] = stage.name
+
+            if not running:
+                raise ValueError(f"Stages {sorted(pending)} have circular dependencies")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                # Re-raises the stage's exception, remaining futures are finished by the pool shutdown
+                results[name], timings[name] = future.result()
+
+    return results, timings
+
+
+def critical_path(stages, timings):
+    """
+    Returns:
+        list[str]: Chain of stage names that determined the pipeline's end time.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    path = []
+    name = max(timings, key=lambda n: timings[n]["end"]) if timings else None
+    while name is not None:
+        path.append(name)
+        deps = by_name[name].deps
+        name = max(deps, key=lambda n: timings[n]["end"]) if deps else None
+    return path[::-1]
+
+
+def build_transfer_plan(prompt, student_profile, articulation_agreement=None, max_workers=4, explain=False):
+    """
+    -Runs the Transfer planning pipeline with independent stages in parallel:
+        -agreement lookup, parsed articulation table lookup and the GENERAL_ED course list fetch run together
+        -major plan (transferAgent2, the only LLM call) -> local articulation rule check
+        -the articulation table corrects receiving courses and fills required courses the draft left out
+        -general ed plan from the local seven-course pattern solver
+    -The rule engine splits combined courses, drops recommended only and duplicate courses,
+        -replacing the transferAgentCheck -> transferAgent2 round-trips.
+    -general_ed_planner2 is only called when the school's catalog rows cannot satisfy the pattern.
+    -Each stage gets its own copy of the profile, the agents read education_plan as context
+        -and threads must not share one mutable dict.
+    -The caller's profile is never modified, the plan lines come back as `education_plan`.
+
+    Args:
+        prompt (str): Initial student message used to start the plan.
+        student_profile (dict{str : *}): Student profile.
+        articulation_agreement (list[dict{str : str}]): Agreements if already fetched, looked up otherwise.
+        max_workers (int): Thread pool size.
+        explain (bool): Also ask the LLM for an explanation of the general ed plan.
+
+    Returns:
+        dict{str : *}: draft_plan (EdPlan), major_plan (FinalEdPlan), missing_required (list[list[str]]),
+            completed_courses (list[CourseData]), gen_ed_plan (GeneralEdGenerator), gen_ed_explanation (str | None),
+            education_plan (list[str]), timings (dict) and critical_path (list[str]).
+    """
+    profile = dict(student_profile)
+    rules = parse_transfer_logic(functions.MAJOR_TRANSFER_LOGIC)
+
+    def agreement():
+        if articulation_agreement is not None:
+            return articulation_agreement
+        return functions.get_articulation_agreement(profile['current_school'], profile['transfer_school'], profile['major'])
+
+    def course_list():
+        return functions.get_general_ed_course_list(profile['current_school'])
+
+    def articulation_table():
+        return get_articulation_table(profile['current_school'], profile['transfer_school'], profile['major'])
+
+    def draft_plan(agreement):
+        return functions.transferAgent2(prompt, dict(profile), agreement)
+
+    def major_plan(draft_plan, articulation_table):
+        final = finalize_plan(draft_plan, rules, profile['completed_courses'])
+        return complete_plan(final, draft_plan.completed_courses, rules, articulation_table, profile['completed_courses'])
+
+    def gen_ed_plan(course_list, draft_plan, major_plan):
+        completed = list(profile['completed_courses']) + [course.sending_Institution_course for course in draft_plan.completed_courses]
+        planned = [course.sending_Institution_course for course in major_plan.education_plan]
+        solved = solve_seven_course_pattern(general_ed_catalog.courses(profile['current_school']), completed, planned)
+        if solved is not None:
+            return solved
+        lines = plan_lines(draft_plan, major_plan)
+        return functions.general_ed_planner2("", dict(profile, education_plan=lines), course_list, lines)
+
+    def gen_ed_explanation(gen_ed_plan):
+        return functions.explain_general_ed_plan(profile, gen_ed_plan)
+
+    stages = [
+        Stage("agreement", agreement),
+        Stage("course_list", course_list),
+        Stage("articulation_table", articulation_table),
+        Stage("draft_plan", draft_plan, deps=("agreement",)),
+        Stage("major_plan", major_plan, deps=("draft_plan", "articulation_table")),
+        Stage("gen_ed_plan", gen_ed_plan, deps=("course_list", "draft_plan", "major_plan")),
+    ]
+    if explain:
+        stages.append(Stage("gen_ed_explanation", gen_ed_explanation, deps=("gen_ed_plan",)))
+    results, timings = run_stages(stages, max_workers=max_workers)
+
+    draft = results["draft_plan"]
+    education_plan = plan_lines(draft, results["major_plan"])
+
+    return {
+        "draft_plan": draft,
+        "major_plan": results["major_plan"],
+        "missing_required": missing_requirements(results["major_plan"], draft.completed_courses, rules,
+                                                 profile['completed_courses'], results["articulation_table"]),
+        "completed_courses": draft.completed_courses,
+        "gen_ed_plan": results["gen_ed_plan"],
+        "gen_ed_explanation": results.get("gen_ed_explanation"),
+        "education_plan": education_plan,
+        "timings": timings,
+        "critical_path": critical_path(stages, timings),
+    }
+
+
+def plan_lines(draft_plan, major_plan):
+    """
+    Returns:
+        list[str]: Completed and planned major courses as the education_plan lines the agents read as context.
+    """
+    return ([functions.describe_course(course, "Completed Course") for course in draft_plan.completed_courses]
+            + [functions.describe_course(course) for course in major_plan.education_plan])
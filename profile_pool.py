@@ -0,0 +1,269 @@
+'''
+PROFILE POOL
+'''
+import argparse
+import atexit
+import json
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Pool sizing
+    # a refill starts when fewer than PROFILE_POOL_LOW_WATER note sets are left and runs until PROFILE_POOL_TARGET
+    # PROFILE_POOL_BATCH generations run concurrently per refill round (each one still goes through the rate limiter)
+PROFILE_POOL_PATH = os.getenv("PROFILE_POOL_PATH", ".profile_pool.json")
+PROFILE_POOL_TARGET = int(os.getenv("PROFILE_POOL_TARGET", 40))
+PROFILE_POOL_LOW_WATER = int(os.getenv("PROFILE_POOL_LOW_WATER", 10))
+PROFILE_POOL_BATCH = int(os.getenv("PROFILE_POOL_BATCH", 5))
+# Draws are persisted in the background every PROFILE_POOL_SAVE_EVERY takes (and by refills and at exit), never on the take path
+PROFILE_POOL_SAVE_EVERY = int(os.getenv("PROFILE_POOL_SAVE_EVERY", 5))
+
+# Used when the pool is empty (first run, no API key) so the sidebar never waits on the model
+    # written without names, schools or majors so they fit whatever context they are paired with
+FALLBACK_NOTES = [
+    ["Works 25 hours a week at a grocery store to help pay rent",
+     "First in the family to attend college and wants to finish in two years",
+     "Worried about fitting lab courses around a work schedule"],
+    ["Returning student after three years in the workforce",
+     "Caring for a younger sibling in the afternoons",
+     "Motivated by an internship that sparked interest in research"],
+    ["Commutes an hour each way and prefers online or evening sections",
+     "Received a scholarship that requires full time enrollment",
+     "Unsure which math sequence the transfer schools expect"],
+    ["Veteran using GI Bill benefits with a fixed timeline",
+     "Wants to join a campus club related to the major",
+     "Needs to retake a prerequisite after a low grade"],
+    ["Parent of a young child, relies on campus childcare",
+     "Plans to transfer close to home to keep family support",
+     "Strong interest in AI after a summer coding program"],
+]
+
+
+def random_context():
+    """
+    Returns:
+        dict{str : *}: Randomized basic fields to generate a note set for, same shape initialize_random_profile builds.
+    """
+    from data import majors, schools
+    return {
+        "name": random.choice(["Aisha Jamal", "John Doe", "Emily Nguyen", "Carlos Perez"]),
+        "current_school": random.choice(schools),
+        "gpa": round(random.uniform(0.0, 4.0), 2),
+        "major": random.choice(majors),
+        "transfer_school": random.sample(schools, 2),
+        "goal": "Transfer",
+    }
+
+
+class ProfilePool:
+    """
+    - Pre-generated profileGenerator note sets, drawn by initialize_random_profile instead of calling the model.
+    - Each entry keeps the context (name, schools, major, gpa) its notes were generated for,
+        -and initialize_random_profile builds the profile from that context so the notes always match it.
+    - Persisted as JSON so generated notes survive restarts and are shared by every session of the server.
+        -take() only updates memory, draws are written out in batches on a background thread, by refills and at exit.
+    - Drawing below the low water mark starts a background refill (one daemon thread, batches of concurrent
+        -generate_field_via_gpt calls) so the pool is topped up before it runs dry.
+    - An empty pool returns a static fallback note set on a fresh random context,
+        -or generates notes for that context in the caller's thread when block=True.
+
+    Args:
+        path (str): JSON file, None keeps the pool in memory only.
+        target (int): Note sets a refill stops at.
+        low_water (int): Remaining note sets that trigger a refill.
+        batch_size (int): Generations run concurrently per refill round.
+        generate (callable): (context) -> list[str], defaults to generate_field_via_gpt on the context.
+        save_every (int): Draws kept in memory only before a background save.
+    """
+
+    def __init__(self, path=PROFILE_POOL_PATH, target=PROFILE_POOL_TARGET, low_water=PROFILE_POOL_LOW_WATER,
+                 batch_size=PROFILE_POOL_BATCH, generate=None, save_every=PROFILE_POOL_SAVE_EVERY):
+        self.path = path
+        self.target = target
+        self.low_water = low_water
+        self.batch_size = max(1, batch_size)
+        self.generate = generate
+        self.save_every = max(1, save_every)
+        self.fallbacks = 0
+        self.generated = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._unsaved = 0
+        self._refilling = None
+        self._notes = self._load()
+        # Draws since the last save are written out on a normal shutdown
+        atexit.register(self.save)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, encoding="utf-8") as pool_file:
+                notes = json.load(pool_file)
+        except (OSError, ValueError):
+            # A corrupt pool is regenerated, never fatal
+            return []
+        # Older pools stored bare note lists without the context they were written for, those are dropped
+        return [{"context": dict(entry["context"]), "notes": list(entry["notes"])}
+                for entry in notes if isinstance(entry, dict) and entry.get("context") and entry.get("notes")]
+
+    def save(self):
+        """
+        Writes the pool to its file, a temp file swapped in with os.replace so a crash never leaves half a file.
+        The pool lock is only held to copy the entries, takes and refills never wait on the disk.
+        """
+        if not self.path:
+            return
+        # One writer at a time, and the snapshot is taken inside so a later snapshot is never overwritten by an older one
+        with self._save_lock:
+            with self._lock:
+                entries = list(self._notes)
+                path = self.path
+                self._unsaved = 0
+            temporary = f"{path}.tmp"
+            with open(temporary, "w", encoding="utf-8") as pool_file:
+                json.dump(entries, pool_file)
+            os.replace(temporary, path)
+
+    def _generate_one(self, context=None):
+        # One pool entry, notes generated for (and stored with) their context
+        context = context or random_context()
+        if self.generate is not None:
+            return {"context": context, "notes": list(self.generate(context))}
+        from functions import generate_field_via_gpt
+        # Fresh sample every time, a cache hit would hand out the same notes again
+        return {"context": context, "notes": list(generate_field_via_gpt(context, use_cache=False).notes)}
+
+    def __len__(self):
+        return len(self._notes)
+
+    def take(self, block=False):
+        """
+        Args:
+            block (bool): When the pool is empty, generate a note set now instead of using a fallback.
+
+        Returns:
+            dict{str : *}: Entry removed from the pool, "context" (random_context fields) and the "notes" written for it.
+        """
+        with self._lock:
+            entry = self._notes.pop() if self._notes else None
+            if entry is not None:
+                self._unsaved += 1
+            remaining = len(self._notes)
+            flush = self._unsaved >= self.save_every
+        if remaining < self.low_water:
+            # The refill saves the pool as it adds entries, draws included
+            self.refill_async()
+        elif flush:
+            threading.Thread(target=self.save, name="profile-pool-save", daemon=True).start()
+        if entry is not None:
+            return entry
+        context = random_context()
+        if block:
+            try:
+                return self._generate_one(context)
+            except Exception:
+                self.errors += 1
+        self.fallbacks += 1
+        return {"context": context, "notes": list(random.choice(FALLBACK_NOTES))}
+
+    def refill(self, count=None):
+        """
+        Generates note sets in rounds of batch_size concurrent calls until the pool holds `count` (default target).
+        A round where every call fails stops the refill, the next take() below the low water mark retries.
+
+        Returns:
+            int: Note sets added.
+        """
+        count = self.target if count is None else count
+        added = 0
+        with ThreadPoolExecutor(max_workers=self.batch_size) as pool:
+            while len(self._notes) < count:
+                round_size = min(self.batch_size, count - len(self._notes))
+                futures = [pool.submit(self._generate_one) for _ in range(round_size)]
+                notes = []
+                for future in futures:
+                    try:
+                        notes.append(future.result())
+                    except Exception:
+                        self.errors += 1
+                if not notes:
+                    break
+                with self._lock:
+                    self._notes.extend(notes)
+                self.save()
+                added += len(notes)
+                self.generated += len(notes)
+        if self._unsaved:
+            # Nothing was added (pool full or generation failing), the draws still get written
+            self.save()
+        return added
+
+    def extend(self, entries):
+        """
+        Adds (context, notes) pairs generated elsewhere (e.g. a Batch API run).
+        """
+        with self._lock:
+            self._notes.extend({"context": dict(context), "notes": list(notes)} for context, notes in entries if notes)
+        self.save()
+
+    def refill_async(self):
+        """
+        Starts a background refill unless one is already running.
+
+        Returns:
+            threading.Thread: The refill thread.
+        """
+        with self._lock:
+            if self._refilling is None or not self._refilling.is_alive():
+                self._refilling = threading.Thread(target=self.refill, name="profile-pool-refill", daemon=True)
+                self._refilling.start()
+            return self._refilling
+
+    def reset(self, path=None, generate=None):
+        """
+        Empties the pool and points it at a new file (None for memory only), e.g. for offline runs.
+        """
+        with self._lock:
+            self.path = path
+            self.generate = generate
+            self._notes = self._load()
+            self._unsaved = 0
+
+    def stats(self):
+        return {"available": len(self._notes), "generated": self.generated, "fallbacks": self.fallbacks, "errors": self.errors}
+
+
+# Shared pool for the app, simulator and batch runs
+profile_pool = ProfilePool()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate student profile notes for initialize_random_profile")
+    parser.add_argument("--count", type=int, default=PROFILE_POOL_TARGET, help="note sets the pool should hold")
+    parser.add_argument("--batch-api", action="store_true", help="generate through the OpenAI Batch API (batch.py)")
+    parser.add_argument("--offline", action="store_true", help="use the mock OpenAI backend (pool kept in memory)")
+    args = parser.parse_args(argv)
+
+    if args.offline:
+        import mock
+        mock.install(latency=0.05)
+    missing = max(0, args.count - len(profile_pool))
+    if args.batch_api and missing:
+        import batch
+        items = [{"id": str(index), "profile": random_context()} for index in range(missing)]
+        results, errors = batch.run_batch("generate_field_via_gpt", items, batch.LocalBatchRunner() if args.offline else None,
+                                          model="gpt-4o-2024-08-06", store=False)
+        contexts = {item["id"]: item["profile"] for item in items}
+        profile_pool.extend((contexts[item_id], result.notes) for item_id, result in results.items())
+        print(f"{len(results)} note sets added, {len(errors)} errors")
+    else:
+        print(f"{profile_pool.refill(args.count)} note sets added")
+    print(json.dumps(profile_pool.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+'''
+RATELIMIT
+'''
+import contextvars
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+
+# Account limits for the shared limiter, 0 means unlimited
+    # set these to the organization's tier limits (or a share of them when several processes run)
+LLM_RPM = float(os.getenv("LLM_RPM", 0))
+LLM_TPM = float(os.getenv("LLM_TPM", 0))
+
+# Retry policy defaults
+    # LLM_HEDGE_AFTER=0 disables hedging, a hedge is a second identical request and costs a second completion
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", 5))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 1.0))
+LLM_BACKOFF_CAP = float(os.getenv("LLM_BACKOFF_CAP", 30.0))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60.0))
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", 0))
+
+# Completion tokens reserved for a request that does not set max_tokens, corrected once usage comes back
+DEFAULT_COMPLETION_TOKENS = 500
+
+# Errors worth retrying, by class name (openai exceptions and the mock's) or HTTP status
+RETRYABLE_ERRORS = ("RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError", "TimeoutError")
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """
+    - Refills continuously at `per_minute / 60` per second up to `capacity`.
+    - reserve() always takes what it asks for and returns how long the caller must wait,
+        -so the balance can go negative and waiting callers are served in arrival order.
+
+    Args:
+        per_minute (float): Refill rate, 0 or None for an unlimited bucket.
+        capacity (float): Burst size, defaults to ten seconds' worth (the API enforces limits over short windows too).
+    """
+
+    def __init__(self, per_minute=None, capacity=None):
+        self._lock = threading.Lock()
+        self.per_minute = per_minute or 0
+        self.capacity = capacity or max(1.0, self.per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_minute / 60.0)
+        self.updated = now
+
+    def reserve(self, amount=1):
+        """
+        Returns:
+            float: Seconds until the reserved amount is actually available.
+        """
+        if not self.per_minute:
+            return 0.0
+        # A request larger than the bucket could never be served, it waits for a full bucket instead
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+            return max(0.0, -self.tokens * 60.0 / self.per_minute)
+
+    def try_take(self, amount=1):
+        """
+        Returns:
+            bool: True if the amount was available now (and taken).
+        """
+        if not self.per_minute:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens < min(amount, self.capacity):
+                return False
+            self.tokens -= min(amount, self.capacity)
+            return True
+
+    def refund(self, amount):
+        # Positive for an over-estimate, negative when a request used more than it reserved
+        if not self.per_minute:
+            return
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    - Requests per minute and tokens per minute buckets shared by every LLM call in the process.
+    - Callers reserve one request and their estimated tokens before each attempt and sleep for the reservation,
+        -so bursts from the pipeline threads, the simulator and batch runs are smoothed instead of hitting 429s.
+    - A 429 pauses every caller for the backoff (Retry-After when the API sends one),
+        -instead of each thread retrying on its own schedule and stampeding the API together.
+
+    Args:
+        rpm (float): Requests per minute, 0 for unlimited.
+        tpm (float): Prompt + completion tokens per minute, 0 for unlimited.
+    """
+
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM):
+        self._paused_until = 0.0
+        self.configure(rpm, tpm)
+
+    def configure(self, rpm=None, tpm=None):
+        """
+        Changes the limits, a None argument keeps the current one.
+        """
+        if rpm is not None:
+            self.requests = TokenBucket(rpm)
+        if tpm is not None:
+            self.tokens = TokenBucket(tpm)
+
+    def acquire(self, tokens=0):
+        """
+        Blocks until a request of `tokens` estimated tokens may start.
+
+        Returns:
+            float: Seconds waited.
+        """
+        delay = max(self.requests.reserve(1), self.tokens.reserve(tokens), self._paused_until - time.monotonic())
+        if delay > 0:
+            time.sleep(delay)
+        return max(0.0, delay)
+
+    def try_acquire(self, tokens=0):
+        """
+        Non blocking acquire, used for hedges so they only go out with spare capacity.
+        """
+        if self._paused_until > time.monotonic() or not self.requests.try_take(1):
+            return False
+        if not self.tokens.try_take(tokens):
+            self.requests.refund(1)
+            return False
+        return True
+
+    def settle(self, estimated, actual):
+        # Correct the token bucket once the real usage is known
+        if actual is not None:
+            self.tokens.refund(estimated - actual)
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# Shared limiter for every model call in the process
+limiter = RateLimiter()
+
+
+def estimate_tokens(messages, max_tokens=None, model="gpt-4o"):
+    """
+    Returns:
+        int: Prompt tokens of the messages plus the completion allowance.
+    """
+    from context import count_tokens
+    prompt = sum(count_tokens(str(message.get("content", "")), model) + 4 for message in messages)
+    return prompt + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+def is_retryable(error):
+    return type(error).__name__ in RETRYABLE_ERRORS or getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+
+def is_rate_limit(error):
+    # openai.RateLimitError and any HTTP 429 from a proxy
+    return type(error).__name__ == "RateLimitError" or getattr(error, "status_code", None) == 429
+
+
+def _retry_after(error):
+    # Seconds from the Retry-After header, None when the response has none
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=LLM_BACKOFF_BASE, cap=LLM_BACKOFF_CAP):
+    """
+    Full jitter exponential backoff, uniform in [0, min(cap, base * 2**attempt)].
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _start(fn, kwargs):
+    # Runs one attempt on its own thread, in a copy of the caller's context so tracing spans nest correctly
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(context.run(fn, **kwargs))
+            except BaseException as error:
+                future.set_exception(error)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def _settle_discarded(future, tokens):
+    # A request whose result is thrown away (a hedge's loser, a timed out attempt) still reserved tokens:
+        # once it finishes they are corrected to its real usage, or refunded when it failed
+    try:
+        result = future.result()
+    except BaseException:
+        limiter.settle(tokens, 0)
+        return
+    usage = getattr(result, "usage", None)
+    if usage is None and isinstance(result, tuple):
+        # llm._open_stream's (first chunk, stream), the usage arrives with the final chunk
+        for chunk in itertools.chain(result[:1], result[1]):
+            usage = getattr(chunk, "usage", None) or usage
+    limiter.settle(tokens, getattr(usage, "total_tokens", None))
+
+
+def _hedged(fn, kwargs, tokens, hedge_after, timeout, record):
+    # Primary attempt, plus one identical request if it is still running after hedge_after seconds
+    deadline = None if timeout is None else time.monotonic() + timeout
+    futures = [_start(fn, kwargs)]
+    wait(futures, timeout=hedge_after)
+    if not futures[0].done() and limiter.try_acquire(tokens):
+        futures.append(_start(fn, kwargs))
+        record["hedged"] = True
+    # The first success wins, an error is only raised once no request is left that could still succeed
+    chosen, failed, pending = None, [], set(futures)
+    while pending and chosen is None:
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        chosen = next((future for future in done if future.exception() is None), None)
+        failed.extend(future for future in done if future.exception() is not None)
+    chosen = chosen or (failed[0] if failed else None)
+    # The caller settles the request it gets back, every other one is settled here in the background
+    for future in futures:
+        if future is not chosen:
+            threading.Thread(target=_settle_discarded, args=(future, tokens), daemon=True).start()
+    if chosen is None:
+        raise TimeoutError(f"no response after {timeout}s")
+    return chosen.result()
+
+
+def call_with_retry(fn, tokens=0, record=None, max_attempts=None, timeout=None, hedge_after=None, **kwargs):
+    """
+    -Runs one model request through the shared limiter with retries.
+    -Each attempt waits for rate limit capacity, gets a per-call timeout, and on a retryable failure
+        -(429, timeout, connection error, 5xx) backs off with full jitter before the next attempt.
+    -With hedge_after set, an attempt still running after that many seconds gets a duplicate request
+        -(only if the limiter has spare capacity) and the first successful response wins,
+        -the other request's reserved tokens are settled with its own usage once it finishes.
+
+    Args:
+        fn (callable): Client method, e.g. client.chat.completions.create.
+        tokens (int): Estimated prompt + completion tokens, see estimate_tokens.
+        record (dict): Span attributes, gets attempts / throttled_seconds / backoff_seconds / hedged.
+        max_attempts (int): Attempts before the last error is raised, defaults to LLM_MAX_ATTEMPTS.
+        timeout (float): Seconds per attempt, passed to the client, defaults to LLM_TIMEOUT.
+        hedge_after (float): Seconds before hedging an attempt, 0 disables, defaults to LLM_HEDGE_AFTER.
+        **kwargs: Request parameters for fn.
+
+    Returns:
+        *: fn's return value.
+    """
+    record = record if record is not None else {}
+    max_attempts = max_attempts or LLM_MAX_ATTEMPTS
+    timeout = LLM_TIMEOUT if timeout is None else timeout
+    hedge_after = LLM_HEDGE_AFTER if hedge_after is None else hedge_after
+    if timeout:
+        kwargs["timeout"] = timeout
+    record.setdefault("throttled_seconds", 0.0)
+    record.setdefault("backoff_seconds", 0.0)
+
+    for attempt in range(max_attempts):
+        record["attempts"] = attempt + 1
+        record["throttled_seconds"] += limiter.acquire(tokens)
+        try:
+            if hedge_after and (not timeout or hedge_after < timeout):
+                return _hedged(fn, kwargs, tokens, hedge_after, timeout, record)
+            return fn(**kwargs)
+        except Exception as error:
+            if not is_retryable(error) or attempt == max_attempts - 1:
+                raise
+            delay = _retry_after(error) or backoff_delay(attempt)
+            if is_rate_limit(error):
+                # The next acquire waits out the pause, together with every other caller
+                limiter.pause(delay)
+            else:
+                record["backoff_seconds"] += delay
+                time.sleep(delay)
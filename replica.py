@@ -0,0 +1,324 @@
+'''
+REPLICA
+'''
+import argparse
+import json
+import os
+import threading
+import time
+
+from tracing import span
+
+
+# Snapshot location, REPLICA_PATH= (empty) turns the replica off
+REPLICA_PATH = os.getenv("REPLICA_PATH", ".replica.sqlite3")
+# Seconds between background incremental syncs while the app reads from the replica, 0 only syncs on demand
+REPLICA_REFRESH = float(os.getenv("REPLICA_REFRESH", 15 * 60))
+# Incremental syncs re-read this many seconds before the last marker, so writers with skewed clocks are not missed
+REPLICA_SYNC_OVERLAP = float(os.getenv("REPLICA_SYNC_OVERLAP", 60))
+
+# Replicated collections: table, indexed columns (the fields our queries filter on), indexes
+REPLICA_COLLECTIONS = {
+    "ARTICULATION_AGREEMENTS": ("agreements", ("current_school", "transfer_school", "major"),
+                                [("current_school", "transfer_school", "major"), ("current_school", "major")]),
+    "GENERAL_ED": ("general_ed", ("school", "course", "uc_areas"),
+                   [("school", "course"), ("school", "uc_areas")]),
+}
+
+# Rows written per executemany while a sync streams the cursor
+SYNC_CHUNK = 500
+
+
+def _column(value):
+    # Indexed copy of a field, lists (older free text GE rows) are joined like catalog._as_text does
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(item) for item in value)
+    return str(value)
+
+
+def _project(document, projection):
+    if not projection:
+        return document
+    return {field: value for field, value in document.items() if field == "_id" or projection.get(field)}
+
+
+def _create_table(table, columns):
+    # One DDL for the live table and the full-sync staging table, the _id primary key is what INSERT OR REPLACE deduplicates on
+    return (f"CREATE TABLE IF NOT EXISTS {table} ("
+            f"_id TEXT PRIMARY KEY, {', '.join(f'{column} TEXT' for column in columns)}, "
+            "updated_at REAL, document TEXT)")
+
+
+def invalidate_caches(collection_name):
+    """
+    Drops this process's cached copies of a collection (agreements, articulation tables, GE catalog)
+    after its documents changed.
+    """
+    if collection_name == "ARTICULATION_AGREEMENTS":
+        from articulation import invalidate_articulation_tables
+        from agreements import invalidate_articulation_agreements
+        invalidate_articulation_agreements()
+        invalidate_articulation_tables()
+    elif collection_name == "GENERAL_ED":
+        from catalog import general_ed_catalog
+        general_ed_catalog.invalidate()
+
+
+class Replica:
+    """
+    - Local SQLite snapshot of ARTICULATION_AGREEMENTS and GENERAL_ED (standard library only),
+        -so agreement and GE reads are a local indexed query instead of a round trip to Astra, and keep working offline.
+    - Documents are stored whole as JSON next to indexed copies of the fields our filters use
+        -(school, major, uc_areas). tracing.traced_find asks the replica first and falls back to Astra
+        -when a collection was never synced or a filter uses anything else.
+    - sync() is incremental on the `updated_at` stamp ingest.py writes, full=True re-reads everything
+        -(needed to drop deleted documents and to pick up documents written without a stamp).
+    - While serving reads, a sync older than `refresh` seconds starts an incremental sync on a background thread.
+    - The file is only opened once it exists or a sync creates it, importing this module never touches disk.
+
+    Args:
+        path (str): SQLite file, None or "" disables the replica.
+        refresh (float): Seconds between background syncs, 0 disables them.
+    """
+
+    def __init__(self, path=REPLICA_PATH, refresh=REPLICA_REFRESH):
+        self.path = path or None
+        self.refresh = refresh
+        self.errors = 0
+        self.last_error = None
+        self._conn = None
+        self._state = None
+        self._lock = threading.RLock()
+        self._syncing = None
+
+    def _connection(self):
+        # Lazily open a single shared connection, guarded by self._lock
+        if self._conn is None:
+            import sqlite3
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sync_state ("
+                               "collection TEXT PRIMARY KEY, marker REAL, synced_at REAL, documents INTEGER)")
+            for table, columns, indexes in REPLICA_COLLECTIONS.values():
+                self._conn.execute(_create_table(table, columns))
+                for index in indexes:
+                    self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_{'_'.join(index)} ON {table} ({', '.join(index)})")
+            self._conn.commit()
+        return self._conn
+
+    def _sync_state(self):
+        # {collection: (marker, synced_at, documents)}, read once and kept up to date by sync()
+        if self._state is None:
+            if self.path is None or not os.path.exists(self.path):
+                return {}
+            with self._lock:
+                rows = self._connection().execute("SELECT collection, marker, synced_at, documents FROM sync_state").fetchall()
+                self._state = {row[0]: row[1:] for row in rows}
+        return self._state
+
+    def serves(self, collection_name):
+        """
+        Returns:
+            bool: True when reads of this collection should go to the replica (it has been synced at least once).
+        """
+        if self.path is None or collection_name not in REPLICA_COLLECTIONS:
+            return False
+        state = self._sync_state().get(collection_name)
+        if state is None:
+            return False
+        if self.refresh and time.time() - state[1] > self.refresh:
+            self.sync_async()
+        return True
+
+    def _where(self, columns, filter):
+        # Data API filter -> SQL on the indexed columns, None when the filter uses anything else
+        clauses, params = [], []
+        for key, condition in (filter or {}).items():
+            if key == "$and":
+                for part in condition:
+                    where = self._where(columns, part)
+                    if where is None:
+                        return None
+                    clauses.extend(where[0])
+                    params.extend(where[1])
+            elif key not in columns:
+                return None
+            elif isinstance(condition, dict):
+                if set(condition) != {"$in"}:
+                    return None
+                values = [_column(value) for value in condition["$in"]]
+                clauses.append(f"{key} IN ({', '.join('?' * len(values))})" if values else "0")
+                params.extend(values)
+            else:
+                clauses.append(f"{key} = ?")
+                params.append(_column(condition))
+        return clauses, params
+
+    def find(self, collection_name, filter, projection=None, limit=None, **kwargs):
+        """
+        Same arguments and result as collection.find for the filters this repo sends
+        (equality, $in and $and on indexed fields). Other find options (timeout_ms, ...) are ignored.
+
+        Returns:
+            list[dict] | None: Matching documents, None when the replica cannot answer this query.
+        """
+        if not self.serves(collection_name):
+            return None
+        table, columns, _ = REPLICA_COLLECTIONS[collection_name]
+        where = self._where(columns, filter)
+        if where is None:
+            return None
+        clauses, params = where
+        sql = f"SELECT document FROM {table}" + (f" WHERE {' AND '.join(clauses)}" if clauses else "")
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._connection().execute(sql, params).fetchall()
+        return [_project(json.loads(row[0]), projection) for row in rows]
+
+    def sync(self, collection_name=None, full=False):
+        """
+        -Copies documents changed since the last sync (updated_at at or after the stored marker) from Astra.
+        -A collection's first sync, and full=True, replace the whole table.
+
+        Args:
+            collection_name (str): One collection, None syncs every replicated collection.
+            full (bool): Re-read every document.
+
+        Returns:
+            dict{str : int}: Documents written per collection.
+        """
+        from clients import get_collection
+        if self.path is None:
+            return {}
+        written = {}
+        for name in ([collection_name] if collection_name else list(REPLICA_COLLECTIONS)):
+            table, columns, _ = REPLICA_COLLECTIONS[name]
+            previous = self._sync_state().get(name)
+            marker = previous[0] if previous and not full else None
+            query = {} if marker is None else {"updated_at": {"$gte": marker - REPLICA_SYNC_OVERLAP}}
+            started = time.time()
+            insert = (f"INSERT OR REPLACE INTO {{target}} (_id, {', '.join(columns)}, updated_at, document) "
+                      f"VALUES ({', '.join('?' * (len(columns) + 3))})")
+            # A full sync fills a staging table that replaces the live one at the end, readers never see a partial table
+            target = f"{table}_staging" if marker is None else table
+            with self._lock:
+                conn = self._connection()
+                if marker is None:
+                    conn.execute(f"DROP TABLE IF EXISTS {target}")
+                    conn.execute(_create_table(target, columns))
+                    conn.commit()
+
+            def write(rows):
+                # The lock is only held for local writes, never while waiting on Astra
+                    # returns how many rows are new or differ from the live table, re-reads in the overlap window are not changes
+                if not rows:
+                    return 0
+                with self._lock:
+                    stored = dict(conn.execute(f"SELECT _id, document FROM {table} WHERE _id IN ({', '.join('?' * len(rows))})",
+                                               [row[0] for row in rows]).fetchall())
+                    conn.executemany(insert.format(target=target), rows)
+                    conn.commit()
+                return sum(stored.get(row[0]) != row[-1] for row in rows)
+
+            with span("sync", kind="db", collection=name, function="replica") as record:
+                count, changed, newest, chunk = 0, 0, marker, []
+                # Cursor pages stream into the table in chunks, the collection is never held in memory
+                for document in get_collection(name).find(query):
+                    stamp = document.get("updated_at")
+                    stamp = stamp if isinstance(stamp, (int, float)) else None
+                    if stamp is not None and (newest is None or stamp > newest):
+                        newest = stamp
+                    chunk.append((str(document["_id"]), *(_column(document.get(column)) for column in columns),
+                                  stamp, json.dumps(document, default=str)))
+                    if len(chunk) >= SYNC_CHUNK:
+                        changed += write(chunk)
+                        count += len(chunk)
+                        chunk = []
+                changed += write(chunk)
+                count += len(chunk)
+                record["documents"] = count
+                record["changed"] = changed
+
+            with self._lock:
+                if marker is None:
+                    conn.execute(f"DELETE FROM {table}")
+                    conn.execute(f"INSERT INTO {table} (_id, {', '.join(columns)}, updated_at, document) "
+                                 f"SELECT _id, {', '.join(columns)}, updated_at, document FROM {target}")
+                    conn.execute(f"DROP TABLE {target}")
+                # Without any stamp yet the next sync is full again, unstamped documents are invisible to incremental syncs
+                total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                # A full sync also drops documents deleted upstream
+                changed += previous is not None and marker is None and total != previous[2]
+                conn.execute("INSERT OR REPLACE INTO sync_state (collection, marker, synced_at, documents) VALUES (?, ?, ?, ?)",
+                             (name, newest, started, total))
+                conn.commit()
+                self._state = None
+            written[name] = count
+            if changed:
+                invalidate_caches(name)
+        return written
+
+    def _sync_quietly(self):
+        # Background refresh, a failure (offline, Astra unreachable) keeps serving the current snapshot
+        try:
+            self.sync()
+        except Exception as error:
+            self.errors += 1
+            self.last_error = repr(error)
+            with self._lock:
+                # Retry after another `refresh` seconds instead of on every read
+                self._state = {name: (state[0], time.time(), state[2]) for name, state in self._sync_state().items()}
+
+    def sync_async(self):
+        """
+        Starts a background incremental sync unless one is already running.
+
+        Returns:
+            threading.Thread: The sync thread.
+        """
+        with self._lock:
+            if self._syncing is None or not self._syncing.is_alive():
+                self._syncing = threading.Thread(target=self._sync_quietly, name="replica-sync", daemon=True)
+                self._syncing.start()
+            return self._syncing
+
+    def reset(self, path=None):
+        """
+        Points the replica at another file (None disables it), e.g. for offline runs on the mock database.
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self.path = path or None
+            self._conn = None
+            self._state = None
+
+    def stats(self):
+        """
+        Returns:
+            dict{str : dict}: Marker, last sync time and document count per synced collection.
+        """
+        return {name: {"marker": state[0], "synced_at": state[1], "documents": state[2]}
+                for name, state in self._sync_state().items()}
+
+
+# Shared replica for every read in the process
+replica = Replica()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local SQLite replica of ARTICULATION_AGREEMENTS and GENERAL_ED")
+    parser.add_argument("command", choices=["sync", "status"])
+    parser.add_argument("--collection", choices=sorted(REPLICA_COLLECTIONS), default=None)
+    parser.add_argument("--full", action="store_true", help="re-read every document (drops deleted ones)")
+    args = parser.parse_args(argv)
+
+    if args.command == "sync":
+        print(json.dumps(replica.sync(args.collection, full=args.full)))
+    print(json.dumps(replica.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+'''
+RETRIEVAL
+'''
+import hashlib
+import json
+import math
+import re
+from collections import Counter
+
+from cache import TTLCache
+from catalog import COURSE_CODE_PATTERN, normalize_code
+from context import UNARTICULATED_MARKERS, as_items
+
+
+# Words that carry no signal in agreement rows or student questions
+STOPWORDS = {
+    "the", "and", "for", "with", "from", "that", "this", "what", "which", "should", "would", "could", "can",
+    "take", "taking", "next", "term", "course", "courses", "class", "classes", "units", "need", "want", "will",
+    "are", "you", "your", "have", "does", "about", "into", "how", "when", "any", "all",
+}
+WORD_PATTERN = re.compile(r"[a-z]{3,}")
+
+# Questions that ask for the whole agreement get it, not the top-k rows
+FULL_AGREEMENT_MARKERS = ("full agreement", "entire agreement", "whole agreement", "all courses", "all the courses",
+                          "every course", "all requirements", "all the requirements")
+
+# Shown in place of a section where no row was retrieved, so the model does not read it as "no agreement"
+NO_ROWS_RETRIEVED = "No rows of this agreement matched the question"
+
+# Indexes by agreement content, built once per agreement and shared by every session
+_indexes = TTLCache(maxsize=256, ttl=None)
+
+
+def tokenize(text):
+    """
+    Course codes in canonical form ("CPSC 06" and "CPSC-6" are the same term) plus lower cased content words.
+
+    Returns:
+        list[str]: Terms, codes first.
+    """
+    text = str(text).upper()
+    codes = [normalize_code(match.group(0)) for match in COURSE_CODE_PATTERN.finditer(text)]
+    # Subject prefixes are left out of the words, "MATH-04A" should not match every MATH row
+    words = [word for word in WORD_PATTERN.findall(COURSE_CODE_PATTERN.sub(" ", text).lower()) if word not in STOPWORDS]
+    return codes + words
+
+
+class BM25Index:
+    """
+    - Okapi BM25 over short documents, here one agreement row per document.
+    - Postings are kept per term so a query only touches rows sharing a term with it.
+
+    Args:
+        documents (list[str]): Texts to index.
+        k1 (float): Term frequency saturation.
+        b (float): Length normalization.
+    """
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        terms = [Counter(tokenize(document)) for document in documents]
+        self.lengths = [sum(counts.values()) for counts in terms]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        self.postings = {}
+        for document, counts in enumerate(terms):
+            for term, frequency in counts.items():
+                self.postings.setdefault(term, []).append((document, frequency))
+        count = len(documents)
+        self.idf = {term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for term, postings in self.postings.items()}
+
+    def scores(self, query):
+        """
+        Returns:
+            dict{int : float}: Score per document that shares at least one term with the query.
+        """
+        scores = {}
+        for term in set(tokenize(query)):
+            for document, frequency in self.postings.get(term, ()):
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[document] / (self.average_length or 1.0))
+                scores[document] = scores.get(document, 0.0) + self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores
+
+    def search(self, query, k):
+        """
+        Returns:
+            list[int]: Up to k document ids, best first.
+        """
+        scores = self.scores(query)
+        return sorted(scores, key=lambda document: (-scores[document], document))[:k]
+
+
+def _entries(articulation_agreement):
+    # (entry index, text, label) in the order agreement_sections walks them
+    if isinstance(articulation_agreement, str):
+        return [(0, articulation_agreement, "Transfer plan summary")]
+    entries = articulation_agreement if isinstance(articulation_agreement, list) else [articulation_agreement or {}]
+    return [(index, text, label) for index, entry in enumerate(entries) for text, label in entry.items()]
+
+
+class AgreementIndex:
+    """
+    - Per-course chunks of an agreement (one articulation row each) with a BM25 index over them.
+    - Rows repeated under several transfer schools are one document, so they are retrieved (and counted) once
+        -and stay identical across sections, which context.trim_agreements then collapses.
+    - Unarticulated rows are not indexed, they never reach a prompt.
+
+    Args:
+        articulation_agreement (list[dict{str : str}] | str): Agreements from get_articulation_agreement or a summary text.
+    """
+
+    def __init__(self, articulation_agreement):
+        self.sections = []
+        self.documents = {}
+        self.rows = []
+        for _, text, label in _entries(articulation_agreement):
+            rows = [row.strip() for row in str(text).splitlines() if row.strip()]
+            if len(rows) <= 1 and (str(text).startswith("No agreement") or str(text).startswith("Error")):
+                rows = []
+            kept, seen = [], set()
+            for row in rows:
+                key = row.lower()
+                if key in seen or any(marker in key for marker in UNARTICULATED_MARKERS):
+                    continue
+                seen.add(key)
+                if key not in self.documents:
+                    self.documents[key] = len(self.rows)
+                    self.rows.append(row)
+                kept.append(row)
+            self.sections.append((text, label, kept))
+        self.index = BM25Index(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def _agreement_key(articulation_agreement):
+    return hashlib.sha1(json.dumps(articulation_agreement, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def agreement_index(articulation_agreement):
+    """
+    Returns:
+        AgreementIndex: Index for this agreement content, built on first use and cached.
+    """
+    key = _agreement_key(articulation_agreement)
+    index = _indexes.get(key)
+    if index is None:
+        index = AgreementIndex(articulation_agreement)
+        _indexes.set(key, index)
+    return index
+
+
+def wants_full_agreement(question):
+    text = str(question or "").lower()
+    return any(marker in text for marker in FULL_AGREEMENT_MARKERS)
+
+
+def retrieve(articulation_agreement, student_profile, question, k):
+    """
+    -Keeps the k agreement rows most relevant to the student's completed and planned courses and the question.
+    -If the query matches fewer than k rows the rest are filled in agreement order (core courses come first).
+    -The full agreement is returned unchanged when k is falsy, the agreement is small enough already,
+        -or the question asks for the whole agreement.
+
+    Args:
+        articulation_agreement (list[dict{str : str}] | str): Agreements from get_articulation_agreement or a summary text.
+        student_profile (dict{str : *}): Student profile, completed_courses and education_plan join the query.
+        question (str): Message being answered.
+        k (int): Rows to keep.
+
+    Returns:
+        tuple(list[dict{str : str}] | str, int): The agreement in the same shape with only the kept rows, and the number of rows left out.
+    """
+    if not k or wants_full_agreement(question):
+        return articulation_agreement, 0
+    index = agreement_index(articulation_agreement)
+    if len(index) <= k:
+        return articulation_agreement, 0
+
+    query = " ".join(as_items(student_profile.get("completed_courses")) + as_items(student_profile.get("education_plan")) + [str(question or "")])
+    selected = set(index.index.search(query, k))
+    for document in range(len(index)):
+        if len(selected) >= k:
+            break
+        selected.add(document)
+
+    omitted = len(index) - len(selected)
+    if isinstance(articulation_agreement, str):
+        _, _, rows = index.sections[0]
+        return "\n".join(row for row in rows if index.documents[row.lower()] in selected), omitted
+
+    entries = articulation_agreement if isinstance(articulation_agreement, list) else [articulation_agreement or {}]
+    retrieved = [dict() for _ in entries]
+    for (entry, _, _), (text, label, rows) in zip(_entries(articulation_agreement), index.sections):
+        if not rows:
+            # Placeholders ("No agreement for ...", query errors) pass through untouched
+            retrieved[entry][text] = label
+            continue
+        kept = [row for row in rows if index.documents[row.lower()] in selected]
+        retrieved[entry]["\n".join(kept) or NO_ROWS_RETRIEVED] = label
+    return retrieved, omitted
@@ -0,0 +1,204 @@
+'''
+SIMULATE
+'''
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import functions
+from memory import ConversationMemory
+from ratelimit import limiter
+
+
+def opening_message(profile):
+    # Same conversation starter test.py builds from the sidebar profile
+    return (
+        f"Hello, I am {profile['name']}. My major is {profile['major']}. "
+        f"I currently attend {profile['current_school']} with a GPA of {profile['gpa']}. "
+        f"I would like to transfer to {'; '.join(profile['transfer_school'])}. "
+        f"Notes: {'; '.join(profile['notes'])}. "
+    )
+
+
+def _prepare_profile(profile):
+    # initialize_random_profile leaves goals as a string and no education plan, the agents expect lists
+    goals = profile.get("goals")
+    profile["goals"] = [goals] if isinstance(goals, str) else list(goals or [])
+    profile.setdefault("education_plan", [])
+    return profile
+
+
+class Simulation:
+    """
+    - Runs many synthetic student/counselor conversations headlessly, the batch version of test.py's Loop button.
+    - Each session: random profile -> optional transfer plan -> counselor answers the opening message,
+        -then student and counselor alternate until max_turns, with ConversationMemory history.
+    - Sessions run on a bounded asyncio worker pool, the blocking agent calls go to threads (asyncio.to_thread).
+    - Every LLM request is paced by the shared ratelimit.limiter (rpm/tpm) and retried with backoff inside llm.py,
+        -so a 429 costs one request a retry instead of failing the session.
+    - Transcripts are appended to a JSONL file as sessions finish, so a long run can be resumed.
+
+    Args:
+        students (int): Number of sessions.
+        max_turns (int): Messages per session, counted like test.py's turn counter.
+        concurrency (int): Sessions in flight at once.
+        rpm (float): LLM requests per minute across all sessions, None keeps the limiter's setting (LLM_RPM).
+        tpm (float): LLM tokens per minute across all sessions, None keeps the limiter's setting (LLM_TPM).
+        output (str): JSONL transcript path.
+        plan (bool): Build the transfer plan (pipeline.build_transfer_plan) before the conversation.
+    """
+
+    def __init__(self, students=10, max_turns=10, concurrency=4, rpm=None, output="transcripts.jsonl", plan=True, tpm=None):
+        self.students = students
+        self.max_turns = max_turns
+        self.concurrency = concurrency
+        limiter.configure(rpm=rpm, tpm=tpm)
+        self.output = output
+        self.plan = plan
+        self.completed = 0
+        self.failed = 0
+
+    async def _call(self, fn, *args):
+        # One LLM backed agent call, in a thread so the limiter's waits and backoff never block the event loop
+        return await asyncio.to_thread(fn, *args)
+
+    async def run_session(self, session_id):
+        """
+        Returns:
+            dict{str : *}: Transcript record (id, profile, messages, plan, seconds, error).
+        """
+        started = time.perf_counter()
+        record = {"id": session_id, "profile": None, "messages": [], "education_plan": None, "error": None}
+        try:
+            # block=True, a drained pool generates notes instead of repeating the static fallbacks
+            profile = _prepare_profile(await self._call(functions.initialize_random_profile, True))
+            record["profile"] = profile
+            agreement = await asyncio.to_thread(
+                functions.get_articulation_agreement, profile["current_school"], profile["transfer_school"], profile["major"])
+            message = opening_message(profile)
+
+            if self.plan:
+                from pipeline import build_transfer_plan
+                plan = await self._call(build_transfer_plan, message, profile, agreement)
+                record["education_plan"] = profile["education_plan"] = plan["education_plan"]
+
+            memory = ConversationMemory()
+            messages = record["messages"]
+            messages.append({"role": "user", "content": message})
+            turn = 1
+            while turn < self.max_turns:
+                if messages[-1]["role"] == "user":
+                    history = await asyncio.to_thread(memory.history, messages[:-1], "counselor")
+                    reply = await self._call(functions.advisorStep, messages[-1]["content"], profile, agreement, history)
+                    messages.append({"role": "assistant", "content": reply})
+                else:
+                    history = await asyncio.to_thread(memory.history, messages[:-1], "student")
+                    reply = await self._call(functions.student, messages[-1]["content"], profile, history)
+                    messages.append({"role": "user", "content": reply})
+                turn += 1
+            record["summary"] = memory.summary
+        except Exception as error:
+            record["error"] = f"{type(error).__name__}: {error}"
+        record["seconds"] = time.perf_counter() - started
+        return record
+
+    def _done_ids(self):
+        # Session ids already written by an earlier (interrupted) run
+        if not os.path.exists(self.output):
+            return set()
+        done = set()
+        with open(self.output, encoding="utf-8") as transcripts:
+            for line in transcripts:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if not entry.get("error"):
+                    done.add(entry["id"])
+        return done
+
+    async def run(self, resume=False, progress=None):
+        """
+        Args:
+            resume (bool): Skip session ids already written without error.
+            progress (callable): Called with each finished record.
+
+        Returns:
+            dict{str : *}: Sessions completed/failed, wall seconds and sessions per minute.
+        """
+        done = self._done_ids() if resume else set()
+        queue = asyncio.Queue()
+        for session_id in range(self.students):
+            if session_id not in done:
+                queue.put_nowait(session_id)
+        started = time.perf_counter()
+
+        with open(self.output, "a" if resume else "w", encoding="utf-8") as transcripts:
+            async def worker():
+                while True:
+                    try:
+                        session_id = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    record = await self.run_session(session_id)
+                    # Single event loop thread, writes never interleave
+                    transcripts.write(json.dumps(record, default=str) + "\n")
+                    transcripts.flush()
+                    if record["error"]:
+                        self.failed += 1
+                    else:
+                        self.completed += 1
+                    if progress:
+                        progress(record)
+
+            await asyncio.gather(*(worker() for _ in range(max(1, self.concurrency))))
+
+        seconds = time.perf_counter() - started
+        sessions = self.completed + self.failed
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": len(done),
+            "seconds": seconds,
+            "sessions_per_min": 60.0 * sessions / seconds if seconds else 0.0,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run simulated student/counselor sessions and write JSONL transcripts")
+    parser.add_argument("--students", type=int, default=10, help="number of simulated sessions")
+    parser.add_argument("--max-turns", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4, help="sessions in flight at once")
+    parser.add_argument("--rpm", type=float, default=None, help="LLM requests per minute across all sessions")
+    parser.add_argument("--tpm", type=float, default=None, help="LLM tokens per minute across all sessions")
+    parser.add_argument("--output", default="transcripts.jsonl")
+    parser.add_argument("--no-plan", action="store_true", help="skip building the transfer plan first")
+    parser.add_argument("--resume", action="store_true", help="append, skipping sessions already in the output")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--offline", action="store_true", help="use the mock OpenAI/Astra backends")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock LLM seconds per call with --offline")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of mock LLM calls failing with a 429 with --offline")
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    if args.offline:
+        import mock
+        mock.install(latency=args.latency, error_rate=args.error_rate)
+
+    simulation = Simulation(args.students, args.max_turns, args.concurrency, args.rpm, args.output, plan=not args.no_plan,
+                            tpm=args.tpm)
+
+    def progress(record):
+        status = record["error"] or f"{len(record['messages'])} messages"
+        print(f"session {record['id']}: {status} in {record['seconds']:.1f}s", flush=True)
+
+    result = asyncio.run(simulation.run(resume=args.resume, progress=progress))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
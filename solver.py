@@ -0,0 +1,141 @@
+'''
+SOLVER
+'''
+from itertools import combinations
+
+from catalog import normalize_code
+from functions import GeneralEdGenerator
+
+
+# Humanities, behavioral and physical/biological science areas of the seven-course pattern
+BREADTH_AREAS = ("UC-H", "UC-B", "UC-S")
+
+# Each seven-course pattern course must be at least 3 semester units
+MIN_UNITS = 3.0
+
+# Cheapest candidates kept per slot before enumerating, the catalog for one school is small
+    # but this keeps the search bounded if a school lists hundreds of courses
+CANDIDATES_PER_SLOT = 8
+
+
+def _breadth_assignment(courses):
+    """
+    Assigns each breadth course one area so at least two different areas are used.
+
+    Returns:
+        list[str] | None: Area per course, None if every course can only count for the same area.
+    """
+    tags = [[area for area in course["areas"] if area in BREADTH_AREAS] for course in courses]
+    for i, j in combinations(range(len(courses)), 2):
+        for area_i in tags[i]:
+            for area_j in tags[j]:
+                if area_i != area_j:
+                    assignment = [course_tags[0] for course_tags in tags]
+                    assignment[i], assignment[j] = area_i, area_j
+                    return assignment
+    return None
+
+
+def _best_breadth(candidates, cost):
+    """
+    Picks four breadth courses from at least two areas with the lowest cost.
+    The optimum is either the four cheapest, or the four cheapest with one swapped for
+    the cheapest course that can count for a different area, so one swap pass is exact.
+
+    Returns:
+        tuple(list[dict], list[str]) | None: Chosen courses and their areas.
+    """
+    # Stable sort, ties keep the caller's ranking (known units before assumed ones)
+    ranked = sorted(candidates, key=cost)
+    if len(ranked) < 4:
+        return None
+    chosen = ranked[:4]
+    assignment = _breadth_assignment(chosen)
+    if assignment is not None:
+        return chosen, assignment
+
+    best = None
+    for out in range(4):
+        for replacement in ranked[4:]:
+            trial = chosen[:out] + chosen[out + 1:] + [replacement]
+            trial_assignment = _breadth_assignment(trial)
+            if trial_assignment is None:
+                continue
+            total = sum(cost(course) for course in trial)
+            if best is None or total < best[0]:
+                best = (total, trial, trial_assignment)
+            # ranked is sorted, the first replacement that works is the cheapest for this slot
+            break
+    return None if best is None else (best[1], best[2])
+
+
+def solve_seven_course_pattern(catalog_courses, completed_courses=(), planned_courses=()):
+    """
+    -Deterministic solver for the UC seven-course pattern:
+        -two UC-E courses, one UC-M course, four courses from at least two of UC-H / UC-B / UC-S.
+    -Completed and already planned (major) courses cost nothing, so they are used first
+        -(each course may be double counted once, for a single general education slot).
+    -Remaining slots are filled with the fewest additional units from the school's catalog.
+    -Rows whose units did not parse are counted as MIN_UNITS (for cost and totals) and lose ties to known rows,
+        -so an unknown is never picked as if it were free.
+
+    Args:
+        catalog_courses (list[dict]): Rows from GeneralEdCatalog.courses (course_code, course_title, units, areas).
+        completed_courses (list[str]): Course codes the student has completed.
+        planned_courses (list[str]): Course codes already in the student's major plan.
+
+    Returns:
+        GeneralEdGenerator | None: Plan shaped like the LLM planner's output, None if the catalog cannot satisfy the pattern.
+            completed_courses lists slots covered by completed courses, gen_ed_plan every other slot,
+            total_units counts only units not already completed or planned.
+    """
+    completed = {normalize_code(code) for code in completed_courses if code}
+    planned = {normalize_code(code) for code in planned_courses if code}
+
+    # One entry per course code, eligible only if it meets the unit minimum (or units are unknown)
+        # unknown units (catalog rows parse them as 0) are assumed to be the minimum
+    courses = {}
+    for course in catalog_courses:
+        code = normalize_code(course["course_code"])
+        if code not in courses and (not course["units"] or course["units"] >= MIN_UNITS):
+            courses[code] = dict(course, code=code, units=course["units"] or MIN_UNITS, units_known=bool(course["units"]))
+
+    def cost(course):
+        return 0.0 if course["code"] in completed or course["code"] in planned else course["units"]
+
+    def rank(course):
+        # free courses first, completed before planned, then fewest units, known units before assumed ones
+        return (cost(course), course["code"] not in completed, course["units"], not course["units_known"], course["code"])
+
+    def top(area):
+        return sorted((c for c in courses.values() if area in c["areas"]), key=rank)[:CANDIDATES_PER_SLOT]
+
+    english, math = top("UC-E"), top("UC-M")
+
+    best = None
+    for english_pair in combinations(english, 2):
+        for math_course in math:
+            used = {course["code"] for course in english_pair} | {math_course["code"]}
+            if math_course["code"] in {course["code"] for course in english_pair}:
+                continue
+            breadth_pool = sorted(
+                (c for c in courses.values() if c["code"] not in used and any(a in BREADTH_AREAS for a in c["areas"])),
+                key=rank)
+            breadth = _best_breadth(breadth_pool, cost)
+            if breadth is None:
+                continue
+            slots = [(course, "UC-E") for course in english_pair] + [(math_course, "UC-M")] + list(zip(*breadth))
+            total = sum(cost(course) for course, _ in slots)
+            if best is None or total < best[0]:
+                best = (total, slots)
+
+    if best is None:
+        return None
+
+    total_units, slots = best
+    plan, done = [], []
+    for course, area in slots:
+        entry = GeneralEdGenerator.Course(uc_area=area, course=course["course_code"],
+                                          course_title=course["course_title"], units=course["units"])
+        (done if course["code"] in completed else plan).append(entry)
+    return GeneralEdGenerator(gen_ed_plan=plan, completed_courses=done, total_units=total_units)
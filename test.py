@@ -2,6 +2,11 @@
 import streamlit as st
 from data import schools, majors, goals
 from functions import *
+from pipeline import build_transfer_plan
+from agreements import prefetch_articulation_agreement
+from catalog import normalize_code
+from tracing import render_debug_panel
+from memory import ConversationMemory
 import pandas as pd
 
 # SESSION STATE INITIALIZERS
@@ -17,6 +22,11 @@ if "student_profile" not in st.session_state:
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Conversation memory for the agents, last few messages verbatim plus a rolling summary of older ones
+    # synced from st.session_state.messages so prompts stay bounded however many turns are taken
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory()
+
 # Holds current turn count
 if "turn_count" not in st.session_state:
     st.session_state.turn_count = 0
@@ -32,6 +42,12 @@ if "active_looping" not in st.session_state:
 # Flag to indicate looping state
 if "transfer_agent" not in st.session_state:
     st.session_state.transfer_agent = False
+
+# Stored transfer plan and the hash of the inputs that produced it
+    # the plan is only regenerated when the hash changes
+if "transfer_plan" not in st.session_state:
+    st.session_state.transfer_plan = None
+    st.session_state.transfer_plan_key = None
     
 
 # SIDEBAR LOGIC
@@ -145,183 +161,93 @@ plan =[]
 if 'Transfer' in profile['goals']:
     
     
-    data = pd.DataFrame({
-        'completed': [],
-        'planned': [],
-        'Courses': []
-    })
+    # Completed/planned units per course for the bar charts, built once per section
+    data = PlanAccumulator()
     
-    # Get Collection [TEXT]
-    general_ed = database.get_collection("GENERAL_ED")
+    # Only rebuild the plan when the profile changed
+        # chat messages, button presses and max turn changes reuse the stored plan
+    plan_key = transfer_plan_key(initial_message, profile)
+    if st.session_state.transfer_plan_key != plan_key:
+        with st.spinner("Building education plan..."):
+            # The agreement, articulation table and GENERAL_ED course list are fetched concurrently by the pipeline
+            st.session_state.transfer_plan = build_transfer_plan(initial_message, profile)
+        st.session_state.transfer_plan_key = plan_key
+    transfer_plan = st.session_state.transfer_plan
+    profile['education_plan'] = transfer_plan["education_plan"]
     
-    # UC Transfer Admission Eligibility Courses (Cursor Object)
-    class_list = general_ed.find({"course": "four"}, projection={"uc_areas":True, "school":True, "semester_units":True})
-    #print(class_list)
-    # Iterate through cursor object to grab full document text
-    for result in class_list:
-        info = (" ").join([result['uc_areas'], result['semester_units'], result['school'] ])
+    # Per stage timings of the last plan generation
+    with st.expander("Plan timings"):
+        st.write(f"Critical path: {' -> '.join(transfer_plan['critical_path'])}")
+        st.table(pd.DataFrame(transfer_plan["timings"]).T.round(2))
     
-    # articulation agreement
-    agreement=get_articulation_agreement(current_school, transfer_school, major)
-    
-    # major education plan generation
-    a = transferAgent2(initial_message, profile, agreement)
     # education plan extraction
+    a = transfer_plan["major_plan"]
     cc = (a.education_plan)
-    cd = (a.completed_courses)
+    cd = (transfer_plan["completed_courses"])
     degree_units = 0
-    st.write("COMPLETED COURSES")
-    for thing in cd:
-        text=(f"Courses: {thing.sending_Institution_course} {thing.sending_Institution_course_title} Units:{thing.units} articulated by {thing.receiving_Institution_course}")
-        st.write(text)
-        plan.append(text)
-        degree_units += thing.units
-        
-        # New row as a DataFrame
-        new_row = pd.DataFrame({'completed': [thing.units], 'planned': [0],'Courses': [thing.sending_Institution_course], })
-
-        # Concatenate the new row
-        data = pd.concat([data, new_row], ignore_index=True)
-        
-        
-        st.bar_chart(data, 
-             y=['completed', 'planned'], y_label="Units",
-             x="Courses", 
-             color=['#0066b9','#ffb500',])
-    
-
-
-    #plan.append(profile['completed_courses'])
-    # unit check
-    #total=0
-    # header
-    st.write("MAJOR PLAN")
-    # loop through items in education plan
-    for thing in cc:
-        text=(f"Course: {thing.sending_Institution_course} {thing.sending_Institution_course_title} Units:{thing.units} articulated by {thing.receiving_Institution_course}")
-        st.write(text)
-        plan.append(text)
-        degree_units += thing.units
-        
-        # New row as a DataFrame
-        new_row = pd.DataFrame({'completed': [0], 'planned': [thing.units],'Courses': [thing.sending_Institution_course], })
-
-        # Concatenate the new row
-        data = pd.concat([data, new_row], ignore_index=True)
-        
-        st.bar_chart(data, 
-            y=['completed', 'planned'],  y_label="Units",
-            x="Courses", 
-            color=['#0066b9','#ffb500',])
-
-    # unit check
-    st.write (f"Unit check: {a.total_units}")
-    st.write (f"Unit check: {degree_units}")
-    
-    profile['education_plan']=plan
-    
-    # schedule check
-    check = transferAgentCheck("Please help me fix my schedule", profile,agreement, plan)
-    # print to manually check
-    st.write (f"SCHEDULE CRITQUE: {check}")
-    # provide student schedule to student profile as context
-    profile['education_plan']=plan
-    # re generate education plan based on schedule check
-    a = transferAgent2(check, profile, agreement)
-    # re declare education plan
-    cc = (a.education_plan)
-    #print(cc)
-    # reset total unit check
-    degree_units=0
-    profile['education_plan']=[]
-    plan.clear()
-    
-    data = pd.DataFrame(columns=data.columns)
 
     st.write("COMPLETED COURSES")
+    # chart placeholder, filled once the section's rows are collected
+    chart = st.empty()
     for thing in cd:
-        text=(f"Completed Courses: {thing.sending_Institution_course} {thing.sending_Institution_course_title} Units:{thing.units} articulated by {thing.receiving_Institution_course}")
+        text=describe_course(thing, "Completed Course")
         st.write(text)
         plan.append(text)
         degree_units += thing.units
-        
-        # New row as a DataFrame
-        new_row = pd.DataFrame({'completed': [thing.units], 'planned': [0],'Courses': [thing.sending_Institution_course], })
-
-        # Concatenate the new row
-        data = pd.concat([data, new_row], ignore_index=True)
-        
-        st.bar_chart(data, 
-            y=['completed', 'planned'],  y_label="Units",
-            x="Courses", 
-            color=['#0066b9','#ffb500',])
-        
+        data.add_completed(thing.sending_Institution_course, thing.units)
+    data.render(chart)
 
 
     # header
-    st.write("UPDATED MAJOR PLAN")
+    st.write("MAJOR PLAN")
+    chart = st.empty()
     # loop through items in education plan
     for thing in cc:
-        text= (f"Course: {thing.sending_Institution_course} {thing.sending_Institution_course_title} Units: {thing.units}; articulated by {thing.receiving_Institution_course}")
+        text=describe_course(thing)
         st.write(text)
         plan.append(text)
         degree_units += thing.units
-        
-        # New row as a DataFrame
-        new_row = pd.DataFrame({'completed': [0], 'planned': [thing.units],'Courses': [thing.sending_Institution_course], })
-
-        # Concatenate the new row
-        data = pd.concat([data, new_row], ignore_index=True)
-        
-        st.bar_chart(data, 
-            y=['completed', 'planned'],  y_label="Units",
-            x="Courses", 
-            color=['#0066b9','#ffb500',])
+        data.add_planned(thing.sending_Institution_course, thing.units)
+    data.render(chart)
         
         
     #total unit check
-    st.write(f"UPDATED Unit check: {a.total_units}")
-    st.write(f"UPDATED Unit check: {degree_units}")
-
-
-    # manually check new education plan
-    profile['education_plan']=plan
-
-
-
+    st.write(f"Unit check: {a.total_units}")
+    st.write(f"Unit check: {degree_units}")
+    
+    # schedule check, done by the local articulation rules
+    for thing in a.removed:
+        st.write(f"REMOVED: {describe_course(thing)}")
+    for group in transfer_plan["missing_required"]:
+        st.write(f"MISSING REQUIRED: {' & '.join(group)}")
 
 
-    # general ed planner
-    b=general_ed_planner2("", profile, info,plan)
+    # general ed plan
+    b=transfer_plan["gen_ed_plan"]
     dd = (b.gen_ed_plan)
+    # major plan courses that also fill a general education slot
+    major_codes = {normalize_code(course.sending_Institution_course) for course in cc}
     # header
     st.write("GENERAL EDUCATION PLAN")
+    chart = st.empty()
     for thing in dd:
         text = (f"Course: {thing.course} {thing.course_title} Units: {thing.units}; UC Area: {thing.uc_area}")
+        # double counted courses are already charted and counted with the major plan
+        if normalize_code(thing.course) in major_codes:
+            text += " (double counted with major plan)"
+            st.write(text)
+            plan.append(text)
+            continue
         st.write(text)
         plan.append(text)
-        
-
-            # New row as a DataFrame
-        new_row = pd.DataFrame({'completed': [0], 'planned': [thing.units],'Courses': [thing.course], })
-
-            # Concatenate the new row
-        data = pd.concat([data, new_row], ignore_index=True)
-        
         degree_units += thing.units
-        
-        st.bar_chart(data, 
-             y=['completed', 'planned'],  y_label="Units",
-             x="Courses", 
-             color=['#0066b9','#ffb500',])
+        data.add_planned(thing.course, thing.units)
+    data.render(chart)
         
     st.write(b.total_units)
     st.write(degree_units)
-    
-    st.bar_chart(data, 
-             y=['completed', 'planned'], 
-             x="Courses", 
-             color=['#0066b9','#ffb500',])
+    if transfer_plan["gen_ed_explanation"]:
+        st.write(transfer_plan["gen_ed_explanation"])
 
 
     profile['goals']=None
@@ -371,14 +297,13 @@ if prompt := st.chat_input("Type your message here"):
         st.session_state.turn_count += 1
 
         # Generate student response
-        # st.spinner to indicate progress 
-        with st.spinner("The student is thinking..."):
+        # streamed into the chat so the first tokens show up right away
             # uses chat input and profile for context to generate student response
                 # this is if we were to input chat as a counselor
-            response = student(prompt, profile)
+        history = st.session_state.memory.history(st.session_state.messages[:-1], "student")
+        response = display_message("user", student_stream(prompt, profile, history), "student.png")
         # Add student message to chat history
         st.session_state.messages.append({"role": "user", "content": response})
-        display_message("user", response, "student.png")
     
     else:  
         # Student's turn
@@ -389,14 +314,14 @@ if prompt := st.chat_input("Type your message here"):
         st.session_state.turn_count += 1
 
         # Generate counselor response
-        with st.spinner("The counselor is thinking..."):
             # uses chat input and profile for context to generate counselor response
                 # this is if we were to input chat as a student
-            agreement=get_articulation_agreement(current_school, transfer_school, major)
-            response = advisorStep(prompt, profile, agreement)
+        # the agreement query runs while the conversation history is summarized
+        agreement=prefetch_articulation_agreement(current_school, transfer_school, major)
+        history = st.session_state.memory.history(st.session_state.messages[:-1], "counselor")
+        response = display_message("Counselor", advisorStep_stream(prompt, profile, agreement.result(), history), "teacher.png")
         # Add Counselors message to chat history
         st.session_state.messages.append({"role": "assistant", "content": response})
-        display_message("Counselor", response, "teacher.png")
 
     # Increment the loop counter for counseler/student response as we exit loop
     st.session_state.turn_count += 1
@@ -425,7 +350,7 @@ with col1:
 
         
             with st.spinner("The counselor is thinking..."):
-                intial_response = (advisorStep(initial_message, profile,a))
+                intial_response = display_message("Counselor", advisorStep_stream(initial_message, profile,a), "teacher.png")
                 st.session_state.messages.append({"role":"user", "content": initial_message})
                 st.session_state.turn_count += 1
                 #st.session_state.messages.append({"role": "assistant", "content": a})
@@ -435,14 +360,16 @@ with col1:
         # Student turn  
         elif (st.session_state.turn_count % 2) == 0:
             with st.spinner("The student is thinking..."):
-                studentResponse = (student(st.session_state.messages[-1]["content"], profile))
+                history = st.session_state.memory.history(st.session_state.messages[:-1], "student")
+                studentResponse = display_message("user", student_stream(st.session_state.messages[-1]["content"], profile, history), "student.png")
                 st.session_state.messages.append({"role":"user", "content": studentResponse})
                 st.session_state.turn_count += 1
                 
         # Counselor turn    
         elif (st.session_state.turn_count % 2) != 0:
             with st.spinner("The counselor is thinking..."):
-                counselorResponse = (advisorStep(st.session_state.messages[-1]["content"], profile,a))
+                history = st.session_state.memory.history(st.session_state.messages[:-1], "counselor")
+                counselorResponse = display_message("Counselor", advisorStep_stream(st.session_state.messages[-1]["content"], profile, a, history), "teacher.png")
                 st.session_state.messages.append({"role":"assistant", "content": counselorResponse})
                 st.session_state.turn_count += 1
                 
@@ -497,7 +424,7 @@ if st.session_state.active_looping == True:
                 
                 # defines counselor response based on intial message as input, student profile as context
                 agreement=get_articulation_agreement(profile['current_school'], profile['transfer_school'], profile['major'])
-                counselorResponse = (advisorStep(initial_message, profile, agreement))
+                counselorResponse = display_message("Counselor", advisorStep_stream(initial_message, profile, agreement), "teacher.png")
                 
                 # Add's users message to conversation list
                 st.session_state.messages.append({"role":"user", "content": initial_message})
@@ -519,8 +446,10 @@ if st.session_state.active_looping == True:
             with st.spinner("The counselor is thinking..."):
                 
                 # defines counselor response based on previous message as input, student profile as context
-                agreement=get_articulation_agreement(profile['current_school'], profile['transfer_school'], profile['major'])
-                counselorResponse = (advisorStep(st.session_state.messages[-1]["content"], profile, agreement))
+                # the agreement query runs while the conversation history is summarized
+                agreement=prefetch_articulation_agreement(profile['current_school'], profile['transfer_school'], profile['major'])
+                history = st.session_state.memory.history(st.session_state.messages[:-1], "counselor")
+                counselorResponse = display_message("Counselor", advisorStep_stream(st.session_state.messages[-1]["content"], profile, agreement.result(), history), "teacher.png")
                 
                 # Add's counselors message to conversation list
                 st.session_state.messages.append({"role":"assistant", "content": counselorResponse})
@@ -535,7 +464,8 @@ if st.session_state.active_looping == True:
             with st.spinner("The student is thinking..."):
                 
                 # defines student response based on previous message as input, student profile as context 
-                studentResponse = (student(st.session_state.messages[-1]["content"], profile))
+                history = st.session_state.memory.history(st.session_state.messages[:-1], "student")
+                studentResponse = display_message("user", student_stream(st.session_state.messages[-1]["content"], profile, history), "student.png")
                 
                 # Add's users message to conversation list
                 st.session_state.messages.append({"role":"user", "content": studentResponse})
@@ -547,4 +477,8 @@ if st.session_state.active_looping == True:
         if st.session_state.turn_count >= st.session_state.max_turns:
             st.session_state.active_looping = False
     
-        st.rerun()    
\ No newline at end of file
+        st.rerun()    
+
+# Debug panel, per call latency, tokens, cache hits and estimated cost of the LLM and database calls
+if st.sidebar.checkbox("Show call traces"):
+    render_debug_panel()
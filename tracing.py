@@ -0,0 +1,207 @@
+'''
+TRACING
+'''
+import collections
+import contextlib
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+
+
+# Every finished span is kept in a process-wide ring buffer for the in-app debug panel
+    # TRACE_PATH additionally appends each span as one JSON line (e.g. TRACE_PATH=traces.jsonl)
+TRACE_PATH = os.getenv("TRACE_PATH")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 2000))
+
+# USD per 1M tokens (input, cached input, output), used to estimate what each call costs
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-2024-08-06": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+_spans = collections.deque(maxlen=TRACE_BUFFER_SIZE)
+_lock = threading.Lock()
+_ids = itertools.count(1)
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    """
+    Args:
+        cached_tokens (int): Prompt tokens served from the provider's prompt cache, billed at the cached rate.
+
+    Returns:
+        float | None: Estimated USD for one call, None for models without a known price.
+    """
+    prices = MODEL_PRICES.get(model)
+    if prices is None or prompt_tokens is None:
+        return None
+    cached = min(cached_tokens or 0, prompt_tokens)
+    return ((prompt_tokens - cached) * prices[0] + cached * prices[1] + (completion_tokens or 0) * prices[2]) / 1_000_000
+
+
+def _write(record):
+    with _lock:
+        _spans.append(record)
+        if TRACE_PATH:
+            with open(TRACE_PATH, "a", encoding="utf-8") as sink:
+                sink.write(json.dumps(record, default=str) + "\n")
+
+
+@contextlib.contextmanager
+def span(name, kind="function", **attributes):
+    """
+    - Times a block of work and records it as a structured span.
+    - Yields the span's attribute dict so the block can add fields as it learns them
+        -(tokens from completion.usage, cache hits, result sizes).
+    - Spans opened inside another span on the same thread record it as their parent.
+
+    Args:
+        name (str): Function or operation name, e.g. "advisorStep".
+        kind (str): Span category, e.g. "llm" or "db".
+        **attributes: Initial fields (model, collection, ...).
+
+    Yields:
+        dict{str : *}: Mutable span record.
+    """
+    parent = _current.get()
+    record = {
+        "span_id": next(_ids),
+        "parent_id": parent["span_id"] if parent else None,
+        "name": name,
+        "kind": kind,
+        "start": time.time(),
+    }
+    record.update(attributes)
+    token = _current.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as error:
+        # GeneratorExit is an abandoned stream, not a failure
+        if not isinstance(error, GeneratorExit):
+            record["error"] = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        record["seconds"] = time.perf_counter() - started
+        if "model" in record and "prompt_tokens" in record:
+            record["cost_usd"] = estimate_cost(record["model"], record["prompt_tokens"], record.get("completion_tokens"),
+                                               record.get("cached_tokens"))
+        try:
+            _current.reset(token)
+        except ValueError:
+            # A generator finished in a different context than it started in
+            pass
+        _write(record)
+
+
+def record_usage(record, usage):
+    """
+    Copies token counts from an OpenAI `completion.usage` object onto a span,
+    including prompt tokens served from the provider's prefix cache.
+    """
+    if usage is None:
+        return
+    record["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+    record["completion_tokens"] = getattr(usage, "completion_tokens", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    record["cached_tokens"] = getattr(details, "cached_tokens", None) or 0
+
+
+def payload_size(value):
+    # Bytes of the JSON form, what actually crosses the network
+    return len(json.dumps(value, default=str).encode("utf-8"))
+
+
+def traced_find(collection_name, filter, function=None, **kwargs):
+    """
+    - collection.find wrapped in a "db" span, the cursor is drained inside the span
+        -so the recorded time covers every page fetched, not just the first request.
+    - The query itself runs on async_data's shared event loop, so every session and pipeline thread
+        -reads through one pooled async connection, with async_data's per-query timeout.
+    - Collections synced to the local replica (replica.py) are read from it instead, as a "replica" span,
+        -unless the filter is one the replica cannot answer.
+
+    Args:
+        collection_name (str): Collection to query.
+        filter (dict): Data API filter.
+        function (str): Calling function, recorded on the span.
+        **kwargs: Passed to find (projection, limit, timeout_ms, ...).
+
+    Returns:
+        list[dict]: Matching documents.
+    """
+    from async_data import data_loop, fetch
+    from replica import replica
+    if replica.serves(collection_name):
+        with span("find", kind="replica", collection=collection_name, function=function) as record:
+            documents = replica.find(collection_name, filter, **kwargs)
+            record["documents"] = None if documents is None else len(documents)
+        if documents is not None:
+            return documents
+    with span("find", kind="db", collection=collection_name, function=function) as record:
+        documents = data_loop.run(fetch(collection_name, filter, **kwargs))
+        record["documents"] = len(documents)
+        record["response_bytes"] = payload_size(documents)
+        return documents
+
+
+def recent_spans(limit=None, kind=None):
+    """
+    Returns:
+        list[dict]: Finished spans, oldest first, optionally only the last `limit` of a given kind.
+    """
+    with _lock:
+        spans = [record for record in _spans if kind is None or record["kind"] == kind]
+    return spans[-limit:] if limit else spans
+
+
+def clear_spans():
+    with _lock:
+        _spans.clear()
+
+
+def summarize(spans=None):
+    """
+    Aggregates spans per (kind, function) so it is clear which calls the seconds and dollars go to.
+
+    Returns:
+        list[dict]: calls, total/max seconds, cache hits, tokens and estimated cost, slowest total first.
+    """
+    rows = {}
+    for record in recent_spans() if spans is None else spans:
+        function = record.get("function") or record["name"]
+        row = rows.setdefault((record["kind"], function), {
+            "kind": record["kind"], "function": function, "calls": 0, "seconds": 0.0, "max_seconds": 0.0,
+            "cache_hits": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0, "errors": 0})
+        row["calls"] += 1
+        row["seconds"] += record.get("seconds", 0.0)
+        row["max_seconds"] = max(row["max_seconds"], record.get("seconds", 0.0))
+        row["cache_hits"] += int(bool(record.get("cache_hit")))
+        row["prompt_tokens"] += record.get("prompt_tokens") or 0
+        row["cached_tokens"] += record.get("cached_tokens") or 0
+        row["completion_tokens"] += record.get("completion_tokens") or 0
+        row["cost_usd"] += record.get("cost_usd") or 0.0
+        row["errors"] += int("error" in record)
+    return sorted(rows.values(), key=lambda row: -row["seconds"])
+
+
+def render_debug_panel(limit=50):
+    """
+    Streamlit debug panel with the per function summary and the most recent spans.
+    """
+    import streamlit as st
+    with st.expander("Debug: call traces"):
+        st.caption(f"Last {TRACE_BUFFER_SIZE} spans in this process" + (f", also written to {TRACE_PATH}" if TRACE_PATH else ""))
+        rows = summarize()
+        if not rows:
+            st.write("No calls recorded yet.")
+            return
+        st.dataframe(rows)
+        st.dataframe(recent_spans(limit)[::-1])
+        if st.button("Clear traces"):
+            clear_spans()